@@ -0,0 +1,228 @@
+"""
+Requests/second of the async JSON endpoints under concurrent clients, served
+through ASGI (uvicorn) and through WSGI (Django's threaded server), against
+the configured database:
+
+    pip install -r requirements-dev.txt                   # uvicorn
+    python manage.py generate_synthetic_data --clear      # production-like data first
+    python benchmark_asgi.py --concurrency 1 8 32 --duration 10 --output asgi.json
+
+Each server runs as one process started by this script; other servers can be
+given as commands with a {port} placeholder, e.g.
+    --wsgi-command "gunicorn purchase_tracking.wsgi -b 127.0.0.1:{port} --threads 8"
+Clients are asyncio connections (one request per connection) logged in as
+bench_admin. The status endpoint re-saves a confirmed quotation's current
+status, so it writes without changing data.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'purchase_tracking.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.utils.crypto import get_random_string
+from django.utils.http import quote_etag
+
+from tracking.caching import catalog_version
+from tracking.models import FirmSummary, ItemMaster, LocalPurchaseItem, Quotation
+
+HOST = '127.0.0.1'
+SERVERS = {
+    'asgi': f'{sys.executable} -m uvicorn purchase_tracking.asgi:application --host {HOST} --port {{port}} '
+            f'--log-level warning --no-access-log',
+    'wsgi': f'{sys.executable} manage.py runserver {HOST}:{{port}} --noreload --skip-checks',
+}
+
+
+def bench_admin():
+    user, _ = User.objects.get_or_create(username='bench_admin')
+    user.profile.role = 'ADMIN'
+    user.profile.save()
+    return user
+
+
+def scenarios():
+    """{name: (method, path, headers, body, expected status)} built from the data."""
+    summary = FirmSummary.objects.order_by('-open_lines').first()
+    firm = summary.firm if summary else ItemMaster.objects.values_list('item_firm', flat=True).first()
+    brand = (LocalPurchaseItem.objects.live().values('brand').annotate(rows=Count('id')).order_by('-rows')
+             .values_list('brand', flat=True).first())
+    quotation = Quotation.objects.filter(status='CONFIRMED').first()
+    found = {}
+    if firm:
+        items = '/api/items-by-firm/?' + urlencode({'firm': firm})
+        found['items_by_firm'] = ('GET', items, {}, None, 200)
+        found['items_by_firm_304'] = ('GET', items, {'If-None-Match': quote_etag(catalog_version(firm))}, None, 304)
+    if brand:
+        rows = '/local-purchase/list/?' + urlencode({'brand': brand, 'filter': 'required', 'sort': 'value',
+                                                     'direction': 'desc'})
+        found['local_purchase_rows'] = ('GET', rows, {'X-Requested-With': 'XMLHttpRequest'}, None, 200)
+    if quotation:
+        found['quotation_status'] = ('POST', f'/quotation/{quotation.pk}/update-status/',
+                                     {'Content-Type': 'application/json'},
+                                     json.dumps({'status': quotation.status}), 200)
+    return found
+
+
+def raw_request(method, path, headers, body, cookies):
+    body = (body or '').encode()
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {HOST}', 'Connection: close', f'Cookie: {cookies["header"]}',
+             f'X-CSRFToken: {cookies["csrf"]}', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+async def fetch(port, request):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def load(port, request, expected, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, request)
+            except (OSError, IndexError, ValueError):
+                status = None
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != expected:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port, timeout=30):
+    env = {**os.environ, 'ALLOWED_HOSTS': ','.join([*settings.ALLOWED_HOSTS, HOST])}
+    process = subprocess.Popen(shlex.split(command.format(port=port)), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited: {command}")
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"server did not start: {command}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=sorted(SERVERS))
+    parser.add_argument('--asgi-command', default=SERVERS['asgi'])
+    parser.add_argument('--wsgi-command', default=SERVERS['wsgi'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=5, help="Seconds per endpoint and concurrency level")
+    parser.add_argument('--endpoints', nargs='+', help="Subset of the scenario names")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    client = Client()
+    client.force_login(bench_admin())
+    csrf = get_random_string(32)
+    cookies = {
+        'csrf': csrf,
+        'header': f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+                  f'{settings.CSRF_COOKIE_NAME}={csrf}',
+    }
+    found = scenarios()
+    if args.endpoints:
+        found = {name: found[name] for name in args.endpoints}
+    commands = {'asgi': args.asgi_command, 'wsgi': args.wsgi_command}
+
+    results = []
+    for server in args.servers:
+        port = free_port()
+        process = start_server(commands[server], port)
+        try:
+            for name, (method, path, headers, body, expected) in found.items():
+                request = raw_request(method, path, headers, body, cookies)
+                asyncio.run(load(port, request, expected, 2, 1))  # warm up
+                for concurrency in args.concurrency:
+                    latencies, errors, elapsed = asyncio.run(load(port, request, expected, concurrency, args.duration))
+                    result = {
+                        'server': server, 'endpoint': name, 'concurrency': concurrency,
+                        'requests': len(latencies), 'errors': errors,
+                        'rps': round(len(latencies) / elapsed, 1),
+                        'p50_ms': round(percentile(latencies, 0.5), 2),
+                        'p95_ms': round(percentile(latencies, 0.95), 2),
+                    }
+                    results.append(result)
+                    print(f"{server:5} {name:20} c={concurrency:<4} {result['rps']:8.1f} req/s  "
+                          f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  errors {errors}",
+                          file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'duration': args.duration,
+            'commands': {server: commands[server] for server in args.servers},
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
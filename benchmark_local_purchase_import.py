@@ -0,0 +1,103 @@
+"""
+Per-sheet throughput of the Local Purchase column coercion: the old per-row
+get_val() loop vs. the vectorized LOCAL_PURCHASE_COLUMNS layer.
+
+    python benchmark_local_purchase_import.py                 # synthetic 5 x 20k-row sheets
+    python benchmark_local_purchase_import.py --rows 50000
+    python benchmark_local_purchase_import.py --file analysis.xlsx
+
+Only parsing/coercion into unsaved model instances is timed (no DB writes).
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'purchase_tracking.settings')
+django.setup()
+
+import numpy as np
+import pandas as pd
+
+from tracking.importers import LOCAL_PURCHASE_COLUMNS, normalize_headers, local_purchase_columns, build_local_purchase_items
+from tracking.models import LocalPurchaseItem
+
+SHEETS = ['HEPWORTH', 'RAKTherm', 'VERA-PUMP', 'PEGLER', 'OTHERS']
+
+
+def legacy_build(sheet_name, df):
+    """The row-by-row implementation local_purchase_upload used before the column spec."""
+    items = []
+    for _, row in df.iterrows():
+        def get_val(col, default=0, type_func=int):
+            val = row.get(col)
+            if pd.isna(val) or val == '':
+                return default
+            try:
+                if isinstance(val, str) and not val.replace('.', '', 1).isdigit():
+                    return default
+                return type_func(val)
+            except:
+                return default
+
+        kwargs = {}
+        for header, field, kind in LOCAL_PURCHASE_COLUMNS[3:]:
+            kwargs[field] = get_val(header) if kind == 'int' else get_val(header, 0.0, float)
+        items.append(LocalPurchaseItem(
+            brand=sheet_name,
+            item_code=str(row.get('CODE', '')).strip(),
+            upc_code=str(row.get('UPC CODE', '')) if not pd.isna(row.get('UPC CODE')) else '',
+            description=str(row.get('DESCRIPTION', '')) if not pd.isna(row.get('DESCRIPTION')) else '',
+            **kwargs
+        ))
+    return items
+
+
+def synthetic_sheet(rows, seed):
+    """A sheet shaped like the analysis workbook, with blanks and ' - ' filler cells mixed in."""
+    rng = np.random.default_rng(seed)
+    data = {
+        'CODE': [f'LP{seed}-{i:06d}' for i in range(rows)],
+        'UPC CODE': np.where(rng.random(rows) < 0.2, None, rng.integers(10**11, 10**12, rows).astype(str)),
+        'DESCRIPTION': [f'Item {i} description' for i in range(rows)],
+    }
+    for header, _, kind in LOCAL_PURCHASE_COLUMNS[3:]:
+        values = rng.integers(-50, 5000, rows).astype(object) if kind == 'int' else rng.random(rows) * 1000
+        values = pd.Series(values, dtype=object)
+        values[rng.random(rows) < 0.05] = ' - '
+        values[rng.random(rows) < 0.05] = None
+        data[header] = values
+    return pd.DataFrame(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help="Rows per synthetic sheet")
+    parser.add_argument('--file', help="Benchmark a real workbook instead of synthetic sheets")
+    args = parser.parse_args()
+
+    if args.file:
+        with pd.ExcelFile(args.file) as xls:
+            sheets = {name: normalize_headers(pd.read_excel(xls, sheet_name=name))
+                      for name in xls.sheet_names if name.upper() in [s.upper() for s in SHEETS]}
+    else:
+        sheets = {name: synthetic_sheet(args.rows, seed) for seed, name in enumerate(SHEETS)}
+
+    print(f"{'sheet':<12}{'rows':>8}{'before rows/s':>16}{'after rows/s':>16}{'speedup':>10}")
+    for name, df in sheets.items():
+        start = time.perf_counter()
+        before = legacy_build(name, df)
+        before_secs = time.perf_counter() - start
+
+        start = time.perf_counter()
+        after = build_local_purchase_items(name, local_purchase_columns(df))
+        after_secs = time.perf_counter() - start
+
+        assert len(before) == len(after)
+        rows = len(df)
+        print(f"{name:<12}{rows:>8}{rows / before_secs:>16,.0f}{rows / after_secs:>16,.0f}{before_secs / after_secs:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
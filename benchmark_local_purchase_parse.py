@@ -0,0 +1,71 @@
+"""
+Wall time of parsing a five-sheet Local Purchase workbook with 1..N worker
+processes (parse_local_purchase_sheets), to show how the upload scales with
+cores:
+
+    python benchmark_local_purchase_parse.py                    # synthetic 5 x 20k-row sheets
+    python benchmark_local_purchase_parse.py --rows 50000 --workers 1 2 5
+    python benchmark_local_purchase_parse.py --file analysis.xlsx
+
+Only parsing is timed (openpyxl + column coercion, results back in the main
+process); the DB writes stay serial and are not part of it. Each worker count
+is run --repeat times and the best time is kept.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmark_local_purchase_import import SHEETS, synthetic_sheet
+from tracking.importers import LOCAL_PURCHASE_SHEETS, parse_local_purchase_sheets
+
+
+def write_workbook(path, rows):
+    with pd.ExcelWriter(path) as writer:
+        for seed, name in enumerate(SHEETS):
+            synthetic_sheet(rows, seed).to_excel(writer, sheet_name=name, index=False)
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help="Rows per synthetic sheet")
+    parser.add_argument('--file', help="Benchmark a real workbook instead of the synthetic one")
+    parser.add_argument('--workers', nargs='+', type=int, default=sorted({1, 2, 3, 5, min(cpus, 5)}))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = args.file
+    if not path:
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            path = f.name
+        start = time.perf_counter()
+        write_workbook(path, args.rows)
+        print(f"Wrote {len(SHEETS)} x {args.rows} rows in {time.perf_counter() - start:.1f}s")
+    try:
+        with pd.ExcelFile(path) as xls:
+            allowed = {name.upper() for name in LOCAL_PURCHASE_SHEETS}
+            names = [name for name in xls.sheet_names if name.upper() in allowed]
+
+        print(f"{len(names)} sheets, {cpus} CPUs")
+        print(f"{'workers':>8}{'seconds':>10}{'speedup':>10}")
+        baseline = None
+        for workers in args.workers:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = sum(len(columns['item_code']) for _, columns in parse_local_purchase_sheets(path, names, workers)
+                           if columns is not None)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            baseline = baseline or best
+            print(f"{workers:>8}{best:>10.2f}{baseline / best:>9.2f}x   ({rows} rows)")
+    finally:
+        if not args.file:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Latency and query counts of every page in tracking/urls.py, through the test
+client, as an admin and as a salesman. Results are JSON so two commits can be
+compared:
+
+    python manage.py generate_synthetic_data --clear      # production-like data first
+    python benchmark_views.py --output before.json
+    ... change code ...
+    python benchmark_views.py --output after.json --compare before.json
+
+URL parameters are filled from the database (the largest confirmed quotation,
+a busy firm, a container in transit, ...). Views that change state on GET or
+only accept POST are skipped. Creates the bench_admin / bench_sales users.
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'purchase_tracking.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from tracking import urls as tracking_urls
+from tracking.models import (BackgroundJob, FirmSummary, ItemMaster, LocalPurchaseItem, Manufacturer, Quotation,
+                             QuotationItem, Release)
+
+# State-changing on GET, or POST-only
+SKIP = {'logout', 'run_stock_import', 'receive_container', 'reschedule_container'}
+ROLES = {'admin': 'ADMIN', 'salesman': 'SALESMAN'}
+
+
+def bench_user(role):
+    user, _ = User.objects.get_or_create(username=f'bench_{role}')
+    user.profile.role = ROLES[role]
+    user.profile.save()
+    return user
+
+
+def sample_parameters():
+    """Path kwargs and query strings taken from the data, chosen to be the heavy cases."""
+    quotation = (Quotation.objects.filter(status='CONFIRMED').annotate(lines=Count('items'))
+                 .order_by('-lines').first() or Quotation.objects.first())
+    line = QuotationItem.objects.filter(releases__is_received=False).first() or QuotationItem.objects.first()
+    release = Release.objects.filter(is_received=False).first()
+    summary = FirmSummary.objects.order_by('-open_lines').first()
+    firm = summary.firm if summary else ItemMaster.objects.values_list('item_firm', flat=True).first()
+    brand = LocalPurchaseItem.objects.live().values_list('brand', flat=True).first()
+    container = release.container_info if release else None
+
+    pks = {
+        'quotation': quotation and quotation.pk,
+        'line': line and line.pk,
+        'release': release and release.pk,
+        'manufacturer': Manufacturer.objects.values_list('pk', flat=True).first(),
+        'job': BackgroundJob.objects.values_list('pk', flat=True).first(),
+    }
+    path_kwargs = {
+        'update_quotation_status': pks['quotation'], 'quotation_detail': pks['quotation'],
+        'edit_quotation': pks['quotation'], 'delete_quotation': pks['quotation'],
+        'release_quotation': pks['quotation'], 'release_item': pks['line'], 'receive_item': pks['line'],
+        'receive_release': pks['release'], 'manufacturer_edit': pks['manufacturer'],
+        'manufacturer_delete': pks['manufacturer'], 'job_status': pks['job'],
+    }
+    queries = {
+        'sales_firm_track': [{'firm': firm}],
+        'sales_firm_export': [{'firm': firm}],
+        'get_items_by_firm': [{'firm': firm}],
+        'item_typeahead': [{'firm': firm, 'q': 'valve'}],
+        'local_purchase_list': [{'brand': brand}, {'brand': brand, 'search': 'valve'}],
+        'local_purchase_export': [{'brand': brand, 'format': 'xlsx'}, {'brand': brand, 'format': 'csv'}],
+        'container_list': [{}, {'container': container}],
+        'quotation_list': [{}, {'search': quotation.reference_number if quotation else 'Q'}],
+    }
+    return path_kwargs, queries
+
+
+def targets():
+    """(name, url) for every benchmarkable GET."""
+    path_kwargs, queries = sample_parameters()
+    found = []
+    for pattern in tracking_urls.urlpatterns:
+        name = pattern.name
+        if name in SKIP:
+            continue
+        if pattern.pattern.converters:
+            if path_kwargs.get(name) is None:
+                print(f"skipping {name}: no sample row", file=sys.stderr)
+                continue
+            path = reverse(name, kwargs={'pk': path_kwargs[name]})
+        else:
+            path = reverse(name)
+        for params in queries.get(name, [{}]):
+            if any(value is None for value in params.values()):
+                print(f"skipping {name} {params}: no sample row", file=sys.stderr)
+                continue
+            found.append((name, path, params))
+    return found
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(client, path, params, warmup, repeat):
+    for _ in range(warmup):
+        client.get(path, params)
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path, params)
+            # Streamed bodies are produced while iterating: include them in the time
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'status': response.status_code,
+        'bytes': len(body),
+        'queries': len(queries),
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, slower=1.2):
+    """Print the pages that got slower (p50 beyond `slower` x) or run more queries than the baseline."""
+    before = {(r['role'], r['name'], json.dumps(r['params'], sort_keys=True)): r for r in baseline['results']}
+    regressions = 0
+    for result in results:
+        old = before.get((result['role'], result['name'], json.dumps(result['params'], sort_keys=True)))
+        if old is None:
+            continue
+        flags = []
+        if result['queries'] > old['queries']:
+            flags.append(f"queries {old['queries']} -> {result['queries']}")
+        if old['p50_ms'] and result['p50_ms'] > old['p50_ms'] * slower:
+            flags.append(f"p50 {old['p50_ms']} -> {result['p50_ms']} ms")
+        if flags:
+            regressions += 1
+            print(f"REGRESSION {result['role']:8} {result['url']}: {', '.join(flags)}")
+    print(f"{regressions} regressions against {baseline['meta'].get('commit')}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--roles', nargs='+', choices=sorted(ROLES), default=sorted(ROLES))
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="Baseline JSON report; exit 1 if any page regressed")
+    args = parser.parse_args()
+
+    # The test client sends Host: testserver
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+    pages = targets()
+    results = []
+    for role in args.roles:
+        client = Client()
+        client.force_login(bench_user(role))
+        for name, path, params in pages:
+            result = measure(client, path, params, args.warmup, args.repeat)
+            url = path + ('?' + '&'.join(f'{k}={v}' for k, v in params.items()) if params else '')
+            results.append({'role': role, 'name': name, 'url': url, 'params': params, **result})
+            print(f"{role:8} {result['status']} {result['p50_ms']:9.2f} ms {result['queries']:4} q  {url}",
+                  file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'repeat': args.repeat,
+            'rows': {
+                'items': ItemMaster.objects.count(),
+                'quotations': Quotation.objects.count(),
+                'lines': QuotationItem.objects.count(),
+                'releases': Release.objects.count(),
+                'local_purchase': LocalPurchaseItem.objects.live().count(),
+            },
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f)):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tracking.profiling.ProfilingMiddleware',  # inactive unless PROFILING_ENABLED
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +88,24 @@ DATABASES = {
     'default': env.db()
 }
 
+# Cache shared by every web worker and the job runner (tracking.caching keeps
+# versioned keys in it). The default is a database table, created by migration
+# 0019 (or `python manage.py createcachetable`). Other CACHE_URL values:
+#   filecache:///var/tmp/purchase_tracking_cache  - all workers on one host
+#   redis://host:6379/1                           - networked cache
+#   locmemcache://                                - per process, single-worker dev only
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://tracking_cache'),
+}
+# The database, file and local-memory backends cull a third of their entries
+# once they hold MAX_ENTRIES (300 unless set), the database one the
+# alphabetically first third, which takes the never-expiring catalog version
+# keys with it. A day of catalog pages, typeahead results and search counts is
+# far more than 300 keys, so size them for that (or set ?max_entries= in CACHE_URL).
+if CACHES['default']['BACKEND'].rsplit('.', 2)[1] in {'db', 'filebased', 'locmem'}:
+    CACHES['default'].setdefault('OPTIONS', {}).setdefault(
+        'MAX_ENTRIES', env.int('CACHE_MAX_ENTRIES', default=50000))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 
@@ -138,3 +157,39 @@ MEDIA_ROOT = BASE_DIR / 'media'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Background jobs (stock sync, imports) are executed by `python manage.py run_jobs`.
+# Set to True to run them inside the request instead (local dev without a worker).
+BACKGROUND_JOBS_INLINE = env.bool('BACKGROUND_JOBS_INLINE', default=False)
+# A running job's worker refreshes its heartbeat every HEARTBEAT seconds; a job whose
+# heartbeat is older than STALE seconds (worker killed, out of memory) is marked FAILED.
+BACKGROUND_JOB_HEARTBEAT_SECONDS = env.float('BACKGROUND_JOB_HEARTBEAT_SECONDS', default=30.0)
+BACKGROUND_JOB_STALE_SECONDS = env.float('BACKGROUND_JOB_STALE_SECONDS', default=300.0)
+
+# Stock feed used by `import_stock_api` (timeouts in seconds)
+STOCK_API_URL = env('STOCK_API_URL', default='https://stock.junaidworld.com/api/stock')
+STOCK_API_CONNECT_TIMEOUT = env.float('STOCK_API_CONNECT_TIMEOUT', default=5.0)
+STOCK_API_READ_TIMEOUT = env.float('STOCK_API_READ_TIMEOUT', default=60.0)
+
+# Processes parsing the sheets of a Local Purchase workbook upload in parallel
+# (default 1: parses in the importing process; see benchmark_local_purchase_parse.py
+# before raising it)
+LOCAL_PURCHASE_PARSE_WORKERS = env.int('LOCAL_PURCHASE_PARSE_WORKERS', default=1)
+
+# Per-request profiling (tracking.profiling): Server-Timing headers and a log line per
+# sampled request. Budgets are "view_name=max_queries,..."; over-budget views log a warning.
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', default=False)
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=1.0)
+PROFILING_QUERY_BUDGETS = env.dict('PROFILING_QUERY_BUDGETS', cast={'value': int}, default={})
+PROFILING_DEFAULT_QUERY_BUDGET = env.int('PROFILING_DEFAULT_QUERY_BUDGET', default=None)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'tracking.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import ItemMaster, Quotation, QuotationItem, Shipment, Supplier, Manufacturer, UserProfile, Release
+from .models import ItemMaster, Quotation, QuotationItem, Shipment, Supplier, Manufacturer, UserProfile, Release, BackgroundJob
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
@@ -45,3 +45,9 @@ class ReleaseAdmin(admin.ModelAdmin):
 class ManufacturerAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'message', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('output',)
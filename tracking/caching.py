@@ -0,0 +1,172 @@
+"""
+Versioned cache keys, shared by every worker through the CACHES backend.
+
+Data is cached under keys that embed the current version of one or more
+namespaces ('catalog', 'catalog:<firm>', 'lp:<brand>'). Writers
+never delete entries: they replace the namespace version with a fresh random
+token - a single cache write, atomic on every backend and immediately seen by
+all processes - and readers stop finding the old entries, which expire.
+A version lost to eviction is simply regenerated, never reused.
+
+The a-prefixed functions are the async views' twins of the sync ones; they
+read and write the same keys through the async cache API.
+"""
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import ItemMaster
+
+CATALOG = 'catalog'
+CATALOG_TIMEOUT = 24 * 60 * 60
+LOCAL_PURCHASE_COUNT_TIMEOUT = 600
+
+
+def _token(name):
+    """Key-safe form of a firm/brand name (they contain spaces/punctuation)."""
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+def _version_key(namespace):
+    return f"{namespace}:version"
+
+
+def namespace_versions(*namespaces):
+    """Current version tokens of the namespaces, fetched in one round trip."""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # add() keeps a version another process set in the meantime
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+async def anamespace_versions(*namespaces):
+    """Async namespace_versions(), for the async views."""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, uuid.uuid4().hex, None)
+            found[key] = await cache.aget(key)
+    return [found[key] for key in keys]
+
+
+def versioned_key(name, *namespaces):
+    """`name` qualified by the current version of every namespace it depends on."""
+    return ':'.join([name, *namespace_versions(*namespaces)])
+
+
+async def aversioned_key(name, *namespaces):
+    return ':'.join([name, *await anamespace_versions(*namespaces)])
+
+
+def bump_namespaces(namespaces):
+    """Give the namespaces fresh versions once the current transaction commits."""
+    updates = {_version_key(namespace): uuid.uuid4().hex for namespace in set(namespaces)}
+    if updates:
+        transaction.on_commit(lambda: cache.set_many(updates, None))
+
+
+def _firm_namespace(firm):
+    return f"{CATALOG}:{_token(firm)}"
+
+
+def catalog_version(firm=None):
+    """Version of one firm's item list, or of the whole catalog (firm list) when `firm` is None."""
+    return namespace_versions(_firm_namespace(firm) if firm is not None else CATALOG)[0]
+
+
+async def acatalog_version(firm=None):
+    return (await anamespace_versions(_firm_namespace(firm) if firm is not None else CATALOG))[0]
+
+
+def firm_catalog_key(firm):
+    """Cache key of the serialized item list of a firm at its current version."""
+    return versioned_key(f"catalog:items:{_token(firm)}", _firm_namespace(firm))
+
+
+async def afirm_catalog_key(firm):
+    return await aversioned_key(f"catalog:items:{_token(firm)}", _firm_namespace(firm))
+
+
+def _firm_items(firm):
+    return ItemMaster.objects.filter(item_firm=firm).values(
+        'id', 'item_code', 'item_description', 'item_upvc').order_by('item_code')
+
+
+def firm_items_json(firm):
+    """The `{"items": [...]}` body of get_items_by_firm, serialized once per firm version."""
+    key = firm_catalog_key(firm)
+    body = cache.get(key)
+    if body is None:
+        body = json.dumps({'items': list(_firm_items(firm))}, cls=DjangoJSONEncoder)
+        cache.set(key, body, CATALOG_TIMEOUT)
+    return body
+
+
+async def afirm_items_json(firm):
+    """Async firm_items_json(): same key, same body."""
+    key = await afirm_catalog_key(firm)
+    body = await cache.aget(key)
+    if body is None:
+        body = json.dumps({'items': [item async for item in _firm_items(firm)]}, cls=DjangoJSONEncoder)
+        await cache.aset(key, body, CATALOG_TIMEOUT)
+    return body
+
+
+def firm_names():
+    """Distinct non-empty ItemMaster firms, cached per catalog version."""
+    def load():
+        firms = ItemMaster.objects.values_list('item_firm', flat=True).distinct().order_by('item_firm')
+        return [firm for firm in firms if firm]
+    return cache.get_or_set(versioned_key('catalog:firms', CATALOG), load, CATALOG_TIMEOUT)
+
+
+def invalidate_firms(firms):
+    """Bump the catalog versions of the given firms and of the firm list (on commit)."""
+    firms = set(firms)
+    if firms:
+        bump_namespaces([_firm_namespace(firm) for firm in firms] + [CATALOG])
+
+
+def _brand_namespace(brand):
+    return f"lp:{_token(brand)}"
+
+
+def bump_local_purchase_version(brand):
+    """Invalidate every cached count of a brand after its rows were replaced (on commit)."""
+    bump_namespaces([_brand_namespace(brand)])
+
+
+def cached_local_purchase_count(queryset, brand, *params):
+    """
+    COUNT(*) of a filtered Local Purchase queryset, cached per brand and filter
+    `params` so paging through the table does not recount on every request.
+    """
+    key = versioned_key(_local_purchase_count_name(brand, params), _brand_namespace(brand))
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, LOCAL_PURCHASE_COUNT_TIMEOUT)
+    return count
+
+
+async def acached_local_purchase_count(queryset, brand, *params):
+    """Async cached_local_purchase_count(), sharing its cache entries."""
+    key = await aversioned_key(_local_purchase_count_name(brand, params), _brand_namespace(brand))
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, LOCAL_PURCHASE_COUNT_TIMEOUT)
+    return count
+
+
+def _local_purchase_count_name(brand, params):
+    return f"lp:count:{_token(chr(31).join([brand, *map(str, params)]))}"
@@ -0,0 +1,117 @@
+"""
+Container-level release movements: receive everything that arrived in one
+container, release several lines of a quotation at once, and reschedule a
+container's expected arrival.
+
+Each call is one transaction of set-based statements (bulk inserts and single
+UPDATEs), so a container of 80 lines costs a handful of queries. Bulk writes
+bypass the Release/Shipment signals: these functions bring the stored line
+totals, the firm summaries and the dashboard counters up to date themselves,
+once per call.
+"""
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from . import metrics
+from .models import FirmSummary, ItemMaster, QuotationItem, Release, Shipment
+
+
+def _refresh_firms(line_ids):
+    FirmSummary.objects.refresh(
+        ItemMaster.objects.filter(quotationitem__pk__in=line_ids).values_list('item_firm', flat=True).distinct()
+    )
+
+
+def _lines_changed(line_ids, releases, sign):
+    """`releases` moved in (sign 1) or out (-1) of transit: (quantity, rate, expected_arrival_date) each."""
+    QuotationItem.objects.filter(pk__in=line_ids).recalculate_totals()
+    _refresh_firms(line_ids)
+    metrics.add_releases(*(sign * total for total in metrics.in_transit(releases)))
+
+
+def open_containers():
+    """Containers with unreceived releases: line count, quantity and earliest expected arrival."""
+    return (Release.objects.filter(is_received=False).exclude(container_info='')
+            .values('container_info')
+            .annotate(releases=Count('pk'), quantity=Sum('quantity_released'), expected=Min('expected_arrival_date'))
+            .order_by('expected', 'container_info'))
+
+
+def container_releases(container_info):
+    """The unreceived releases of one container, with their line, item and quotation."""
+    return (Release.objects.filter(container_info=container_info, is_received=False)
+            .select_related('quotation_item__item', 'quotation_item__quotation')
+            .order_by('quotation_item__quotation__reference_number', 'quotation_item__item__item_code', 'pk'))
+
+
+def receive_container(container_info, received_date, release_ids=None):
+    """
+    Mark the container's unreceived releases (or only `release_ids` among
+    them) received and log one Shipment per release. Returns the number received.
+    """
+    with transaction.atomic():
+        releases = Release.objects.select_for_update().filter(container_info=container_info, is_received=False)
+        if release_ids is not None:
+            releases = releases.filter(pk__in=release_ids)
+        rows = list(releases.values_list('pk', 'quotation_item_id', 'quantity_released',
+                                         'quotation_item__rate', 'expected_arrival_date'))
+        if not rows:
+            return 0
+
+        Release.objects.filter(pk__in=[pk for pk, *_ in rows]).update(is_received=True)
+        Shipment.objects.bulk_create([
+            Shipment(quotation_item_id=line_id, quantity_received=quantity, received_date=received_date,
+                     remarks=f"Auto-received from Release {container_info}")
+            for _, line_id, quantity, *_ in rows
+        ])
+        _lines_changed({line_id for _, line_id, *_ in rows}, [row[2:] for row in rows], -1)
+    return len(rows)
+
+
+def create_releases(quantities, release_date, expected_arrival_date=None, container_info=''):
+    """
+    Release `{QuotationItem pk: quantity}` together, as one shipment. Returns
+    the Releases created. Raises ValueError, releasing nothing, if a quantity
+    exceeds what is left to release on its line.
+    """
+    releases = [
+        Release(quotation_item_id=line_id, quantity_released=quantity, release_date=release_date,
+                expected_arrival_date=expected_arrival_date, container_info=container_info)
+        for line_id, quantity in quantities.items() if quantity
+    ]
+    if not releases:
+        return []
+    with transaction.atomic():
+        # The form checked the balances before this transaction: lock the lines, so
+        # concurrent releases of the same line serialize, and check them again
+        lines = {
+            pk: (item_code, rate, ordered - in_transit - received)
+            for pk, item_code, rate, ordered, in_transit, received in QuotationItem.objects
+            .select_for_update(of=('self',)).filter(pk__in=[release.quotation_item_id for release in releases])
+            .values_list('pk', 'item__item_code', 'rate', 'quantity_ordered', 'quantity_in_transit', 'quantity_received')
+        }
+        for release in releases:
+            item_code, _, balance = lines[release.quotation_item_id]
+            if release.quantity_released > balance:
+                raise ValueError(f"Only {balance} of {item_code} is left to release.")
+        releases = Release.objects.bulk_create(releases)
+        _lines_changed(set(lines), [(release.quantity_released, lines[release.quotation_item_id][1],
+                                     expected_arrival_date) for release in releases], 1)
+    return releases
+
+
+def reschedule_container(container_info, expected_arrival_date):
+    """Move the expected arrival of every unreceived release in the container. Returns the number moved."""
+    releases = Release.objects.filter(container_info=container_info, is_received=False)
+    with transaction.atomic():
+        rows = list(releases.values_list('quotation_item_id', 'expected_arrival_date'))
+        moved = releases.update(expected_arrival_date=expected_arrival_date)
+        if moved:
+            # Quantities are unchanged: only next arrival and the overdue count move
+            _refresh_firms({line_id for line_id, _ in rows})
+            today = timezone.localdate()
+            was_overdue = sum(date is not None and date < today for _, date in rows)
+            now_overdue = moved if expected_arrival_date and expected_arrival_date < today else 0
+            metrics.add_releases(overdue=now_overdue - was_overdue)
+    return moved
@@ -1,29 +1,51 @@
+from asgiref.sync import iscoroutinefunction
 from django.contrib.auth.decorators import user_passes_test
 
+from .models import UserProfile
+
+ADMIN_ROLES = ['ADMIN']
+SALES_ROLES = ['SALESMAN', 'ADMIN']
+
+
+def has_role(user, roles):
+    return user.is_active and user.is_authenticated and (user.is_superuser or (hasattr(user, 'profile') and user.profile.role in roles))
+
+
+async def ahas_role(user, roles):
+    """has_role() for async views: the profile is read with the async ORM."""
+    if not (user.is_active and user.is_authenticated):
+        return False
+    return user.is_superuser or await UserProfile.objects.filter(user_id=user.pk, role__in=roles).aexists()
+
+
+def _role_required(roles, function, redirect_field_name, login_url):
+    def decorator(view_func):
+        # user_passes_test awaits a coroutine test for async views instead of
+        # running the sync one (and its profile query) in a worker thread
+        if iscoroutinefunction(view_func):
+            async def test_func(user):
+                return await ahas_role(user, roles)
+        else:
+            def test_func(user):
+                return has_role(user, roles)
+        return user_passes_test(test_func, login_url=login_url, redirect_field_name=redirect_field_name)(view_func)
+
+    if function:
+        return decorator(function)
+    return decorator
+
 def admin_required(function=None, redirect_field_name='next', login_url='login'):
     '''
     Decorator for views that checks that the user is logged in and is an ADMIN.
+    Works on sync and async views.
     '''
-    actual_decorator = user_passes_test(
-        lambda u: u.is_active and u.is_authenticated and (u.is_superuser or (hasattr(u, 'profile') and u.profile.role == 'ADMIN')),
-        login_url=login_url,
-        redirect_field_name=redirect_field_name
-    )
-    if function:
-        return actual_decorator(function)
-    return actual_decorator
+    return _role_required(ADMIN_ROLES, function, redirect_field_name, login_url)
 
 def sales_required(function=None, redirect_field_name='next', login_url='login'):
     '''
     Decorator for views that checks that the user is logged in and is a SALESMAN (or Admin).
     Admins should generally be able to see everything, or restrict strictly.
     Let's allow Admins to see Sales views too for debugging/oversight.
+    Works on sync and async views.
     '''
-    actual_decorator = user_passes_test(
-        lambda u: u.is_active and u.is_authenticated and (u.is_superuser or (hasattr(u, 'profile') and u.profile.role in ['SALESMAN', 'ADMIN'])),
-        login_url=login_url,
-        redirect_field_name=redirect_field_name
-    )
-    if function:
-        return actual_decorator(function)
-    return actual_decorator
+    return _role_required(SALES_ROLES, function, redirect_field_name, login_url)
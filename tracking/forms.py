@@ -1,6 +1,7 @@
 from django import forms
 from django.forms import inlineformset_factory
 from .models import ItemMaster, Quotation, QuotationItem, Shipment, Release, Manufacturer
+from .caching import firm_names
 
 class UploadItemForm(forms.Form):
     file = forms.FileField(label='Select Excel File')
@@ -22,10 +23,10 @@ class ManufacturerForm(forms.ModelForm):
 class QuotationForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Get distinct firms from ItemMaster
-        firms = ItemMaster.objects.values_list('item_firm', flat=True).distinct().order_by('item_firm')
+        # Distinct ItemMaster firms, cached until an import changes the catalog
+        firms = firm_names()
         # Create choices list: [('', 'Select Supplier'), ('FirmA', 'FirmA'), ...]
-        firm_choices = [('', 'Select Supplier')] + [(firm, firm) for firm in firms if firm]
+        firm_choices = [('', 'Select Supplier')] + [(firm, firm) for firm in firms]
         
         self.fields['supplier_name'].widget = forms.Select(attrs={'class': 'block w-full rounded-md border-0 py-1.5 text-slate-900 shadow-sm ring-1 ring-inset ring-slate-300 focus:ring-2 focus:ring-inset focus:ring-brand-600 sm:text-sm sm:leading-6'})
         self.fields['supplier_name'].widget.choices = firm_choices
@@ -62,6 +63,10 @@ class QuotationItemForm(forms.ModelForm):
         elif self.instance.pk:
             # Editing existing item (GET): Load the existing item
             self.fields['item'].queryset = ItemMaster.objects.filter(pk=self.instance.item_id)
+            if QuotationItem.item.is_cached(self.instance):
+                # Fetched with the line (select_related): render the one option without a query per row
+                item = self.instance.item
+                self.fields['item'].widget.choices = [('', self.fields['item'].empty_label), (item.pk, str(item))]
 
     class Meta:
         model = QuotationItem
@@ -100,3 +105,48 @@ class ReleaseForm(forms.ModelForm):
              'quantity_released': forms.NumberInput(attrs={'class': 'block w-full rounded-md border-0 py-1.5 text-slate-900 shadow-sm ring-1 ring-inset ring-slate-300 focus:ring-2 focus:ring-inset focus:ring-brand-600 sm:text-sm sm:leading-6'}),
              'container_info': forms.TextInput(attrs={'class': 'block w-full rounded-md border-0 py-1.5 text-slate-900 shadow-sm ring-1 ring-inset ring-slate-300 focus:ring-2 focus:ring-inset focus:ring-brand-600 sm:text-sm sm:leading-6', 'placeholder': 'e.g. Container #1234, Truck #55'}),
         }
+
+_INPUT_CLASS = 'block w-full rounded-md border-0 py-1.5 text-slate-900 shadow-sm ring-1 ring-inset ring-slate-300 focus:ring-2 focus:ring-inset focus:ring-brand-600 sm:text-sm sm:leading-6'
+
+class BulkReleaseForm(forms.ModelForm):
+    """One release (date, arrival, container) for several lines; a `line_<pk>` quantity field per line."""
+    class Meta:
+        model = Release
+        fields = ['release_date', 'expected_arrival_date', 'container_info']
+        widgets = ReleaseForm.Meta.widgets
+
+    def __init__(self, *args, lines=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lines = list(lines)
+        for line in self.lines:
+            self.fields[f'line_{line.pk}'] = forms.IntegerField(
+                min_value=0, max_value=line.balance_to_release, required=False, initial=line.balance_to_release,
+                widget=forms.NumberInput(attrs={'class': _INPUT_CLASS}),
+            )
+
+    def line_fields(self):
+        return [(line, self[f'line_{line.pk}']) for line in self.lines]
+
+    def quantities(self):
+        return {line.pk: self.cleaned_data.get(f'line_{line.pk}') or 0 for line in self.lines}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors and not any(self.quantities().values()):
+            raise forms.ValidationError("Enter a quantity for at least one line.")
+        return cleaned_data
+
+class ContainerReceiveForm(forms.Form):
+    """The received date and the `release` pks selected, which must be open releases of the container."""
+    received_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': _INPUT_CLASS}))
+    release = forms.TypedMultipleChoiceField(coerce=int, required=False, widget=forms.CheckboxSelectMultiple)
+
+    def __init__(self, *args, container_info='', **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.is_bound:  # only validation needs the container's releases
+            self.fields['release'].choices = [
+                (pk, pk) for pk in Release.objects.filter(container_info=container_info, is_received=False)
+                .values_list('pk', flat=True)]
+
+class ContainerRescheduleForm(forms.Form):
+    expected_arrival_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': _INPUT_CLASS}))
@@ -0,0 +1,437 @@
+"""
+Vectorized Excel/API import helpers.
+
+Each import cleans the whole DataFrame with column operations, collects per-row
+problems from the validation masks, then writes with batched bulk upserts so the
+number of round trips depends on the batch count, not the row count.
+"""
+import codecs
+import hashlib
+import json
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import repeat
+
+import django
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections, transaction
+from .models import FirmSummary, ItemMaster, LocalPurchaseBatch, LocalPurchaseBrandSummary, LocalPurchaseItem
+from . import metrics
+from .caching import bump_local_purchase_version, invalidate_firms
+from .search import index_items
+
+UPSERT_BATCH_SIZE = 2000
+
+ITEM_UPLOAD_COLUMNS = ['Item Code', 'Item Description', 'Firm', 'Stock', 'UOM']
+
+
+def _text_column(series):
+    """Stripped strings with blanks (NaN/None) as ''."""
+    return series.fillna('').astype(str).str.strip()
+
+
+def clean_item_upload(df):
+    """
+    Clean an ItemMaster upload sheet.
+    Returns (records, errors): records is a DataFrame of valid rows (duplicate
+    codes resolved last-one-wins), errors is a list of "Row N: reason" strings
+    using the spreadsheet row numbers.
+    """
+    codes = _text_column(df['Item Code'])
+    stock_raw = df['Stock']
+    stock = pd.to_numeric(stock_raw, errors='coerce')
+
+    missing_code = codes.isin(['', 'nan'])
+    bad_stock = stock.isna() & stock_raw.notna() & (_text_column(stock_raw) != '')
+
+    reasons = pd.Series('', index=df.index)
+    reasons[bad_stock] = "invalid Stock value '" + stock_raw[bad_stock].astype(str) + "'"
+    reasons[missing_code] = 'missing Item Code'
+    errors = [f"Row {index + 2}: {reason}" for index, reason in reasons[reasons != ''].items()]
+
+    valid = ~(missing_code | bad_stock)
+    records = pd.DataFrame({
+        'item_code': codes[valid],
+        'item_description': _text_column(df['Item Description'])[valid],
+        'item_firm': _text_column(df['Firm'])[valid],
+        'item_stock': stock[valid].fillna(0).astype(int),
+        'uom': _text_column(df['UOM'])[valid],
+    })
+    records = records.drop_duplicates('item_code', keep='last')
+    return records, errors
+
+
+def bulk_upsert_items(objs, update_fields, batch_size=UPSERT_BATCH_SIZE):
+    """Insert-or-update ItemMaster objects keyed by item_code; one INSERT ... ON CONFLICT per batch."""
+    with transaction.atomic():
+        ItemMaster.objects.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['item_code'],
+            update_fields=update_fields,
+        )
+        index_items(obj.item_code for obj in objs)
+    return len(objs)
+
+
+def upsert_items(records, update_fields, batch_size=UPSERT_BATCH_SIZE):
+    """Insert-or-update ItemMaster rows from a cleaned records DataFrame keyed by item_code."""
+    columns = list(records.columns)
+    objs = [ItemMaster(**dict(zip(columns, values))) for values in records.itertuples(index=False, name=None)]
+    # Firms whose cached catalog changes: the current firm of every row and the uploaded one
+    codes = {obj.item_code for obj in objs}
+    existing = dict(ItemMaster.objects.filter(item_code__in=codes).values_list('item_code', 'item_firm'))
+    firms = set(existing.values())
+    firms.update(obj.item_firm for obj in objs)
+    count = bulk_upsert_items(objs, update_fields, batch_size)
+    invalidate_firms(firms)
+    FirmSummary.objects.refresh(firms)
+    metrics.add_items(len(codes) - len(existing))
+    return count
+
+
+# ItemMaster fields owned by the stock API sync
+STOCK_SYNC_FIELDS = ['item_description', 'item_upvc', 'item_cost', 'item_firm', 'item_price', 'item_stock', 'uom']
+_DECIMAL_SYNC_FIELDS = {'item_cost', 'item_price'}
+_CENTS = Decimal('0.01')
+
+
+def _cents(value):
+    """A price as stored: two places, halves rounded away from zero like PostgreSQL numeric."""
+    return Decimal(str(value or 0)).quantize(_CENTS, rounding=ROUND_HALF_UP)
+
+
+def item_fingerprint(values):
+    """
+    8-byte digest of the STOCK_SYNC_FIELDS values (in that order). Values are
+    normalized so a DB row (Decimal, None) and an API record (float, '')
+    holding the same data hash equally.
+    """
+    parts = []
+    for field, value in zip(STOCK_SYNC_FIELDS, values):
+        if field in _DECIMAL_SYNC_FIELDS:
+            value = _cents(value)
+        parts.append('' if value is None else str(value))
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=8).digest()
+
+
+def load_item_fingerprints(codes=None):
+    """{item_code: (fingerprint, item_firm)} for the given codes (default: every ItemMaster row)."""
+    rows = ItemMaster.objects.values_list('item_code', *STOCK_SYNC_FIELDS)
+    if codes is not None:
+        rows = rows.filter(item_code__in=codes)
+    rows = rows.iterator(chunk_size=5000)
+    return {row[0]: (item_fingerprint(row[1:]), row[STOCK_SYNC_FIELDS.index('item_firm') + 1]) for row in rows}
+
+
+def sync_item_batch(objs, fingerprints, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Upsert only the objects that are new or differ from their fingerprint.
+    `fingerprints` is updated in place so later batches see these rows.
+    Returns (inserted, updated, unchanged, touched_firms); touched_firms holds
+    the old and new firm of every written row.
+    """
+    inserted = updated = unchanged = 0
+    touched_firms = set()
+    changed = []
+    for obj in objs:
+        for field in _DECIMAL_SYNC_FIELDS:
+            # Written already rounded, so every backend stores what the fingerprint assumed
+            if getattr(obj, field) is not None:
+                setattr(obj, field, _cents(getattr(obj, field)))
+        digest = item_fingerprint([getattr(obj, field) for field in STOCK_SYNC_FIELDS])
+        current = fingerprints.get(obj.item_code)
+        if current is None:
+            inserted += 1
+        elif current[0] == digest:
+            unchanged += 1
+            continue
+        else:
+            updated += 1
+            touched_firms.add(current[1])
+        touched_firms.add(obj.item_firm)
+        fingerprints[obj.item_code] = (digest, obj.item_firm)
+        changed.append(obj)
+
+    if changed:
+        bulk_upsert_items(changed, STOCK_SYNC_FIELDS, batch_size)
+    return inserted, updated, unchanged, touched_firms
+
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of a top-level JSON array from an iterable of byte
+    chunks (e.g. response.iter_content()). Only the unconsumed tail of the
+    current chunk and the element being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer, pos, eof, started = '', 0, False, False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buffer = buffer[pos:] + utf8.decode(chunk or b'', final=eof)
+        pos = 0
+
+    while True:
+        pos = _JSON_WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            read_more()
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            return
+        if char == ',':
+            pos += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = len(buffer)
+        if end == len(buffer) and not eof:
+            # Element (or a trailing number) may continue in the next chunk: extend and retry
+            read_more()
+            continue
+        pos = end
+        yield value
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of at most `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Local Purchase analysis sheets: (normalized Excel header, LocalPurchaseItem field, kind).
+# 'int'/'float' cells that are blank or non-numeric (" - ", "N/A", "#DIV/0!") become 0.
+LOCAL_PURCHASE_COLUMNS = [
+    ('CODE', 'item_code', 'code'),
+    ('UPC CODE', 'upc_code', 'text'),
+    ('DESCRIPTION', 'description', 'text'),
+    ('Current Stock RAS', 'current_stock_ras', 'int'),
+    ('Current Stock DIP', 'current_stock_dip', 'int'),
+    ('Sold Qty 2024', 'sold_qty_2024', 'int'),
+    ('CONTG.', 'contg', 'int'),
+    ('TRDG.', 'trdg', 'int'),
+    ('STORES', 'stores', 'int'),
+    ('TOTAL Sold Qty 2025', 'total_sold_qty_2025', 'int'),
+    ('Avg 15Day Sales HO 2025', 'avg_15day_sales', 'float'),
+    ('STOCK Sufficiency Month', 'stock_sufficiency_months', 'float'),
+    ('LPO Given', 'lpo_given', 'int'),
+    ('OPEN SO QTY', 'open_so_qty', 'int'),
+    ('STOCK Reqt Calcn', 'stock_reqt_calcn', 'int'),
+    ('STOCK REQUIREMENT', 'stock_requirement', 'int'),
+    ('VALUE', 'value', 'float'),
+    ('COST', 'cost', 'float'),
+    ('HO PER LPO QTY', 'ho_per_lpo_qty', 'float'),
+    ('Stock Reqt RAS/ Stores', 'stock_reqt_ras_stores', 'float'),
+]
+
+
+def normalize_headers(df):
+    """Collapse newlines/repeated spaces in headers ('STOCK\\nREQUIREMENT' -> 'STOCK REQUIREMENT')."""
+    df.columns = [re.sub(r'\s+', ' ', str(col)).strip() for col in df.columns]
+    return df
+
+
+def _code_text(value):
+    """A code cell as text: blanks give '', and numeric codes read as floats lose the '.0' (123.0 -> '123')."""
+    if isinstance(value, float):
+        if not np.isfinite(value):
+            return ''
+        return str(int(value)) if value.is_integer() else str(value)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def coerce_column(df, header, kind, places=None):
+    """
+    Coerce one sheet column to a list of Python values for `kind`; missing columns
+    give defaults. 'float' values are rounded to `places` decimals when given.
+    """
+    if header not in df.columns:
+        return [0 if kind == 'int' else 0.0 if kind == 'float' else ''] * len(df)
+
+    series = df[header]
+    if kind == 'code':
+        return series.map(_code_text).tolist()
+    if kind == 'text':
+        return series.astype(str).where(series.notna(), '').tolist()
+
+    numbers = pd.to_numeric(series, errors='coerce')
+    numbers = numbers.where(np.isfinite(numbers), 0)
+    if kind == 'int':
+        return numbers.astype('int64').tolist()
+    numbers = numbers.astype(float)
+    if places is not None:
+        numbers = numbers.round(places)
+    return numbers.tolist()
+
+
+def local_purchase_columns(df):
+    """
+    Apply LOCAL_PURCHASE_COLUMNS to a sheet; returns {field: list of values}.
+    Decimals are rounded to their field's places here: SQLite would otherwise
+    keep 0.96 in a one-place column that PostgreSQL stores as 1.0, and filters
+    and summaries would differ between the two.
+    """
+    fields = LocalPurchaseItem._meta
+    return {
+        field: coerce_column(df, header, kind, fields.get_field(field).decimal_places if kind == 'float' else None)
+        for header, field, kind in LOCAL_PURCHASE_COLUMNS
+    }
+
+
+def build_local_purchase_items(brand, columns, batch=None):
+    """Build unsaved LocalPurchaseItem instances straight from the column arrays."""
+    fields = list(columns)
+    return [
+        LocalPurchaseItem(brand=brand, batch=batch, **dict(zip(fields, values)))
+        for values in zip(*columns.values())
+    ]
+
+
+def summarize_local_purchase(columns):
+    """
+    LocalPurchaseBrandSummary fields of one sheet, computed on the (already
+    rounded) column arrays; the counts match the list view's quick filters.
+    """
+    months, value, cost = (pd.Series(columns[field], dtype=float) for field in ('stock_sufficiency_months', 'value', 'cost'))
+    requirement = pd.Series(columns['stock_requirement'], dtype='int64')
+    return {
+        'row_count': len(requirement),
+        'critical_count': int((months < LocalPurchaseItem.CRITICAL_SUFFICIENCY_MONTHS).sum()),
+        'required_count': int((requirement > 0).sum()),
+        'high_value_count': int((value > LocalPurchaseItem.HIGH_VALUE).sum()),
+        'total_value': Decimal(f'{value.sum():.2f}'),
+        'total_cost': Decimal(f'{cost.sum():.2f}'),
+        'total_stock_requirement': int(requirement.sum()),
+    }
+
+
+# Sheets of the Local Purchase analysis workbook that are imported (matched case-insensitively)
+LOCAL_PURCHASE_SHEETS = ['HEPWORTH', 'RAKTherm', 'VERA-PUMP', 'PEGLER', 'OTHERS']
+
+
+def parse_local_purchase_sheet(source, sheet_name):
+    """
+    Read one sheet of `source` (a path or an open pd.ExcelFile) into its
+    local_purchase_columns() lists; None when the sheet has no CODE column.
+    Runs in the parse workers, so it returns plain data, not model instances.
+    """
+    df = normalize_headers(pd.read_excel(source, sheet_name=sheet_name))
+    if 'CODE' not in df.columns:
+        return None
+    return local_purchase_columns(df)
+
+
+def parse_local_purchase_sheets(file_path, sheet_names, workers=None):
+    """
+    Yield (sheet_name, columns) for `sheet_names` in order, parsing up to
+    `workers` sheets at once in a process pool (default: the
+    LOCAL_PURCHASE_PARSE_WORKERS setting, else 1). openpyxl parsing is
+    CPU-bound, so threads would not help. One worker parses in-process.
+    """
+    if workers is None:
+        workers = getattr(settings, 'LOCAL_PURCHASE_PARSE_WORKERS', None) or 1
+    workers = min(workers, len(sheet_names))
+    if workers <= 1:
+        with pd.ExcelFile(file_path) as xls:
+            for sheet_name in sheet_names:
+                yield sheet_name, parse_local_purchase_sheet(xls, sheet_name)
+        return
+
+    # This runs inside the threaded job worker (heartbeat thread, open DB
+    # connection), which must not be forked: spawn fresh interpreters instead,
+    # which import this module and so need the app registry set up. Idle
+    # connections are closed first; one inside a transaction is left alone.
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+    try:
+        yield from zip(sheet_names, pool.map(parse_local_purchase_sheet, repeat(str(file_path)), sheet_names))
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def import_local_purchase_workbook(file_path, progress=None, workers=None):
+    """
+    Replace the LocalPurchaseItem rows of every whitelisted sheet in the workbook.
+
+    Each sheet is loaded into a new staging LocalPurchaseBatch while readers keep
+    seeing the active one; once every sheet is in, all brands switch to their new
+    batch in one transaction and the retired batches are purged. If anything
+    fails before the switch, the staged batches are discarded and every brand
+    keeps its previous rows and summary.
+    Sheets are parsed by parse_local_purchase_sheets() (`workers` processes) while
+    the main process writes the ones already parsed.
+    `progress(percent, message)` is called after each sheet when given.
+    Returns (total_imported, sheet_count).
+    """
+    allowed = {s.upper() for s in LOCAL_PURCHASE_SHEETS}
+    total_imported = 0
+    staged = []  # (batch, summary) per imported sheet
+
+    with pd.ExcelFile(file_path) as xls:
+        sheet_names = xls.sheet_names
+    selected = [name for name in sheet_names if name.upper() in allowed]
+
+    try:
+        # closing(): a failure stops the parse workers straight away
+        with closing(parse_local_purchase_sheets(file_path, selected, workers)) as sheets:
+            for done, (sheet_name, columns) in enumerate(sheets, start=1):
+                if columns is not None:
+                    # The sheet name is the brand
+                    batch = LocalPurchaseBatch.objects.create(brand=sheet_name)
+                    staged.append((batch, summarize_local_purchase(columns)))
+                    items_to_create = build_local_purchase_items(sheet_name, columns, batch)
+                    LocalPurchaseItem.objects.bulk_create(items_to_create)
+                    total_imported += len(items_to_create)
+
+                if progress:
+                    progress(int(done * 100 / len(selected)), f"Imported sheet {sheet_name}")
+
+        with transaction.atomic():
+            for batch, summary in staged:
+                LocalPurchaseBatch.objects.activate(batch)
+                LocalPurchaseBrandSummary.objects.update_or_create(brand=batch.brand, defaults=summary)
+                bump_local_purchase_version(batch.brand)
+    except BaseException:
+        LocalPurchaseBatch.objects.discard([batch for batch, _ in staged])
+        raise
+
+    if staged:
+        LocalPurchaseBatch.objects.purge([batch.brand for batch, _ in staged])
+    return total_imported, len(sheet_names)
@@ -0,0 +1,177 @@
+"""
+Small database-backed job runner.
+
+Views call enqueue() and return immediately; `python manage.py run_jobs` claims
+QUEUED rows (row locks, SKIP LOCKED on PostgreSQL) and runs the registered
+handler, which reports progress through the callback it is given. Dashboards
+poll the job_status endpoint.
+
+While a handler runs, a thread refreshes the job's heartbeat. A RUNNING job
+whose heartbeat goes stale had its worker killed (signal, out of memory) and
+is marked FAILED by fail_stale_jobs(), so dashboards stop waiting for it.
+"""
+import os
+import threading
+import traceback
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .importers import import_local_purchase_workbook
+from .models import BackgroundJob
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register `func(job, progress)` as the handler for a BackgroundJob kind. Returns the output text."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, user=None, **payload):
+    """Queue a job. With BACKGROUND_JOBS_INLINE (no worker, e.g. local dev) it runs before returning."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = BackgroundJob.objects.create(kind=kind, payload=payload, created_by=user)
+    if getattr(settings, 'BACKGROUND_JOBS_INLINE', False) and claim(job):
+        run_job(job)
+    return job
+
+
+def claim(job):
+    """Atomically move a QUEUED job to RUNNING. False if another worker got it first."""
+    now = timezone.now()
+    claimed = BackgroundJob.objects.filter(pk=job.pk, status='QUEUED').update(
+        status='RUNNING', started_at=now, heartbeat_at=now, message='Starting...'
+    )
+    if claimed:
+        job.status, job.started_at, job.heartbeat_at = 'RUNNING', now, now
+    return bool(claimed)
+
+
+def _stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.BACKGROUND_JOB_STALE_SECONDS)
+
+
+def is_stale(job):
+    """True for a RUNNING job whose worker has not beaten within BACKGROUND_JOB_STALE_SECONDS."""
+    last_seen = job.heartbeat_at or job.started_at
+    return job.status == 'RUNNING' and last_seen is not None and last_seen < _stale_cutoff()
+
+
+def fail_stale_jobs():
+    """Mark every stale RUNNING job FAILED. Returns how many there were."""
+    cutoff = _stale_cutoff()
+    return BackgroundJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff), status='RUNNING',
+    ).update(status='FAILED', message='The worker running this job stopped responding.', finished_at=timezone.now())
+
+
+def claim_next_job():
+    """
+    Lock and claim the oldest QUEUED job, skipping rows other workers hold. None when the queue is empty.
+    Jobs abandoned by dead workers are failed first.
+    """
+    fail_stale_jobs()
+    with transaction.atomic():
+        job = (BackgroundJob.objects.select_for_update(skip_locked=True)
+               .filter(status='QUEUED').order_by('created_at', 'pk').first())
+        if job and claim(job):
+            return job
+    return None
+
+
+def _heartbeat(job_id, stop, interval):
+    """Thread body: refresh the job's heartbeat every `interval` seconds until `stop` is set."""
+    try:
+        while not stop.wait(interval):
+            try:
+                BackgroundJob.objects.filter(pk=job_id, status='RUNNING').update(heartbeat_at=timezone.now())
+            except DatabaseError:
+                pass  # e.g. SQLite locked by the handler's write: the next beat will do
+    finally:
+        connection.close()  # this thread's connection
+
+
+def run_job(job):
+    """
+    Run a claimed job's handler and record the outcome. Handler exceptions mark the
+    job FAILED; so do KeyboardInterrupt/SystemExit, which are then re-raised.
+    """
+    def progress(percent, message=''):
+        job.progress = max(0, min(100, int(percent)))
+        job.message = message[:255]
+        BackgroundJob.objects.filter(pk=job.pk).update(progress=job.progress, message=job.message)
+
+    def finish():
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'progress', 'message', 'output', 'finished_at'])
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.pk, stop, settings.BACKGROUND_JOB_HEARTBEAT_SECONDS),
+                     name=f'job-{job.pk}-heartbeat', daemon=True).start()
+    try:
+        output = HANDLERS[job.kind](job, progress) or ''
+    except BaseException as e:
+        job.status = 'FAILED'
+        job.message = (str(e) or type(e).__name__)[:255]
+        job.output = traceback.format_exc()
+        finish()
+        if not isinstance(e, Exception):
+            raise
+    else:
+        job.status = 'SUCCEEDED'
+        job.progress = 100
+        job.output = output
+        job.message = (output.strip().splitlines() or ['Done'])[-1][:255]
+        finish()
+    finally:
+        stop.set()
+    return job
+
+
+def recent_jobs(kinds=None, minutes=30):
+    """Jobs still pending plus those finished in the last `minutes`, for the dashboard progress panels."""
+    jobs = BackgroundJob.objects.filter(
+        Q(status__in=['QUEUED', 'RUNNING']) | Q(finished_at__gte=timezone.now() - timedelta(minutes=minutes))
+    )
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    recent = list(jobs[:5])
+    if any(is_stale(job) for job in recent):
+        fail_stale_jobs()
+        recent = list(jobs[:5])
+    return recent
+
+
+@job_handler('STOCK_IMPORT')
+def stock_import_job(job, progress):
+    out = StringIO()
+    call_command('import_stock_api', stdout=out, progress=progress)
+    return out.getvalue()
+
+
+@job_handler('IGNORE_LIST_IMPORT')
+def ignore_list_import_job(job, progress):
+    out = StringIO()
+    call_command('import_ignore_list', stdout=out)
+    return out.getvalue()
+
+
+@job_handler('LOCAL_PURCHASE_UPLOAD')
+def local_purchase_upload_job(job, progress):
+    file_path = job.payload['file_path']
+    try:
+        total_imported, sheet_count = import_local_purchase_workbook(file_path, progress=progress)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    return f"Successfully imported {total_imported} items from {sheet_count} sheets."
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from tracking import jobs
+
+class Command(BaseCommand):
+    help = "Queue a BackgroundJob for the run_jobs worker (e.g. a nightly STOCK_IMPORT from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', help=f"One of: {', '.join(jobs.HANDLERS)}")
+
+    def handle(self, *args, **options):
+        try:
+            job = jobs.enqueue(options['kind'].upper())
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Queued {job}"))
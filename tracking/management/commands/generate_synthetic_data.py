@@ -0,0 +1,216 @@
+import datetime
+import random
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tracking import metrics
+from tracking.caching import bump_local_purchase_version, invalidate_firms
+from tracking.models import (ItemMaster, LocalPurchaseBrandSummary, LocalPurchaseItem, Manufacturer, Quotation,
+                             QuotationItem, Release, Shipment, Supplier)
+from tracking.search import index_items
+
+# Generated rows are recognisable by these prefixes, so --clear only removes synthetic data
+CODE_PREFIX = 'SYN'
+REFERENCE_PREFIX = 'SYN-Q'
+CONTAINER_PREFIX = 'SYN-CONT'
+
+FIRM_NAMES = ['PEGLER', 'HEPWORTH', 'RAKTHERM', 'VERA-PUMP', 'GROHE', 'GEBERIT', 'KITZ', 'DANFOSS',
+              'WAVIN', 'ARMSTRONG', 'GRUNDFOS', 'CALEFFI', 'OVENTROP', 'HONEYWELL', 'VIEGA', 'AQUATHERM']
+PARTS = ['Gate Valve', 'Ball Valve', 'Check Valve', 'Elbow 90', 'Equal Tee', 'Coupling', 'Reducer',
+         'Flange', 'Pipe', 'Union', 'Strainer', 'Float Valve', 'Socket', 'End Cap', 'Pump']
+MATERIALS = ['Brass', 'Bronze', 'PPR', 'UPVC', 'Ductile Iron', 'Stainless Steel', 'HDPE', 'Copper']
+SIZES = ['DN15', 'DN20', 'DN25', 'DN32', 'DN40', 'DN50', 'DN65', 'DN80', 'DN100', '1/2"', '3/4"', '1"', '2"']
+STATUS_WEIGHTS = {'DRAFT': 15, 'CONFIRMED': 60, 'COMPLETED': 20, 'CANCELLED': 5}
+CONTAINER_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = "Generate realistic synthetic firms, items, quotations, releases, shipments and Local Purchase rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--firms', type=int, default=12)
+        parser.add_argument('--suppliers', type=int, default=None, help="Supplier rows (default: one per firm)")
+        parser.add_argument('--manufacturers', type=int, default=4)
+        parser.add_argument('--items', type=int, default=5000)
+        parser.add_argument('--quotations', type=int, default=300)
+        parser.add_argument('--lines', type=int, default=8, help="Average lines per quotation")
+        parser.add_argument('--releases', type=int, default=1500)
+        parser.add_argument('--shipments', type=int, default=800, help="Releases received (one Shipment each)")
+        parser.add_argument('--local-purchase', type=int, default=20000, help="Local Purchase rows")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated data first")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.today = datetime.date.today()
+        firms = self.firm_names(options['firms'])
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            self.create_suppliers(firms, options['suppliers'], options['manufacturers'])
+            items = self.create_items(firms, options['items'])
+            lines = self.create_quotations(items, options['quotations'], options['lines'])
+            releases = self.create_releases(lines, options['releases'])
+            shipments = self.receive(releases, options['shipments'])
+            local_purchase = self.create_local_purchase(firms, options['local_purchase'])
+
+            # Everything above was bulk inserted: bring the derived tables up to date once
+            QuotationItem.objects.filter(pk__in=[line.pk for line, _ in lines]).recalculate_totals()
+            index_items([item.item_code for item in items])
+            call_command('rebuild_firm_summary', stdout=StringIO())
+            metrics.reconcile()
+            LocalPurchaseBrandSummary.objects.rebuild()
+            invalidate_firms(firms)
+            for firm in firms:
+                bump_local_purchase_version(firm)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(firms)} firms, {len(items)} items, {options['quotations']} quotations, "
+            f"{len(lines)} lines, {len(releases)} releases, {shipments} shipments, "
+            f"{local_purchase} Local Purchase rows."
+        ))
+
+    def firm_names(self, count):
+        return [FIRM_NAMES[n % len(FIRM_NAMES)] + (f' {n // len(FIRM_NAMES) + 1}' if n >= len(FIRM_NAMES) else '')
+                for n in range(count)]
+
+    def clear(self):
+        # Lines, releases and shipments cascade from the items and quotations
+        Quotation.objects.filter(reference_number__startswith=REFERENCE_PREFIX).delete()
+        ItemMaster.objects.filter(item_code__startswith=CODE_PREFIX).delete()
+        LocalPurchaseItem.objects.filter(item_code__startswith=CODE_PREFIX).delete()
+
+    def create_suppliers(self, firms, suppliers, manufacturers):
+        names = firms[:len(firms) if suppliers is None else suppliers]
+        Supplier.objects.bulk_create([Supplier(name=name) for name in names], ignore_conflicts=True)
+        Manufacturer.objects.bulk_create(
+            [Manufacturer(name=f'Synthetic Group {n + 1}') for n in range(manufacturers)], ignore_conflicts=True)
+        self.manufacturers = list(Manufacturer.objects.filter(name__startswith='Synthetic Group'))
+
+    def description(self):
+        return f"{self.rng.choice(PARTS)} {self.rng.choice(MATERIALS)} {self.rng.choice(SIZES)}"
+
+    def create_items(self, firms, count):
+        rng = self.rng
+        items = []
+        for n in range(count):
+            firm_index = n % len(firms)
+            cost = Decimal(rng.randint(100, 50000)) / 100
+            items.append(ItemMaster(
+                item_code=f'{CODE_PREFIX}{firm_index:02d}-{n:06d}',
+                item_description=self.description(),
+                item_firm=firms[firm_index],
+                item_stock=rng.choice([0, 0, rng.randint(1, 2000)]),
+                item_upvc=str(rng.randint(10 ** 11, 10 ** 12 - 1)),
+                item_cost=cost,
+                item_price=(cost * Decimal('1.35')).quantize(Decimal('0.01')),
+                uom=rng.choice(['Nos', 'Nos', 'Mtr', 'Set']),
+            ))
+        ItemMaster.objects.bulk_create(items, batch_size=2000, ignore_conflicts=True)
+        return list(ItemMaster.objects.filter(item_code__in=[item.item_code for item in items]))
+
+    def create_quotations(self, items, count, average_lines):
+        """Returns [(line, status)] for every line created."""
+        rng = self.rng
+        by_firm = {}
+        for item in items:
+            by_firm.setdefault(item.item_firm, []).append(item)
+        firms = sorted(by_firm)
+        start = Quotation.objects.filter(reference_number__startswith=REFERENCE_PREFIX).count()
+
+        quotations = Quotation.objects.bulk_create([
+            Quotation(
+                reference_number=f'{REFERENCE_PREFIX}{start + n:06d}',
+                supplier_name=rng.choice(firms),
+                manufacturer=rng.choice(self.manufacturers) if self.manufacturers else None,
+                status=rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0],
+            )
+            for n in range(count)
+        ], batch_size=2000)
+
+        lines = []
+        for quotation in quotations:
+            candidates = by_firm[quotation.supplier_name]
+            size = min(len(candidates), rng.randint(1, max(1, 2 * average_lines - 1)))
+            for item in rng.sample(candidates, size):
+                lines.append(QuotationItem(
+                    quotation=quotation, item=item,
+                    quantity_ordered=rng.randint(1, 50) * 10,
+                    rate=item.item_cost,
+                    expected_delivery_date=self.today + datetime.timedelta(days=rng.randint(-60, 120)),
+                ))
+        lines = QuotationItem.objects.bulk_create(lines, batch_size=2000)
+        statuses = {quotation.pk: quotation.status for quotation in quotations}
+        return [(line, statuses[line.quotation_id]) for line in lines]
+
+    def create_releases(self, lines, count):
+        """Releases of confirmed/completed lines, packed into containers of CONTAINER_SIZE."""
+        rng = self.rng
+        open_lines = [line for line, status in lines if status in ('CONFIRMED', 'COMPLETED')]
+        remaining = {line.pk: line.quantity_ordered for line in open_lines}
+        start = Release.objects.filter(container_info__startswith=CONTAINER_PREFIX).values('container_info').distinct().count()
+        releases = []
+        while open_lines and len(releases) < count:
+            if len(releases) % CONTAINER_SIZE == 0:
+                container = f'{CONTAINER_PREFIX}-{start + len(releases) // CONTAINER_SIZE:05d}'
+                release_date = self.today - datetime.timedelta(days=rng.randint(0, 120))
+                arrival = release_date + datetime.timedelta(days=rng.randint(20, 60))
+            line = rng.choice(open_lines)
+            quantity = min(remaining[line.pk], rng.randint(1, 30) * 10)
+            remaining[line.pk] -= quantity
+            if not remaining[line.pk]:
+                open_lines.remove(line)
+            releases.append(Release(
+                quotation_item=line, quantity_released=quantity, release_date=release_date,
+                expected_arrival_date=arrival, container_info=container,
+            ))
+        return Release.objects.bulk_create(releases, batch_size=2000)
+
+    def receive(self, releases, count):
+        """Receive whole containers, earliest arrival first, until `count` releases are received."""
+        received = sorted(releases, key=lambda release: (release.expected_arrival_date, release.container_info))[:count]
+        Release.objects.filter(pk__in=[release.pk for release in received]).update(is_received=True)
+        Shipment.objects.bulk_create([
+            Shipment(quotation_item_id=release.quotation_item_id, quantity_received=release.quantity_released,
+                     received_date=min(release.expected_arrival_date, self.today),
+                     remarks=f"Auto-received from Release {release.container_info}")
+            for release in received
+        ], batch_size=2000)
+        return len(received)
+
+    def create_local_purchase(self, firms, count):
+        rng = self.rng
+        rows = []
+        for n in range(count):
+            sold_2025 = rng.randint(0, 5000)
+            stock = rng.randint(0, 3000)
+            average = Decimal(sold_2025) / 24
+            cost = Decimal(rng.randint(100, 20000)) / 100
+            requirement = max(0, int(average * 4) - stock)
+            rows.append(LocalPurchaseItem(
+                brand=firms[n % len(firms)],
+                item_code=f'{CODE_PREFIX}{n % len(firms):02d}-{n:06d}',
+                upc_code=str(rng.randint(10 ** 11, 10 ** 12 - 1)),
+                description=self.description(),
+                current_stock_ras=stock,
+                current_stock_dip=rng.randint(0, 500),
+                sold_qty_2024=rng.randint(0, 5000),
+                contg=rng.randint(0, 1000),
+                trdg=rng.randint(0, 1000),
+                stores=rng.randint(0, 1000),
+                total_sold_qty_2025=sold_2025,
+                avg_15day_sales=average.quantize(Decimal('0.01')),
+                stock_sufficiency_months=(Decimal(stock) / (average * 2) if average else Decimal(0)).quantize(Decimal('0.1')),
+                lpo_given=rng.randint(0, 200),
+                open_so_qty=rng.randint(0, 200),
+                stock_reqt_calcn=int(average * 4) - stock,
+                stock_requirement=requirement,
+                value=(requirement * cost).quantize(Decimal('0.01')),
+                cost=cost,
+            ))
+        LocalPurchaseItem.objects.bulk_create(rows, batch_size=2000)
+        return len(rows)
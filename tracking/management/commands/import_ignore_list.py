@@ -1,5 +1,5 @@
 import pandas as pd
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from tracking.models import IgnoreList
 
 class Command(BaseCommand):
@@ -11,16 +11,14 @@ class Command(BaseCommand):
         try:
             df = pd.read_excel(excel_file)
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Could not read {excel_file}: {e}"))
-            return
+            raise CommandError(f"Could not read {excel_file}: {e}")
 
         # Ensure item_code column exists
         # Normalizing column names to lowercase just in case
         df.columns = [c.lower().strip() for c in df.columns]
         
         if "item_code" not in df.columns:
-            self.stdout.write(self.style.ERROR("Excel file must contain 'item_code' column"))
-            return
+            raise CommandError("Excel file must contain 'item_code' column")
 
         # Clean + get codes
         codes = df["item_code"].astype(str).str.strip().unique()
@@ -1,32 +1,113 @@
+import logging
+import time
+
 import requests
-from django.core.management.base import BaseCommand
-from tracking.models import ItemMaster, IgnoreList
-from django.core.cache import cache
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from tracking.models import FirmSummary, ItemMaster, IgnoreList
+from tracking.importers import iter_json_array, batched, load_item_fingerprints, sync_item_batch
+from tracking import metrics
+from tracking.caching import invalidate_firms
+from tracking.stock_feed import open_feed, record_check, TimedChunks
+
+logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = "Import items from Website A, excluding those in IgnoreList (DB based)"
+    # progress(percent, message) callback passed by the background job runner
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=settings.STOCK_API_URL, help="Stock feed URL")
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Items compared and upserted per transaction")
+        parser.add_argument('--connect-timeout', type=float, default=settings.STOCK_API_CONNECT_TIMEOUT)
+        parser.add_argument('--read-timeout', type=float, default=settings.STOCK_API_READ_TIMEOUT)
+        parser.add_argument('--force', action='store_true',
+                            help="Ignore the stored ETag/Last-Modified and download the full feed")
 
     def handle(self, *args, **kwargs):
+        progress = kwargs.get('progress') or (lambda percent, message='': None)
+        batch_size = kwargs['batch_size']
+
         # 1. Load ignore list from DB
         ignore_codes = set(
             IgnoreList.objects.values_list("item_code", flat=True)
         )
 
-        # 2. Fetch items from Website A JSON API
-        url = "https://stock.junaidworld.com/api/stock"
+        # 2. Conditional request; the body is streamed and parsed as it arrives
+        url = kwargs['url']
+        started = time.perf_counter()
         try:
             self.stdout.write(f"Fetching data from {url}...")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            items_data = response.json()
+            response, state = open_feed(url, kwargs['connect_timeout'], kwargs['read_timeout'], force=kwargs['force'])
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Failed to fetch data: {e}"))
+            raise CommandError(f"Failed to fetch data: {e}")
+        headers_secs = time.perf_counter() - started
+
+        if response is None:
+            record_check(state)
+            logger.info("stock feed not modified url=%s fetch_ms=%.0f", url, headers_secs * 1000)
+            self.stdout.write(self.style.SUCCESS("Stock feed not modified since the last sync. Nothing to do."))
             return
 
-        # Use a dict to deduplicate by item_code in case API returns duplicates
-        items_dict = {}
-        skipped = 0
+        total_bytes = int(response.headers.get('Content-Length') or 0)
+        chunks = TimedChunks(response)
+        self.skipped = 0
+        inserted = updated = unchanged = 0
+        touched_firms = set()
+        db_secs = 0.0
+
+        self.stdout.write("Processing items for update/creation...")
+        try:
+            with response:
+                records = iter_json_array(chunks)
+                for batch in batched(self.clean_records(records, ignore_codes), batch_size):
+                    # Duplicates inside a batch: last one wins. Across batches the
+                    # later upsert simply overwrites the earlier one.
+                    batch = list({obj.item_code: obj for obj in batch}.values())
+
+                    # Each batch compares against its own slice of the table and commits on its own
+                    batch_started = time.perf_counter()
+                    with transaction.atomic():
+                        fingerprints = load_item_fingerprints(codes=[obj.item_code for obj in batch])
+                        counts = sync_item_batch(batch, fingerprints, batch_size)
+                        metrics.add_items(counts[0])
+                    db_secs += time.perf_counter() - batch_started
+                    inserted += counts[0]
+                    updated += counts[1]
+                    unchanged += counts[2]
+                    touched_firms |= counts[3]
+
+                    if total_bytes:
+                        progress(min(95, response.raw.tell() * 100 // total_bytes),
+                                 f"Synced {inserted + updated + unchanged} items")
+        except (requests.RequestException, ValueError) as e:
+            # Batches already committed stay; validators are not stored so the next run refetches
+            invalidate_firms(touched_firms)
+            FirmSummary.objects.refresh(touched_firms)
+            raise CommandError(f"Stock feed interrupted after {inserted + updated + unchanged} items: {e}")
+
+        record_check(state, response)
+        invalidate_firms(touched_firms)
+        # Items that moved between firms move their quotation lines with them
+        FirmSummary.objects.refresh(touched_firms)
 
+        fetch_secs = headers_secs + chunks.seconds
+        logger.info(
+            "stock sync url=%s bytes=%d encoding=%s fetch_ms=%.0f db_ms=%.0f inserted=%d updated=%d unchanged=%d skipped=%d",
+            url, chunks.bytes, response.headers.get('Content-Encoding', 'identity'), fetch_secs * 1000, db_secs * 1000,
+            inserted, updated, unchanged, self.skipped,
+        )
+        self.stdout.write(f"Fetch {fetch_secs:.2f}s, database {db_secs:.2f}s.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sync Complete. Inserted {inserted}, updated {updated}, unchanged {unchanged} "
+            f"({len(touched_firms)} firms changed). Skipped {self.skipped} (ignored/empty)."
+        ))
+
+    def clean_records(self, records, ignore_codes):
+        """Turn raw feed records into unsaved ItemMaster objects, dropping ignored/empty codes."""
         def safe_float(value):
             """Convert to float safely; return 0 if empty, invalid, or None."""
             try:
@@ -36,47 +117,20 @@ class Command(BaseCommand):
             except (TypeError, ValueError):
                 return 0.0
 
-        self.stdout.write("Processing items for update/creation...")
-        for item in items_data:
+        for item in records:
             item_code = str(item.get("item_code", "")).strip()
 
             if not item_code or item_code in ignore_codes:
-                skipped += 1
+                self.skipped += 1
                 continue
 
-            cost_price = safe_float(item.get("cost_price"))
-            price = safe_float(item.get("minimum_selling_price"))
-            stock = int(safe_float(item.get("stock_quantity")))
-
-            obj = ItemMaster(
+            yield ItemMaster(
                 item_code=item_code,
                 item_description=item.get("description", "") or "No Description",
                 item_upvc=item.get("upc_code", ""),
-                item_cost=cost_price,
+                item_cost=safe_float(item.get("cost_price")),
                 item_firm=item.get("manufacturer", "") or "Unknown",
-                item_price=price,
-                item_stock=stock,
+                item_price=safe_float(item.get("minimum_selling_price")),
+                item_stock=int(safe_float(item.get("stock_quantity"))),
                 uom=item.get("uom", "Nos")
             )
-            # This handles duplicates in the API source: last one wins
-            items_dict[item_code] = obj
-
-        new_items = list(items_dict.values())
-
-        if new_items:
-            # Efficient Upsert (PostgreSQL only)
-            self.stdout.write(f"Syncing {len(new_items)} unique items (Updates and New)...")
-            ItemMaster.objects.bulk_create(
-                new_items,
-                update_conflicts=True,
-                unique_fields=['item_code'],
-                update_fields=[
-                    'item_description', 'item_upvc', 'item_cost', 
-                    'item_firm', 'item_price', 'item_stock', 'uom'
-                ]
-            )
-
-        cache.clear()
-        self.stdout.write(self.style.SUCCESS(
-            f"Sync Complete. Processed {len(new_items)} items. Skipped {skipped} (ignored/empty/duplicates)."
-        ))
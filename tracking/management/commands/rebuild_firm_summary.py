@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tracking.models import FirmSummary, ItemMaster
+
+class Command(BaseCommand):
+    help = "Recompute the FirmSummary rows of every firm (the sales landing page) from the quotation lines"
+
+    def handle(self, *args, **options):
+        firms = set(ItemMaster.objects.values_list('item_firm', flat=True).distinct())
+        with transaction.atomic():
+            # Rows of firms no longer in the catalog go too
+            FirmSummary.objects.exclude(firm__in=firms).delete()
+            FirmSummary.objects.refresh(firms)
+        self.stdout.write(self.style.SUCCESS(
+            f"Firm summary rebuilt: {FirmSummary.objects.filter(open_lines__gt=0).count()} firms with open lines."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from tracking.models import LocalPurchaseBrandSummary
+
+class Command(BaseCommand):
+    help = "Recompute the per-brand Local Purchase summaries (dashboard, quick-filter counts) from the stored rows"
+
+    def handle(self, *args, **options):
+        LocalPurchaseBrandSummary.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Local Purchase summary rebuilt for {LocalPurchaseBrandSummary.objects.count()} brands."
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from tracking.models import FirmSummary, QuotationItem
+
+class Command(BaseCommand):
+    help = "Rebuild (or with --check, verify) the stored received/in-transit totals on QuotationItem"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report mismatches; exit with an error if any are found")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        batch_size = options['batch_size']
+
+        # One query: stored totals next to the totals recomputed from Shipment/Release
+        rows = QuotationItem.objects.with_computed_totals().annotate(firm=F('item__item_firm')).only(
+            'id', 'quantity_received', 'quantity_in_transit'
+        ).order_by('id')
+
+        checked = 0
+        stale = []
+        for item in rows.iterator(chunk_size=batch_size):
+            checked += 1
+            if item.quantity_received != item.computed_received or item.quantity_in_transit != item.computed_in_transit:
+                if len(stale) < 10:
+                    self.stdout.write(
+                        f"Line {item.pk}: received {item.quantity_received} -> {item.computed_received}, "
+                        f"in transit {item.quantity_in_transit} -> {item.computed_in_transit}"
+                    )
+                item.quantity_received = item.computed_received
+                item.quantity_in_transit = item.computed_in_transit
+                stale.append(item)
+
+        if check_only:
+            if stale:
+                raise CommandError(f"{len(stale)} of {checked} quotation lines have stale totals. Run without --check to fix.")
+            self.stdout.write(self.style.SUCCESS(f"All {checked} quotation lines have correct totals."))
+            return
+
+        with transaction.atomic():
+            QuotationItem.objects.bulk_update(stale, ['quantity_received', 'quantity_in_transit'], batch_size=batch_size)
+            # bulk_update sends no signals: the firm summaries built from these totals are refreshed here
+            FirmSummary.objects.refresh({item.firm for item in stale})
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} quotation lines. Fixed {len(stale)} with stale totals."
+        ))
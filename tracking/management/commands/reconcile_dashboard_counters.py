@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from tracking import metrics
+
+class Command(BaseCommand):
+    help = "Recount the admin dashboard counters from the tables, correcting any drift"
+
+    def handle(self, *args, **options):
+        counters = metrics.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Dashboard counters reconciled: {counters.total_items} items, "
+            f"{counters.draft_quotations} draft quotations, {counters.in_transit_releases} releases in transit "
+            f"({counters.overdue_releases} overdue)."
+        ))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from tracking import jobs
+
+class Command(BaseCommand):
+    help = "Worker: claim queued BackgroundJobs (stock sync, imports) and run them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run queued jobs until the queue is empty, then exit")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Job worker started.")
+        while True:
+            job = jobs.claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Running {job}...")
+            jobs.run_job(job)
+            style = self.style.SUCCESS if job.status == 'SUCCEEDED' else self.style.ERROR
+            self.stdout.write(style(f"{job}: {job.message}"))
@@ -0,0 +1,124 @@
+"""
+Admin dashboard counters, stored in the single DashboardCounters row.
+
+Writers update only what they affect: quotation saves recount the drafts,
+release writes and line rate edits add their change to the in-transit
+counters, imports add the number of items they inserted. The overdue count
+depends on the date as well, so it is recounted on the first read of each
+day. `reconcile_dashboard_counters` recounts everything (run it periodically
+to correct any drift).
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DashboardCounters, ItemMaster, Quotation, QuotationItem, Release
+
+COUNTERS_PK = 1
+
+
+def _update(**values):
+    if not DashboardCounters.objects.filter(pk=COUNTERS_PK).update(**values):
+        reconcile()
+
+
+def release_counters(today=None):
+    """In-transit count, value and overdue count of the unreceived releases, in one query."""
+    today = today or timezone.localdate()
+    value = ExpressionWrapper(F('quantity_released') * F('quotation_item__rate'),
+                              output_field=DecimalField(max_digits=16, decimal_places=2))
+    totals = Release.objects.filter(is_received=False).aggregate(
+        in_transit_releases=Count('pk'),
+        value_in_transit=Coalesce(Sum(value), Decimal('0')),
+        overdue_releases=Count('pk', filter=Q(expected_arrival_date__lt=today)),
+    )
+    return {**totals, 'overdue_as_of': today}
+
+
+def refresh_releases():
+    """Recount the in-transit counters; the daily overdue refresh and bulk writes without deltas."""
+    _update(**release_counters())
+
+
+def in_transit(releases, today=None):
+    """(count, value, overdue) of unreceived releases given as (quantity, rate, expected_arrival_date)."""
+    today = today or timezone.localdate()
+    count, value, overdue = 0, Decimal('0'), 0
+    for quantity, rate, expected_arrival_date in releases:
+        count += 1
+        value += quantity * rate
+        overdue += expected_arrival_date is not None and expected_arrival_date < today
+    return count, value, overdue
+
+
+def add_releases(count=0, value=0, overdue=0):
+    """
+    Add to the in-transit counters (negative to remove). The overdue change is
+    counted against today; if the stored overdue count is from an earlier day,
+    the next get_counters() recounts it anyway.
+    """
+    if count or value or overdue:
+        _update(in_transit_releases=F('in_transit_releases') + count,
+                value_in_transit=F('value_in_transit') + value,
+                overdue_releases=F('overdue_releases') + overdue)
+
+
+def release_changed(old, new):
+    """
+    Apply one release going from `old` to `new`, each a (line pk, quantity,
+    is_received, expected_arrival_date) state, or None before a create or
+    after a delete. Costs one rate lookup, none when neither state is in transit.
+    """
+    states = [(sign, state) for sign, state in ((-1, old), (1, new)) if state is not None and not state[2]]
+    if not states or old == new:
+        return
+    rates = dict(QuotationItem.objects.filter(pk__in={state[0] for _, state in states}).values_list('pk', 'rate'))
+    totals = [0, Decimal('0'), 0]
+    for sign, (line_id, quantity, _, expected_arrival_date) in states:
+        for i, total in enumerate(in_transit([(quantity, rates.get(line_id, Decimal('0')), expected_arrival_date)])):
+            totals[i] += sign * total
+    add_releases(*totals)
+
+
+def rate_changed(line_id, old_rate, new_rate):
+    """A line's rate edit revalues its releases in transit."""
+    if old_rate == new_rate:
+        return
+    quantity = Release.objects.filter(quotation_item_id=line_id, is_received=False).aggregate(
+        quantity=Coalesce(Sum('quantity_released'), 0))['quantity']
+    add_releases(value=quantity * (new_rate - old_rate))
+
+
+def refresh_quotations():
+    _update(draft_quotations=Quotation.objects.filter(status='DRAFT').count())
+
+
+def add_items(count):
+    """Imports report how many ItemMaster rows they inserted (negative for deletions)."""
+    if count:
+        _update(total_items=F('total_items') + count)
+
+
+def reconcile():
+    """Recount every counter from scratch. Returns the row."""
+    values = {
+        'total_items': ItemMaster.objects.count(),
+        'draft_quotations': Quotation.objects.filter(status='DRAFT').count(),
+        'reconciled_at': timezone.now(),
+        **release_counters(),
+    }
+    counters, _ = DashboardCounters.objects.update_or_create(pk=COUNTERS_PK, defaults=values)
+    return counters
+
+
+def get_counters():
+    """The counters row; the overdue count is brought up to today first if the date moved on."""
+    counters = DashboardCounters.objects.filter(pk=COUNTERS_PK).first()
+    if counters is None:
+        return reconcile()
+    if counters.overdue_as_of != timezone.localdate():
+        refresh_releases()
+        counters.refresh_from_db()
+    return counters
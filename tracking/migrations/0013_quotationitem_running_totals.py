@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-17 09:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_running_totals(apps, schema_editor):
+    QuotationItem = apps.get_model('tracking', 'QuotationItem')
+    Release = apps.get_model('tracking', 'Release')
+    Shipment = apps.get_model('tracking', 'Shipment')
+
+    received = Shipment.objects.filter(quotation_item=OuterRef('pk')).values('quotation_item').annotate(
+        total=Sum('quantity_received')).values('total')
+    in_transit = Release.objects.filter(quotation_item=OuterRef('pk'), is_received=False).values('quotation_item').annotate(
+        total=Sum('quantity_released')).values('total')
+
+    QuotationItem.objects.update(
+        quantity_received=Coalesce(Subquery(received), Value(0)),
+        quantity_in_transit=Coalesce(Subquery(in_transit), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0012_alter_localpurchaseitem_stock_sufficiency_months'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotationitem',
+            name='quantity_in_transit',
+            field=models.IntegerField(default=0, editable=False, help_text='Sum of unreceived Release quantities'),
+        ),
+        migrations.AddField(
+            model_name='quotationitem',
+            name='quantity_received',
+            field=models.IntegerField(default=0, editable=False, help_text='Sum of Shipment quantities'),
+        ),
+        migrations.RunPython(populate_running_totals, migrations.RunPython.noop),
+    ]
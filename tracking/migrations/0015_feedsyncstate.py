@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0014_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=300, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=200)),
+                ('last_modified', models.CharField(blank=True, help_text='Last-Modified header, stored verbatim', max_length=100)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
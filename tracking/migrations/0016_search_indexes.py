@@ -0,0 +1,51 @@
+# Search indexes for local_purchase_list / quotation_list (see tracking/search.py).
+# PostgreSQL gets trigram GIN expression indexes; SQLite gets an FTS5 shadow table.
+
+from django.db import migrations
+
+TRIGRAM_INDEXES = [
+    ('tracking_lpi_item_code_trgm', 'tracking_localpurchaseitem', 'item_code'),
+    ('tracking_lpi_upc_code_trgm', 'tracking_localpurchaseitem', 'upc_code'),
+    ('tracking_lpi_description_trgm', 'tracking_localpurchaseitem', 'description'),
+    ('tracking_quotation_ref_trgm', 'tracking_quotation', 'reference_number'),
+    ('tracking_quotation_supplier_trgm', 'tracking_quotation', 'supplier_name'),
+    ('tracking_itemmaster_code_trgm', 'tracking_itemmaster', 'item_code'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in TRIGRAM_INDEXES:
+            # Same expression Django emits for icontains: UPPER("col"::text) LIKE UPPER(%s)
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+            )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS tracking_localpurchaseitem_fts USING fts5("
+            "item_code, upc_code, description, "
+            "content='tracking_localpurchaseitem', content_rowid='id', tokenize='trigram')"
+        )
+        schema_editor.execute("INSERT INTO tracking_localpurchaseitem_fts(tracking_localpurchaseitem_fts) VALUES ('rebuild')")
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for name, _, _ in TRIGRAM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS tracking_localpurchaseitem_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0015_feedsyncstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0016_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='localpurchaseitem',
+            index=models.Index(fields=['brand', 'item_code', 'id'], name='tracking_lo_brand_e88042_idx'),
+        ),
+    ]
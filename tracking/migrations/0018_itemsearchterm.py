@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_existing_items(apps, schema_editor):
+    from tracking.search import item_terms
+
+    ItemMaster = apps.get_model('tracking', 'ItemMaster')
+    ItemSearchTerm = apps.get_model('tracking', 'ItemSearchTerm')
+    rows = ItemMaster.objects.values_list('pk', 'item_firm', 'item_code', 'item_upvc', 'item_description')
+    ItemSearchTerm.objects.bulk_create((
+        ItemSearchTerm(item_id=pk, firm=firm, term=term, weight=weight)
+        for pk, firm, code, upvc, description in rows.iterator(chunk_size=5000)
+        for term, weight in item_terms(code, upvc, description).items()
+    ), batch_size=5000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0017_localpurchaseitem_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firm', models.CharField(max_length=100)),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='tracking.itemmaster')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['firm', 'weight', 'term', 'item'], name='itemsearchterm_prefix_idx'), models.Index(fields=['item', 'term'], name='itemsearchterm_item_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_items, migrations.RunPython.noop),
+    ]
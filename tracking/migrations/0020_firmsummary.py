@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:20
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def build_firm_summary(apps, schema_editor):
+    """FirmSummaryManager.refresh() for every firm, written against the models as of this migration."""
+    FirmSummary = apps.get_model('tracking', 'FirmSummary')
+    QuotationItem = apps.get_model('tracking', 'QuotationItem')
+    Release = apps.get_model('tracking', 'Release')
+    Supplier = apps.get_model('tracking', 'Supplier')
+
+    confirmed = QuotationItem.objects.filter(quotation__status='CONFIRMED')
+    open_to_release = F('quantity_ordered') - F('quantity_in_transit') - F('quantity_received')
+    totals = confirmed.values('item__item_firm').annotate(
+        open_lines=Count('pk', filter=Q(quantity_ordered__gt=F('quantity_received'))),
+        in_transit_quantity=Coalesce(Sum('quantity_in_transit'), 0),
+        pending_at_factory_quantity=Coalesce(Sum(open_to_release, filter=Q(
+            quantity_ordered__gt=F('quantity_in_transit') + F('quantity_received'))), 0),
+    ).order_by()
+    arrivals = dict(
+        Release.objects.filter(is_received=False, quotation_item__quotation__status='CONFIRMED')
+        .values('quotation_item__item__item_firm').annotate(next_arrival=Min('expected_arrival_date'))
+        .values_list('quotation_item__item__item_firm', 'next_arrival').order_by()
+    )
+    logos = {supplier.name: supplier.logo.url for supplier in Supplier.objects.exclude(logo='').exclude(logo=None)}
+
+    FirmSummary.objects.bulk_create([
+        FirmSummary(
+            firm=row['item__item_firm'],
+            open_lines=row['open_lines'],
+            in_transit_quantity=row['in_transit_quantity'],
+            pending_at_factory_quantity=row['pending_at_factory_quantity'],
+            next_arrival=arrivals.get(row['item__item_firm']),
+            logo_url=logos.get(row['item__item_firm'], ''),
+        )
+        for row in totals
+        if row['item__item_firm'] and (row['open_lines'] or row['in_transit_quantity'])
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0019_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirmSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firm', models.CharField(max_length=100, unique=True)),
+                ('open_lines', models.PositiveIntegerField(default=0, help_text='Confirmed lines not fully received')),
+                ('in_transit_quantity', models.IntegerField(default=0)),
+                ('pending_at_factory_quantity', models.IntegerField(default=0, help_text='Confirmed quantity not yet released')),
+                ('next_arrival', models.DateField(blank=True, help_text='Earliest expected arrival of an unreceived release', null=True)),
+                ('logo_url', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['firm'],
+                'indexes': [models.Index(condition=models.Q(('open_lines__gt', 0)), fields=['firm'], name='firmsummary_open_idx')],
+            },
+        ),
+        migrations.RunPython(build_firm_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:24
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def reconcile_counters(apps, schema_editor):
+    """metrics.reconcile(), written against the models as of this migration."""
+    DashboardCounters = apps.get_model('tracking', 'DashboardCounters')
+    ItemMaster = apps.get_model('tracking', 'ItemMaster')
+    Quotation = apps.get_model('tracking', 'Quotation')
+    Release = apps.get_model('tracking', 'Release')
+
+    today = timezone.localdate()
+    value = ExpressionWrapper(F('quantity_released') * F('quotation_item__rate'),
+                              output_field=DecimalField(max_digits=16, decimal_places=2))
+    releases = Release.objects.filter(is_received=False).aggregate(
+        in_transit_releases=Count('pk'),
+        value_in_transit=Coalesce(Sum(value), Decimal('0')),
+        overdue_releases=Count('pk', filter=Q(expected_arrival_date__lt=today)),
+    )
+    DashboardCounters.objects.update_or_create(pk=1, defaults={
+        'total_items': ItemMaster.objects.count(),
+        'draft_quotations': Quotation.objects.filter(status='DRAFT').count(),
+        'overdue_as_of': today,
+        'reconciled_at': timezone.now(),
+        **releases,
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0020_firmsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_items', models.IntegerField(default=0)),
+                ('draft_quotations', models.IntegerField(default=0)),
+                ('in_transit_releases', models.IntegerField(default=0, help_text='Releases not yet received')),
+                ('value_in_transit', models.DecimalField(decimal_places=2, default=0, help_text='Released quantity x line rate, unreceived', max_digits=16)),
+                ('overdue_releases', models.IntegerField(default=0, help_text='Unreceived releases expected before overdue_as_of')),
+                ('overdue_as_of', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Dashboard counters',
+            },
+        ),
+        migrations.RunPython(reconcile_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0021_dashboardcounters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='release',
+            index=models.Index(fields=['container_info', 'is_received'], name='tracking_re_contain_18d7aa_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:34
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+# LocalPurchaseItem.CRITICAL_SUFFICIENCY_MONTHS and HIGH_VALUE when this migration was written
+CRITICAL_SUFFICIENCY_MONTHS = 1
+HIGH_VALUE = 5000
+
+
+def build_brand_summaries(apps, schema_editor):
+    """LocalPurchaseBrandSummaryManager.rebuild(), written against the models as of this migration."""
+    LocalPurchaseBrandSummary = apps.get_model('tracking', 'LocalPurchaseBrandSummary')
+    LocalPurchaseItem = apps.get_model('tracking', 'LocalPurchaseItem')
+    totals = LocalPurchaseItem.objects.values('brand').annotate(
+        row_count=Count('pk'),
+        critical_count=Count('pk', filter=Q(stock_sufficiency_months__lt=CRITICAL_SUFFICIENCY_MONTHS)),
+        required_count=Count('pk', filter=Q(stock_requirement__gt=0)),
+        high_value_count=Count('pk', filter=Q(value__gt=HIGH_VALUE)),
+        total_value=Coalesce(Sum('value'), Value(Decimal('0'))),
+        total_cost=Coalesce(Sum('cost'), Value(Decimal('0'))),
+        total_stock_requirement=Coalesce(Sum('stock_requirement'), 0),
+    ).order_by('brand')
+    LocalPurchaseBrandSummary.objects.bulk_create([LocalPurchaseBrandSummary(**row) for row in totals])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0022_release_container_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocalPurchaseBrandSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand', models.CharField(max_length=100, unique=True)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('critical_count', models.PositiveIntegerField(default=0, help_text='Stock sufficiency under CRITICAL_SUFFICIENCY_MONTHS')),
+                ('required_count', models.PositiveIntegerField(default=0, help_text='Stock requirement above zero')),
+                ('high_value_count', models.PositiveIntegerField(default=0, help_text='Value above HIGH_VALUE')),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_stock_requirement', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Local Purchase brand summaries',
+                'ordering': ['brand'],
+            },
+        ),
+        migrations.RunPython(build_brand_summaries, migrations.RunPython.noop),
+    ]
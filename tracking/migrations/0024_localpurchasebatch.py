@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def adopt_existing_rows(apps, schema_editor):
+    """Each brand's current rows become its first active batch."""
+    LocalPurchaseBatch = apps.get_model('tracking', 'LocalPurchaseBatch')
+    LocalPurchaseItem = apps.get_model('tracking', 'LocalPurchaseItem')
+    brands = LocalPurchaseItem.objects.order_by().values_list('brand', flat=True).distinct()
+    for brand in list(brands):
+        batch = LocalPurchaseBatch.objects.create(brand=brand, status='ACTIVE', activated_at=timezone.now())
+        LocalPurchaseItem.objects.filter(brand=brand).update(batch=batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0023_localpurchasebrandsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocalPurchaseBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand', models.CharField(db_index=True, max_length=100)),
+                ('status', models.CharField(choices=[('STAGING', 'Staging'), ('ACTIVE', 'Active'), ('RETIRED', 'Retired')], default='STAGING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Local Purchase batches',
+                'ordering': ['brand', '-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'ACTIVE')), fields=('brand',), name='one_active_batch_per_brand')],
+            },
+        ),
+        migrations.AddField(
+            model_name='localpurchaseitem',
+            name='batch',
+            field=models.ForeignKey(blank=True, help_text='Upload that loaded the row; empty for rows loaded without the importer', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='tracking.localpurchasebatch'),
+        ),
+        migrations.RunPython(adopt_existing_rows, migrations.RunPython.noop),
+    ]
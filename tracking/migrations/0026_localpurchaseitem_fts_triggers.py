@@ -0,0 +1,57 @@
+# Keep the SQLite FTS5 shadow table of migration 0016 in step with every write
+# to tracking_localpurchaseitem (admin edits, batch discards and purges), rather
+# than rebuilding it after each import. The standard external-content triggers:
+# https://www.sqlite.org/fts5.html#external_content_tables
+
+from django.db import migrations
+
+FTS_TABLE = 'tracking_localpurchaseitem_fts'
+COLUMNS = ['item_code', 'upc_code', 'description']
+
+
+def _values(prefix):
+    return ', '.join(f'{prefix}.{column}' for column in ['id', *COLUMNS])
+
+
+TRIGGERS = {
+    'tracking_lpi_fts_insert': (
+        f"AFTER INSERT ON tracking_localpurchaseitem BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(COLUMNS)}) VALUES ({_values('new')}); END"
+    ),
+    'tracking_lpi_fts_delete': (
+        f"AFTER DELETE ON tracking_localpurchaseitem BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(COLUMNS)}) VALUES ('delete', {_values('old')}); END"
+    ),
+    'tracking_lpi_fts_update': (
+        f"AFTER UPDATE ON tracking_localpurchaseitem BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(COLUMNS)}) VALUES ('delete', {_values('old')}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(COLUMNS)}) VALUES ({_values('new')}); END"
+    ),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    # Rows written since the last import's rebuild
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0025_backgroundjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
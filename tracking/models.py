@@ -1,6 +1,11 @@
-from django.db import models
+import datetime
+from decimal import Decimal
+
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db.models import Count, F, Min, Q, Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 class Supplier(models.Model):
     """Supplier/Firm with optional logo for branding."""
@@ -27,6 +32,40 @@ class ItemMaster(models.Model):
     def __str__(self):
         return f"{self.item_code} - {self.item_description[:30]}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The firm as stored, so a save that moves the item can invalidate both catalogs
+        instance._stored_item_firm = instance.__dict__.get('item_firm')
+        return instance
+
+class ItemSearchTerm(models.Model):
+    """
+    Typeahead index: the normalized code, UPC, code parts and description
+    words of an item, prefix-searched within one firm (tracking.search).
+    Maintained by tracking.search.index_items whenever items are written.
+    """
+    WEIGHT_CODE = 4
+    WEIGHT_UPC = 3
+    WEIGHT_CODE_PART = 2
+    WEIGHT_WORD = 1
+
+    item = models.ForeignKey(ItemMaster, on_delete=models.CASCADE, related_name='search_terms', db_index=False)
+    firm = models.CharField(max_length=100)
+    term = models.CharField(max_length=50)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            # One range scan per weight, already in result order: firm = .. AND weight = .. AND term >= .. ORDER BY term
+            models.Index(fields=['firm', 'weight', 'term', 'item'], name='itemsearchterm_prefix_idx'),
+            # Multi-word queries check the other words per candidate item
+            models.Index(fields=['item', 'term'], name='itemsearchterm_item_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.item_id}"
+
 class IgnoreList(models.Model):
     item_code = models.CharField(max_length=50, unique=True, help_text="Item Code to ignore during API sync")
 
@@ -61,6 +100,51 @@ class Quotation(models.Model):
     def __str__(self):
         return self.reference_number
 
+class QuotationItemQuerySet(models.QuerySet):
+    def with_computed_totals(self):
+        """
+        Annotate `computed_received` / `computed_in_transit` straight from the
+        Shipment and Release tables (one correlated subquery each), for auditing
+        and rebuilding the stored running totals.
+        """
+        received, in_transit = self._computed_totals()
+        return self.annotate(computed_received=received, computed_in_transit=in_transit)
+
+    @staticmethod
+    def _computed_totals():
+        received = Shipment.objects.filter(quotation_item=OuterRef('pk')).values('quotation_item').annotate(
+            total=Sum('quantity_received')).values('total')
+        in_transit = Release.objects.filter(quotation_item=OuterRef('pk'), is_received=False).values('quotation_item').annotate(
+            total=Sum('quantity_released')).values('total')
+        return Coalesce(Subquery(received), Value(0)), Coalesce(Subquery(in_transit), Value(0))
+
+    def with_balances(self):
+        """
+        Annotate `open_to_receive` (ordered - received) and `open_to_release`
+        (ordered - in transit - received) as SQL expressions over the stored
+        running totals, so pending lists can be filtered, ordered and paginated
+        in the database. Same values as the balance_* properties.
+        """
+        return self.annotate(
+            open_to_receive=F('quantity_ordered') - F('quantity_received'),
+            open_to_release=F('quantity_ordered') - F('quantity_in_transit') - F('quantity_received'),
+        )
+
+    def pending_release(self):
+        """Lines of confirmed quotations that still have quantity waiting at the factory."""
+        return self.with_balances().filter(quotation__status='CONFIRMED', open_to_release__gt=0)
+
+    def recalculate_totals(self):
+        """
+        Set-based recalculate_totals() for every line in the queryset: the
+        rows are locked, then one UPDATE recomputes both totals from the
+        Shipment/Release tables. For bulk writers, which bypass the signals.
+        """
+        with transaction.atomic():
+            list(self.select_for_update().values_list('pk'))
+            received, in_transit = self._computed_totals()
+            return self.update(quantity_received=received, quantity_in_transit=in_transit)
+
 class QuotationItem(models.Model):
     quotation = models.ForeignKey(Quotation, related_name='items', on_delete=models.CASCADE)
     item = models.ForeignKey(ItemMaster, on_delete=models.CASCADE)
@@ -68,25 +152,47 @@ class QuotationItem(models.Model):
     rate = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     expected_delivery_date = models.DateField(null=True, blank=True)
 
+    # Running totals maintained by recalculate_totals() whenever a Release or
+    # Shipment is saved/deleted, so pages listing many lines don't aggregate per line.
+    quantity_received = models.IntegerField(default=0, editable=False, help_text="Sum of Shipment quantities")
+    quantity_in_transit = models.IntegerField(default=0, editable=False, help_text="Sum of unreceived Release quantities")
+
+    objects = QuotationItemQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.item.item_code} in {self.quotation.reference_number}"
 
-    @property
-    def quantity_received(self):
-        return self.shipments.aggregate(total=Sum('quantity_received'))['total'] or 0
-
     @property
     def balance_quantity(self):
         return self.quantity_ordered - self.quantity_received
 
-    @property
-    def quantity_in_transit(self):
-        return self.releases.filter(is_received=False).aggregate(total=Sum('quantity_released'))['total'] or 0
-
     @property
     def balance_to_release(self):
         return self.quantity_ordered - (self.quantity_in_transit + self.quantity_received)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The rate as stored, so a rate edit can revalue the releases in transit
+        if 'rate' in field_names:
+            instance._stored_rate = instance.rate
+        return instance
+
+    def recalculate_totals(self):
+        """
+        Refresh the stored received/in-transit totals from the Shipment/Release rows.
+        Locks the line first so concurrent receipts for the same line serialize.
+        Call inside the transaction that changed the releases/shipments.
+        """
+        with transaction.atomic():
+            list(QuotationItem.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+            self.quantity_received = self.shipments.aggregate(total=Sum('quantity_received'))['total'] or 0
+            self.quantity_in_transit = self.releases.filter(is_received=False).aggregate(total=Sum('quantity_released'))['total'] or 0
+            QuotationItem.objects.filter(pk=self.pk).update(
+                quantity_received=self.quantity_received,
+                quantity_in_transit=self.quantity_in_transit,
+            )
+
 class Release(models.Model):
     quotation_item = models.ForeignKey(QuotationItem, related_name='releases', on_delete=models.CASCADE)
     quantity_released = models.IntegerField()
@@ -95,9 +201,30 @@ class Release(models.Model):
     container_info = models.CharField(max_length=100, blank=True, help_text="Truck/Container No.")
     is_received = models.BooleanField(default=False)
 
+    class Meta:
+        # Container pages and bulk receipt select a container's unreceived releases
+        indexes = [models.Index(fields=['container_info', 'is_received'])]
+
+    COUNTER_FIELDS = ('quotation_item_id', 'quantity_released', 'is_received', 'expected_arrival_date')
+
     def __str__(self):
         return f"Release {self.quantity_released} of {self.quotation_item}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The release as stored, so a save can move the dashboard counters by the difference
+        if set(cls.COUNTER_FIELDS) <= set(field_names):
+            instance._stored_state = instance.counter_state()
+        # and refresh the line it moved away from
+        if 'quotation_item_id' in field_names:
+            instance._stored_quotation_item_id = instance.quotation_item_id
+        return instance
+
+    def counter_state(self):
+        """What the in-transit counters depend on (tracking.metrics.release_changed)."""
+        return tuple(getattr(self, field) for field in self.COUNTER_FIELDS)
+
 class Shipment(models.Model):
     quotation_item = models.ForeignKey(QuotationItem, related_name='shipments', on_delete=models.CASCADE)
     quantity_received = models.IntegerField()
@@ -107,6 +234,14 @@ class Shipment(models.Model):
     def __str__(self):
         return f"Recv {self.quantity_received} for {self.quotation_item}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The line as stored, so a save moving the shipment refreshes both lines
+        if 'quotation_item_id' in field_names:
+            instance._stored_quotation_item_id = instance.quotation_item_id
+        return instance
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ('ADMIN', 'Admin'),
@@ -118,8 +253,89 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
+class LocalPurchaseBatchManager(models.Manager):
+    # Staged batches of uploads that died without cleaning up are purged after this long
+    STALE_STAGING = datetime.timedelta(days=1)
+
+    def activate(self, batch):
+        """
+        Make `batch` the live generation of its brand and retire the previous one.
+        Call inside the transaction that also updates what is derived from the rows.
+        """
+        with transaction.atomic():
+            # Serialises concurrent uploads of the same brand (no-op on SQLite, which locks the database)
+            list(self.select_for_update().filter(brand=batch.brand, status=self.model.ACTIVE).values_list('pk'))
+            self.filter(brand=batch.brand, status=self.model.ACTIVE).update(status=self.model.RETIRED)
+            # Rows loaded without the importer belong to no batch: the upload replaces them too
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {LocalPurchaseItem._meta.db_table} WHERE brand = %s AND batch_id IS NULL',
+                               [batch.brand])
+            batch.status = self.model.ACTIVE
+            batch.activated_at = timezone.now()
+            batch.save(update_fields=['status', 'activated_at'])
+
+    def purge(self, brands=None):
+        """Delete retired batches of `brands` (default: all) and stale staged ones, with their rows."""
+        stale = Q(status=self.model.RETIRED)
+        if brands is not None:
+            stale &= Q(brand__in=brands)
+        stale |= Q(status=self.model.STAGING, created_at__lt=timezone.now() - self.STALE_STAGING)
+        return self.discard(self.filter(stale))
+
+    def discard(self, batches):
+        """
+        Delete `batches` and their rows. Rows go with one raw DELETE per batch
+        rather than through the deletion collector.
+        """
+        ids = [batch.pk for batch in batches]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for pk in ids:
+                cursor.execute(f'DELETE FROM {LocalPurchaseItem._meta.db_table} WHERE batch_id = %s', [pk])
+            self.filter(pk__in=ids).delete()
+        return len(ids)
+
+class LocalPurchaseBatch(models.Model):
+    """
+    One upload of a brand's sheet. Rows are loaded into a STAGING batch while
+    readers keep seeing the ACTIVE one, then the two are switched in one
+    transaction and the RETIRED batch is purged.
+    """
+    STAGING = 'STAGING'
+    ACTIVE = 'ACTIVE'
+    RETIRED = 'RETIRED'
+    STATUS_CHOICES = [
+        (STAGING, 'Staging'),
+        (ACTIVE, 'Active'),
+        (RETIRED, 'Retired'),
+    ]
+    brand = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STAGING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LocalPurchaseBatchManager()
+
+    class Meta:
+        ordering = ['brand', '-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['brand'], condition=Q(status='ACTIVE'), name='one_active_batch_per_brand'),
+        ]
+        verbose_name_plural = "Local Purchase batches"
+
+    def __str__(self):
+        return f"{self.brand} #{self.pk} ({self.status})"
+
+class LocalPurchaseItemQuerySet(models.QuerySet):
+    def live(self):
+        """Rows readers should see: the active batch of each brand, plus rows loaded without a batch."""
+        return self.filter(Q(batch__isnull=True) | Q(batch__status=LocalPurchaseBatch.ACTIVE))
+
 class LocalPurchaseItem(models.Model):
     """Model to store Local Purchase Analysis data from Excel."""
+    # Quick filters of the list view; LocalPurchaseBrandSummary counts the same rows
+    CRITICAL_SUFFICIENCY_MONTHS = 1
+    HIGH_VALUE = 5000
+
     brand = models.CharField(max_length=100, help_text="Brand/Sheet Name (e.g., HEPWORTH)", db_index=True)
     item_code = models.CharField(max_length=50)
     upc_code = models.CharField(max_length=50, blank=True, null=True)
@@ -155,11 +371,222 @@ class LocalPurchaseItem(models.Model):
     stock_reqt_ras_stores = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    batch = models.ForeignKey(LocalPurchaseBatch, related_name='items', on_delete=models.CASCADE, null=True, blank=True,
+                              help_text="Upload that loaded the row; empty for rows loaded without the importer")
+
+    objects = LocalPurchaseItemQuerySet.as_manager()
     
     class Meta:
         ordering = ['brand', 'item_code']
+        # Serves the default keyset page: WHERE brand = .. AND (item_code, id) > (..) ORDER BY item_code, id
+        indexes = [models.Index(fields=['brand', 'item_code', 'id'])]
         verbose_name = "Local Purchase Item"
         verbose_name_plural = "Local Purchase Items"
 
     def __str__(self):
         return f"{self.brand} - {self.item_code}"
+
+    @classmethod
+    def quick_filter(cls, name):
+        """Q of a list-view quick filter ('critical', 'required', 'high-value'); None for 'all'."""
+        return {
+            'critical': Q(stock_sufficiency_months__lt=cls.CRITICAL_SUFFICIENCY_MONTHS),
+            'required': Q(stock_requirement__gt=0),
+            'high-value': Q(value__gt=cls.HIGH_VALUE),
+        }.get(name)
+
+class LocalPurchaseBrandSummaryManager(models.Manager):
+    def rebuild(self, brands=None):
+        """
+        Recompute the summaries of the given brands (default: all) from the stored
+        rows, for data loaded without the importer. Brands without rows lose theirs.
+        """
+        rows = LocalPurchaseItem.objects.live()
+        summaries = self.all()
+        if brands is not None:
+            rows = rows.filter(brand__in=brands)
+            summaries = summaries.filter(brand__in=brands)
+        totals = rows.values('brand').annotate(
+            row_count=Count('pk'),
+            critical_count=Count('pk', filter=LocalPurchaseItem.quick_filter('critical')),
+            required_count=Count('pk', filter=LocalPurchaseItem.quick_filter('required')),
+            high_value_count=Count('pk', filter=LocalPurchaseItem.quick_filter('high-value')),
+            total_value=Coalesce(Sum('value'), Value(Decimal('0'))),
+            total_cost=Coalesce(Sum('cost'), Value(Decimal('0'))),
+            total_stock_requirement=Coalesce(Sum('stock_requirement'), 0),
+        ).order_by('brand')
+        with transaction.atomic():
+            summaries.delete()
+            self.bulk_create([self.model(**row) for row in totals])
+
+class LocalPurchaseBrandSummary(models.Model):
+    """
+    Per-brand totals of the Local Purchase rows, written by the importer next to
+    the rows themselves, so the dashboard and the quick-filter counts need no scan.
+    """
+    brand = models.CharField(max_length=100, unique=True)
+    row_count = models.PositiveIntegerField(default=0)
+    critical_count = models.PositiveIntegerField(default=0, help_text="Stock sufficiency under CRITICAL_SUFFICIENCY_MONTHS")
+    required_count = models.PositiveIntegerField(default=0, help_text="Stock requirement above zero")
+    high_value_count = models.PositiveIntegerField(default=0, help_text="Value above HIGH_VALUE")
+    total_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_cost = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_stock_requirement = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = LocalPurchaseBrandSummaryManager()
+
+    class Meta:
+        ordering = ['brand']
+        verbose_name_plural = "Local Purchase brand summaries"
+
+    def __str__(self):
+        return self.brand
+
+    def count_for(self, quick_filter):
+        """Row count of the list view under a quick filter (no search)."""
+        return {
+            'critical': self.critical_count,
+            'required': self.required_count,
+            'high-value': self.high_value_count,
+        }.get(quick_filter, self.row_count)
+
+class BackgroundJob(models.Model):
+    """A long-running task (stock sync, imports) queued by a view and executed by `manage.py run_jobs`."""
+    KIND_CHOICES = [
+        ('STOCK_IMPORT', 'Stock API Sync'),
+        ('IGNORE_LIST_IMPORT', 'Ignore List Import'),
+        ('LOCAL_PURCHASE_UPLOAD', 'Local Purchase Upload'),
+    ]
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    payload = models.JSONField(default=dict, blank=True, help_text="Handler arguments (e.g. uploaded file path)")
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete (0-100)")
+    message = models.CharField(max_length=255, blank=True, help_text="Current step / final summary")
+    output = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker running the job")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('SUCCEEDED', 'FAILED')
+
+class FeedSyncState(models.Model):
+    """HTTP validators from the last successful sync of an external feed, sent back as conditional headers."""
+    url = models.URLField(max_length=300, unique=True)
+    etag = models.CharField(max_length=200, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True, help_text="Last-Modified header, stored verbatim")
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.url
+
+class FirmSummaryManager(models.Manager):
+    def refresh(self, firms):
+        """
+        Recompute the summary rows of the given firms from their confirmed
+        quotation lines. Firms left without open lines or goods in transit lose their row.
+        """
+        firms = {firm for firm in firms if firm}
+        if not firms:
+            return
+
+        confirmed = QuotationItem.objects.filter(quotation__status='CONFIRMED', item__item_firm__in=firms)
+        open_to_release = F('quantity_ordered') - F('quantity_in_transit') - F('quantity_received')
+        totals = {
+            row['item__item_firm']: row
+            for row in confirmed.values('item__item_firm').annotate(
+                open_lines=Count('pk', filter=Q(quantity_ordered__gt=F('quantity_received'))),
+                in_transit_quantity=Coalesce(Sum('quantity_in_transit'), 0),
+                pending_at_factory_quantity=Coalesce(Sum(open_to_release, filter=Q(
+                    quantity_ordered__gt=F('quantity_in_transit') + F('quantity_received'))), 0),
+            )
+        }
+        arrivals = dict(
+            Release.objects.filter(
+                is_received=False, quotation_item__quotation__status='CONFIRMED',
+                quotation_item__item__item_firm__in=firms,
+            ).values('quotation_item__item__item_firm')
+            .annotate(next_arrival=Min('expected_arrival_date'))
+            .values_list('quotation_item__item__item_firm', 'next_arrival')
+        )
+        logos = {supplier.name: supplier.logo.url for supplier in Supplier.objects.filter(name__in=firms) if supplier.logo}
+
+        rows = []
+        for firm, row in totals.items():
+            if row['open_lines'] or row['in_transit_quantity']:
+                rows.append(FirmSummary(
+                    firm=firm,
+                    open_lines=row['open_lines'],
+                    in_transit_quantity=row['in_transit_quantity'],
+                    pending_at_factory_quantity=row['pending_at_factory_quantity'],
+                    next_arrival=arrivals.get(firm),
+                    logo_url=logos.get(firm, ''),
+                ))
+        self.filter(firm__in=firms - {row.firm for row in rows}).delete()
+        self.bulk_create(
+            rows, update_conflicts=True, unique_fields=['firm'],
+            update_fields=['open_lines', 'in_transit_quantity', 'pending_at_factory_quantity', 'next_arrival', 'logo_url', 'updated_at'],
+        )
+
+class FirmSummary(models.Model):
+    """
+    Per-firm totals for the sales landing page, maintained by signals
+    (tracking/signals.py) and rebuilt in full by `rebuild_firm_summary`.
+    """
+    firm = models.CharField(max_length=100, unique=True)
+    open_lines = models.PositiveIntegerField(default=0, help_text="Confirmed lines not fully received")
+    in_transit_quantity = models.IntegerField(default=0)
+    pending_at_factory_quantity = models.IntegerField(default=0, help_text="Confirmed quantity not yet released")
+    next_arrival = models.DateField(null=True, blank=True, help_text="Earliest expected arrival of an unreceived release")
+    logo_url = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = FirmSummaryManager()
+
+    class Meta:
+        ordering = ['firm']
+        # The landing page reads exactly this: firms with open lines, by name
+        indexes = [models.Index(fields=['firm'], condition=Q(open_lines__gt=0), name='firmsummary_open_idx')]
+
+    def __str__(self):
+        return self.firm
+
+class DashboardCounters(models.Model):
+    """
+    Single row (pk=1) of admin dashboard counters, kept current by
+    tracking.metrics: signals and imports update it, `reconcile_dashboard_counters`
+    recounts everything.
+    """
+    total_items = models.IntegerField(default=0)
+    draft_quotations = models.IntegerField(default=0)
+    in_transit_releases = models.IntegerField(default=0, help_text="Releases not yet received")
+    value_in_transit = models.DecimalField(max_digits=16, decimal_places=2, default=0, help_text="Released quantity x line rate, unreceived")
+    overdue_releases = models.IntegerField(default=0, help_text="Unreceived releases expected before overdue_as_of")
+    overdue_as_of = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Dashboard counters"
+
+    def __str__(self):
+        return f"Dashboard counters (updated {self.updated_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,129 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with `WHERE (sort, id) > (last_sort, last_id) ORDER BY sort, id
+LIMIT n` instead of OFFSET, so a deep page costs the same as the first one.
+Cursors are signed, opaque strings carrying the boundary row, the sort they
+belong to and the row offset (for the "Showing X to Y" label).
+"""
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+
+CURSOR_SALT = 'tracking.pagination.cursor'
+
+
+class KeysetPage:
+    def __init__(self, object_list, start, per_page, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.start = start
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def number(self):
+        return self.start // self.per_page + 1
+
+    def start_index(self):
+        return self.start + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.start + len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate `queryset` by one field (ascending or descending) with the primary key as tie-breaker."""
+
+    def __init__(self, queryset, sort_field, descending=False, per_page=1000):
+        self.sort_field = sort_field
+        self.descending = descending
+        self.per_page = per_page
+
+        field = queryset.model._meta.get_field(sort_field)
+        if field.null:
+            # NULLs sort differently per database; compare on a non-null key instead
+            empty = '' if field.get_internal_type() in ('CharField', 'TextField') else 0
+            queryset = queryset.annotate(keyset_sort=Coalesce(F(sort_field), Value(empty)))
+            self.key = 'keyset_sort'
+        else:
+            self.key = sort_field
+        self.queryset = queryset
+
+    def _ordered(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return self.queryset.order_by(f'{prefix}{self.key}', f'{prefix}pk'), descending
+
+    def ordered(self):
+        """Every row in page order, for consumers that read the whole result (exports)."""
+        return self._ordered(reverse=False)[0]
+
+    def _boundary(self, value, pk, descending):
+        """Rows strictly after (value, pk) in the given direction."""
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{self.key}__{op}': value}) | Q(**{self.key: value, f'pk__{op}': pk})
+
+    def _cursor(self, row, start, direction):
+        value = getattr(row, self.key)
+        if isinstance(value, Decimal):
+            value = str(value)
+        return signing.dumps({
+            'k': self.sort_field, 'd': self.descending, 'v': value, 'id': row.pk, 's': start, 'dir': direction,
+        }, salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        # A cursor from another sort order is meaningless here: start over
+        if data.get('k') != self.sort_field or data.get('d') != self.descending:
+            return None
+        return data
+
+    def _window(self, cursor):
+        """(decoded cursor, queryset of the page plus one row to detect more)."""
+        data = self._decode(cursor)
+        backwards = bool(data) and data['dir'] == 'prev'
+        queryset, descending = self._ordered(reverse=backwards)
+        if data:
+            queryset = queryset.filter(self._boundary(data['v'], data['id'], descending))
+        return data, queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        data, window = self._window(cursor)
+        return self._page(data, list(window))
+
+    async def apage(self, cursor=None):
+        data, window = self._window(cursor)
+        return self._page(data, [row async for row in window])
+
+    def _page(self, data, rows):
+        backwards = bool(data) and data['dir'] == 'prev'
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            start = max(0, data['s'] - len(rows)) if more else 0
+            has_previous, has_next = more, True
+        else:
+            start = data['s'] if data else 0
+            has_previous, has_next = start > 0, more
+
+        next_cursor = self._cursor(rows[-1], start + len(rows), 'next') if rows and has_next else None
+        previous_cursor = self._cursor(rows[0], start, 'prev') if rows and has_previous else None
+        return KeysetPage(rows, start, self.per_page, has_next, has_previous, next_cursor, previous_cursor)
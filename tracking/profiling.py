@@ -0,0 +1,126 @@
+"""
+Opt-in per-request profiling (PROFILING_ENABLED).
+
+For a sample of requests (PROFILING_SAMPLE_RATE) the middleware records the
+resolved view name, wall time, database time, query count, duplicate queries
+(the same SQL run again with other parameters - the N+1 signature) and
+template render time. They are returned as a Server-Timing header, visible in
+the browser's network panel, and logged as one key=value line on the
+'tracking.profiling' logger. A view running more queries than its budget
+(PROFILING_QUERY_BUDGETS, else PROFILING_DEFAULT_QUERY_BUDGET) logs a warning
+naming its most repeated statement.
+"""
+import contextvars
+import functools
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('tracking_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.statements[sql] += 1
+
+    def server_timing(self, total_seconds):
+        return ', '.join([
+            f'app;dur={total_seconds * 1000:.1f}',
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicate"',
+            f'tpl;dur={self.template_seconds * 1000:.1f}',
+        ])
+
+
+def _instrument_templates():
+    """Time top-level renders of the Django template backend (includes render inside them)."""
+    render = django_backend.Template.render
+    if getattr(render, 'profiled', False):
+        return
+
+    @functools.wraps(render)
+    def profiled_render(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_seconds += time.perf_counter() - started
+
+    profiled_render.profiled = True
+    django_backend.Template.render = profiled_render
+
+
+class ProfilingMiddleware:
+    """Place first in MIDDLEWARE so session/auth queries are counted too."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.budgets = getattr(settings, 'PROFILING_QUERY_BUDGETS', {})
+        self.default_budget = getattr(settings, 'PROFILING_DEFAULT_QUERY_BUDGET', None)
+        _instrument_templates()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_seconds = time.perf_counter() - profile.started
+        match = request.resolver_match
+        view = match.view_name if match else '-'
+        response['Server-Timing'] = profile.server_timing(total_seconds)
+        logger.info(
+            "request view=%s method=%s status=%d total_ms=%.1f db_ms=%.1f queries=%d duplicates=%d template_ms=%.1f",
+            view, request.method, response.status_code, total_seconds * 1000, profile.db_seconds * 1000,
+            profile.queries, profile.duplicates, profile.template_seconds * 1000,
+        )
+
+        budget = self.budgets.get(view, self.default_budget)
+        if budget is not None and profile.queries > budget:
+            statement, count = profile.statements.most_common(1)[0]
+            logger.warning(
+                "query budget exceeded view=%s queries=%d budget=%d duplicates=%d most_repeated=%dx %s",
+                view, profile.queries, budget, profile.duplicates, count, statement[:200],
+            )
+        return response
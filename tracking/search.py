@@ -0,0 +1,186 @@
+"""
+Text search for the list views, picked per database vendor.
+
+PostgreSQL: plain icontains lookups, served by the trigram GIN expression
+indexes from migration 0016 (UPPER(col::text) gin_trgm_ops matches the SQL
+Django emits for icontains).
+
+SQLite: LocalPurchaseItem is searched through an FTS5 trigram shadow table
+(substring matching like icontains), kept current by the triggers of migration
+0026 on every insert, update and delete. SQLite drops triggers when it remakes
+a table, so a migration altering LocalPurchaseItem must create them again.
+Queries shorter than 3 characters - below the trigram size - and quotation
+search (a small table) use icontains.
+
+Item typeahead (every database) goes through the ItemSearchTerm prefix index,
+rebuilt for the affected rows whenever ItemMaster is written.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+
+LOCAL_PURCHASE_FTS_TABLE = 'tracking_localpurchaseitem_fts'
+TYPEAHEAD_MAX_LIMIT = 50
+TYPEAHEAD_MAX_WORDS = 4
+_TERM_LENGTH = 50
+_MAX_DESCRIPTION_WORDS = 20
+_NON_ALNUM = re.compile(r'[^0-9A-Z]+')
+# Terms only hold these characters, in this (ASCII and collation) order
+_TERM_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+class SearchBackend:
+    """icontains everywhere; the index-backed backends override what they accelerate."""
+
+    def filter_local_purchase(self, queryset, query):
+        return queryset.filter(
+            Q(item_code__icontains=query) |
+            Q(upc_code__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+    def filter_quotations(self, queryset, query):
+        """Match the reference, the supplier, or the item code of any line."""
+        from .models import QuotationItem
+
+        line_match = QuotationItem.objects.filter(quotation=OuterRef('pk'), item__item_code__icontains=query)
+        return queryset.filter(
+            Q(reference_number__icontains=query) |
+            Q(supplier_name__icontains=query) |
+            Exists(line_match)
+        )
+
+    def sync_local_purchase(self):
+        """Rebuild any shadow index from scratch; writes keep it current, so this only repairs drift."""
+
+
+class PostgresTrigramSearch(SearchBackend):
+    pass
+
+
+class SqliteFtsSearch(SearchBackend):
+    def filter_local_purchase(self, queryset, query):
+        if len(query) < 3:
+            return super().filter_local_purchase(queryset, query)
+        phrase = '"%s"' % query.replace('"', '""')
+        matches = RawSQL(
+            f"SELECT rowid FROM {LOCAL_PURCHASE_FTS_TABLE} WHERE {LOCAL_PURCHASE_FTS_TABLE} MATCH %s", [phrase]
+        )
+        return queryset.filter(id__in=matches)
+
+    def sync_local_purchase(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {LOCAL_PURCHASE_FTS_TABLE}({LOCAL_PURCHASE_FTS_TABLE}) VALUES ('rebuild')")
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresTrigramSearch()
+    if connection.vendor == 'sqlite':
+        return SqliteFtsSearch()
+    return SearchBackend()
+
+
+def normalize_term(text):
+    """Uppercase and drop punctuation/spaces, so 'hw-12' finds 'HW12/A'."""
+    return _NON_ALNUM.sub('', str(text or '').upper())[:_TERM_LENGTH]
+
+
+def item_terms(item_code, item_upvc, item_description):
+    """{term: weight} indexed for one item: whole code, UPC, code parts and description words."""
+    from .models import ItemSearchTerm
+
+    terms = {}
+
+    def add(term, weight):
+        if term and terms.get(term, 0) < weight:
+            terms[term] = weight
+
+    add(normalize_term(item_code), ItemSearchTerm.WEIGHT_CODE)
+    add(normalize_term(item_upvc), ItemSearchTerm.WEIGHT_UPC)
+    code_parts = _NON_ALNUM.split(str(item_code or '').upper())
+    if len(code_parts) > 1:
+        for part in code_parts:
+            add(part[:_TERM_LENGTH], ItemSearchTerm.WEIGHT_CODE_PART)
+    words = [w for w in _NON_ALNUM.split(str(item_description or '').upper()) if len(w) > 1]
+    for word in words[:_MAX_DESCRIPTION_WORDS]:
+        add(word[:_TERM_LENGTH], ItemSearchTerm.WEIGHT_WORD)
+    return terms
+
+
+def index_items(codes):
+    """Rebuild the typeahead terms of the ItemMaster rows with these codes. Run inside the writer's transaction."""
+    from .models import ItemMaster, ItemSearchTerm
+
+    items = list(ItemMaster.objects.filter(item_code__in=list(codes))
+                 .values_list('pk', 'item_firm', 'item_code', 'item_upvc', 'item_description'))
+    ItemSearchTerm.objects.filter(item_id__in=[row[0] for row in items]).delete()
+    rows = [
+        (pk, firm, term, weight)
+        for pk, firm, code, upvc, description in items
+        for term, weight in item_terms(code, upvc, description).items()
+    ]
+    # ~10 terms per item: a prepared executemany is several times faster than building model instances
+    table = ItemSearchTerm._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {table} (item_id, firm, term, weight) VALUES (%s, %s, %s, %s)", rows)
+
+
+def prefix_match(word):
+    """
+    Q for `term LIKE 'word%'` written as a range (term >= 'AB' AND term < 'AC'),
+    which any B-tree index can serve regardless of LIKE/collation support.
+    """
+    match = Q(term__gte=word)
+    stem = word
+    while stem and stem[-1] == _TERM_ALPHABET[-1]:
+        stem = stem[:-1]
+    if stem:
+        match &= Q(term__lt=stem[:-1] + _TERM_ALPHABET[_TERM_ALPHABET.index(stem[-1]) + 1])
+    return match
+
+
+def search_items(firm, query, limit=20):
+    """
+    Ranked ItemMaster matches for a typeahead. Every query word must prefix
+    some term of the item. Whole-code hits rank above UPC, code-part and
+    description-word hits; within a weight, terms are in index order, so
+    'PG1' lists PG1 before PG10. Each weight is one index range scan that
+    stops as soon as `limit` items are found.
+    """
+    from .models import ItemMaster, ItemSearchTerm
+
+    limit = max(1, min(int(limit), TYPEAHEAD_MAX_LIMIT))
+    items = ItemMaster.objects.filter(item_firm=firm)
+    words = [w for w in map(normalize_term, query.split()) if w][:TYPEAHEAD_MAX_WORDS]
+    if not words:
+        return list(items.order_by('item_code')[:limit])
+
+    # The longest word is the most selective: scan on it, check the others per candidate
+    driver = max(words, key=len)
+    others = list(words)
+    others.remove(driver)
+    also_matches = [
+        Exists(ItemSearchTerm.objects.filter(prefix_match(word), item_id=OuterRef('item_id')))
+        for word in others
+    ]
+
+    ids = []
+    for weight in (ItemSearchTerm.WEIGHT_CODE, ItemSearchTerm.WEIGHT_UPC,
+                   ItemSearchTerm.WEIGHT_CODE_PART, ItemSearchTerm.WEIGHT_WORD):
+        candidates = (ItemSearchTerm.objects
+                      .filter(prefix_match(driver), *also_matches, firm=firm, weight=weight)
+                      .order_by('term', 'item_id')
+                      .values_list('item_id', flat=True))
+        for item_id in candidates.iterator(chunk_size=limit):
+            if item_id not in ids:
+                ids.append(item_id)
+                if len(ids) == limit:
+                    break
+        if len(ids) == limit:
+            break
+
+    found = items.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+import weakref
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import UserProfile
+from .models import UserProfile, FirmSummary, ItemMaster, Quotation, QuotationItem, Release, Shipment, Supplier
+from .search import index_items
+from .caching import invalidate_firms
+from . import metrics
 
 @receiver(post_save, sender=User)
 def handle_user_profile(sender, instance, created, **kwargs):
@@ -16,3 +23,190 @@ def handle_user_profile(sender, instance, created, **kwargs):
     # a loop unless you save the sender (User) inside here.
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+@receiver(pre_save, sender=Release)
+@receiver(pre_save, sender=Shipment)
+def remember_quotation_item(sender, instance, **kwargs):
+    """Like remember_item_firm: look up the stored line when the instance was not loaded from the database."""
+    if not instance._state.adding and not hasattr(instance, '_stored_quotation_item_id'):
+        instance._stored_quotation_item_id = (
+            sender.objects.filter(pk=instance.pk).values_list('quotation_item_id', flat=True).first())
+
+def _movement_lines(instance):
+    """The line of a release or shipment, and the one it was moved away from (admin edits)."""
+    return {instance.quotation_item_id, getattr(instance, '_stored_quotation_item_id', None)} - {None}
+
+@receiver(post_save, sender=Release)
+@receiver(post_delete, sender=Release)
+@receiver(post_save, sender=Shipment)
+@receiver(post_delete, sender=Shipment)
+def refresh_quotation_item_totals(sender, instance, **kwargs):
+    """
+    Keep QuotationItem.quantity_received / quantity_in_transit in step with its
+    releases and shipments. Runs inside the caller's transaction, so the totals
+    commit (or roll back) together with the Release/Shipment change.
+    Bulk operations bypass signals and must call recalculate_totals() themselves.
+    """
+    for line_id in sorted(_movement_lines(instance)):  # locks in a fixed order
+        QuotationItem(pk=line_id).recalculate_totals()
+
+@receiver(pre_save, sender=ItemMaster)
+def remember_item_firm(sender, instance, **kwargs):
+    """Instances not loaded from the database (built with a pk) have no stored firm yet: look it up."""
+    if not instance._state.adding and not hasattr(instance, '_stored_item_firm'):
+        instance._stored_item_firm = (
+            ItemMaster.objects.filter(pk=instance.pk).values_list('item_firm', flat=True).first())
+
+@receiver(post_save, sender=ItemMaster)
+def refresh_item_search_terms(sender, instance, **kwargs):
+    """
+    Re-index single saves (admin, forms) and bump the catalog version of their
+    firm, and of the previous one when the item moved. Bulk upserts do both in importers.
+    """
+    index_items([instance.item_code])
+    invalidate_firms({instance.item_firm, getattr(instance, '_stored_item_firm', None)} - {None})
+    instance._stored_item_firm = instance.item_firm
+
+@receiver(post_delete, sender=ItemMaster)
+def drop_deleted_item(sender, instance, **kwargs):
+    """
+    Its search terms go with the CASCADE; the firm's cached item list must go
+    too, and its summary, since its cascaded lines can no longer name the firm.
+    """
+    invalidate_firms([instance.item_firm])
+    queue_firm_summary_refresh([instance.item_firm])
+
+@receiver(post_save, sender=ItemMaster)
+@receiver(post_delete, sender=ItemMaster)
+def count_items(sender, instance, created=False, **kwargs):
+    if created:
+        metrics.add_items(1)
+    elif kwargs['signal'] is post_delete:
+        metrics.add_items(-1)
+
+@receiver(post_save, sender=Quotation)
+@receiver(post_delete, sender=Quotation)
+def refresh_quotation_counters(sender, instance, **kwargs):
+    metrics.refresh_quotations()
+
+@receiver(pre_save, sender=Release)
+def remember_release_state(sender, instance, **kwargs):
+    """Like remember_item_firm: look up the stored release when the instance was not loaded from the database."""
+    if not instance._state.adding and not hasattr(instance, '_stored_state'):
+        instance._stored_state = (
+            Release.objects.filter(pk=instance.pk).values_list(*Release.COUNTER_FIELDS).first())
+
+@receiver(post_save, sender=Release)
+@receiver(post_delete, sender=Release)
+def refresh_release_counters(sender, instance, **kwargs):
+    """Move the in-transit counters by the difference; bulk writes in tracking.containers do it themselves."""
+    stored = getattr(instance, '_stored_state', None)
+    if kwargs['signal'] is post_delete:
+        metrics.release_changed(stored or instance.counter_state(), None)
+    else:
+        instance._stored_state = instance.counter_state()
+        metrics.release_changed(stored, instance._stored_state)
+
+@receiver(pre_save, sender=QuotationItem)
+def remember_line_rate(sender, instance, **kwargs):
+    if not instance._state.adding and not hasattr(instance, '_stored_rate'):
+        instance._stored_rate = QuotationItem.objects.filter(pk=instance.pk).values_list('rate', flat=True).first()
+
+@receiver(post_save, sender=QuotationItem)
+def revalue_line_releases(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_rate', None)
+    instance._stored_rate = Decimal(str(instance.rate))  # forms give a Decimal, the field default is a float
+    if not created and stored is not None:
+        metrics.rate_changed(instance.pk, stored, instance._stored_rate)
+
+class _FirmSummaryRefresh:
+    """
+    on_commit callback refreshing, once, the firms and the (quotation, item)
+    pairs of changed lines queued during the transaction.
+    """
+
+    def __init__(self):
+        self.firms = set()
+        self.lines = set()
+        self.done = False
+
+    def __call__(self):
+        if self.done:  # registered once per change, runs once
+            return
+        self.done = True
+        firms = set(self.firms)
+        if self.lines:
+            # Lines of quotations deleted or no longer confirmed drop out here
+            confirmed = set(Quotation.objects.filter(
+                pk__in={quotation for quotation, _ in self.lines}, status='CONFIRMED').values_list('pk', flat=True))
+            items = {item for quotation, item in self.lines if quotation in confirmed}
+            if items:
+                firms.update(ItemMaster.objects.filter(pk__in=items).values_list('item_firm', flat=True))
+        firms -= {None, ''}
+        if firms:
+            FirmSummary.objects.refresh(firms)
+
+def _queue(firms=(), lines=()):
+    """
+    Add to the refresh pending on this connection, registering it again for
+    this change, so a savepoint rollback dropping earlier registrations cannot
+    lose it. The connection only holds a weak reference: once a rollback has
+    discarded every registration, the refresh is gone and the next change starts
+    a new one. Under autocommit the refresh runs now.
+    """
+    pending = None
+    if connection.in_atomic_block:
+        ref = getattr(connection, 'pending_firm_refresh', None)
+        pending = ref() if ref else None
+    if pending is None or pending.done:
+        pending = _FirmSummaryRefresh()
+        if connection.in_atomic_block:
+            connection.pending_firm_refresh = weakref.ref(pending)
+    pending.firms.update(firms)
+    pending.lines.update(lines)
+    transaction.on_commit(pending)
+
+def queue_firm_summary_refresh(firms):
+    """Refresh the FirmSummary of `firms` when the transaction commits (now under autocommit)."""
+    firms = {firm for firm in firms if firm}
+    if firms:
+        _queue(firms=firms)
+
+@receiver(post_save, sender=Quotation)
+def refresh_quotation_firm_summaries(sender, instance, **kwargs):
+    """A status change opens or closes every line of the quotation."""
+    queue_firm_summary_refresh(
+        ItemMaster.objects.filter(quotationitem__quotation=instance).values_list('item_firm', flat=True).distinct())
+
+@receiver(pre_delete, sender=Quotation)
+def refresh_deleted_quotation_firm_summaries(sender, instance, **kwargs):
+    """Queue the firms here, while the lines still exist; the lines themselves resolve to nothing on commit."""
+    if instance.status == 'CONFIRMED':
+        refresh_quotation_firm_summaries(sender, instance)
+
+@receiver(post_save, sender=QuotationItem)
+@receiver(post_delete, sender=QuotationItem)
+def refresh_line_firm_summary(sender, instance, **kwargs):
+    """
+    Queue by ids and resolve on commit, so saving or cascade-deleting many
+    lines costs no query per line; only lines of confirmed quotations count.
+    """
+    _queue(lines=[(instance.quotation_id, instance.item_id)])
+
+@receiver(post_save, sender=Release)
+@receiver(post_delete, sender=Release)
+@receiver(post_save, sender=Shipment)
+@receiver(post_delete, sender=Shipment)
+def refresh_movement_firm_summary(sender, instance, **kwargs):
+    """
+    Registered after refresh_quotation_item_totals, so the lines' stored totals
+    are already current; the last to need the stored line, so it moves it on.
+    """
+    queue_firm_summary_refresh(QuotationItem.objects.filter(
+        pk__in=_movement_lines(instance), quotation__status='CONFIRMED').values_list('item__item_firm', flat=True))
+    instance._stored_quotation_item_id = instance.quotation_item_id
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def refresh_supplier_logo(sender, instance, **kwargs):
+    queue_firm_summary_refresh([instance.name])
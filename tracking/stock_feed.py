@@ -0,0 +1,81 @@
+"""
+HTTP access to the stock feed: one pooled, retrying session per process and
+conditional requests (ETag / Last-Modified) so an unchanged feed costs a 304.
+"""
+import time
+
+import requests
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .models import FeedSyncState
+
+_session = None
+
+
+def get_session():
+    """Process-wide session; keeps connections alive across syncs run by the same worker."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=['GET']),
+        )
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+        _session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+    return _session
+
+
+def open_feed(url, connect_timeout, read_timeout, force=False):
+    """
+    Send a (conditional) GET for the feed.
+    Returns (response, state): response is None when the server answered
+    304 Not Modified, otherwise a streaming 200 response the caller must close.
+    """
+    state, _ = FeedSyncState.objects.get_or_create(url=url)
+    headers = {}
+    if not force:
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+
+    response = get_session().get(url, headers=headers, stream=True, timeout=(connect_timeout, read_timeout))
+    if response.status_code == 304:
+        response.close()
+        return None, state
+    response.raise_for_status()
+    return response, state
+
+
+def record_check(state, response=None):
+    """Mark the feed as checked; with a fully synced `response`, keep its validators for the next request."""
+    now = timezone.now()
+    state.last_checked_at = now
+    if response is not None:
+        state.etag = response.headers.get('ETag', '')
+        state.last_modified = response.headers.get('Last-Modified', '')
+        state.last_synced_at = now
+    state.save()
+
+
+class TimedChunks:
+    """Iterates response chunks while accumulating the time spent waiting on the network."""
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        self.chunks = response.iter_content(chunk_size=chunk_size)
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def __iter__(self):
+        while True:
+            start = time.perf_counter()
+            chunk = next(self.chunks, None)
+            self.seconds += time.perf_counter() - start
+            if chunk is None:
+                return
+            self.bytes += len(chunk)
+            yield chunk
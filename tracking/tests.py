@@ -1,3 +1,1350 @@
-from django.test import TestCase
+import csv
+import datetime
+from decimal import Decimal
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+import pandas as pd
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import containers, jobs, metrics
+from .caching import catalog_version, firm_catalog_key, firm_items_json, firm_names
+from .containers import create_releases, receive_container, reschedule_container
+from .exports import iter_xlsx
+from .forms import QuotationForm
+from . import importers
+from .importers import (LOCAL_PURCHASE_COLUMNS, clean_item_upload, coerce_column, import_local_purchase_workbook,
+                        iter_json_array, local_purchase_columns, parse_local_purchase_sheets, upsert_items)
+from .models import BackgroundJob, DashboardCounters, FeedSyncState, FirmSummary, IgnoreList, ItemMaster, ItemSearchTerm, LocalPurchaseBatch, LocalPurchaseBrandSummary, LocalPurchaseItem, Manufacturer, Quotation, QuotationItem, Release, Shipment
+from .pagination import KeysetPaginator
+from .search import get_search_backend, index_items, search_items
+from .urls import urlpatterns as tracking_urlpatterns
+
+
+# Query-count tests keep the cache out of the database
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class QuotationItemTotalsTests(TestCase):
+    def setUp(self):
+        item = ItemMaster.objects.create(item_code='P-100', item_description='Gate Valve', item_firm='PEGLER')
+        quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER', status='CONFIRMED')
+        self.line = QuotationItem.objects.create(quotation=quotation, item=item, quantity_ordered=100)
+
+    def test_totals_follow_releases_and_shipments(self):
+        release = Release.objects.create(quotation_item=self.line, quantity_released=40, release_date=datetime.date.today())
+        self.line.refresh_from_db()
+        self.assertEqual((self.line.quantity_in_transit, self.line.quantity_received), (40, 0))
+        self.assertEqual(self.line.balance_to_release, 60)
+
+        release.is_received = True
+        release.save()
+        Shipment.objects.create(quotation_item=self.line, quantity_received=40, received_date=datetime.date.today())
+        self.line.refresh_from_db()
+        self.assertEqual((self.line.quantity_in_transit, self.line.quantity_received), (0, 40))
+        self.assertEqual(self.line.balance_quantity, 60)
+
+        self.line.shipments.all().delete()
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.quantity_received, 0)
+
+    def test_moving_a_release_or_shipment_refreshes_both_lines(self):
+        item = ItemMaster.objects.create(item_code='V-1', item_description='Check Valve', item_firm='VERA')
+        other = QuotationItem.objects.create(quotation=self.line.quotation, item=item, quantity_ordered=50)
+        release = Release.objects.create(quotation_item=self.line, quantity_released=40, release_date=datetime.date.today())
+        shipment = Shipment.objects.create(quotation_item=self.line, quantity_received=10, received_date=datetime.date.today())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release = Release.objects.get(pk=release.pk)
+            release.quotation_item = other
+            release.save()
+            shipment = Shipment.objects.only('pk').get(pk=shipment.pk)  # no stored line: looked up
+            shipment.quotation_item_id = other.pk
+            shipment.save()
+
+        self.assertEqual(
+            list(QuotationItem.objects.order_by('pk').values_list('quantity_in_transit', 'quantity_received')),
+            [(0, 0), (40, 10)])
+        self.assertEqual(FirmSummary.objects.get(firm='PEGLER').pending_at_factory_quantity, 100)
+        self.assertEqual(FirmSummary.objects.get(firm='VERA').in_transit_quantity, 40)
+        call_command('rebuild_quotation_totals', '--check', stdout=StringIO())
+
+    def test_rebuild_command_repairs_stale_totals(self):
+        Shipment.objects.create(quotation_item=self.line, quantity_received=25, received_date=datetime.date.today())
+        QuotationItem.objects.filter(pk=self.line.pk).update(quantity_received=0)
+        FirmSummary.objects.refresh(['PEGLER'])
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_quotation_totals', '--check', stdout=StringIO())
+
+        call_command('rebuild_quotation_totals', stdout=StringIO())
+        self.line.refresh_from_db()
+        self.assertEqual(self.line.quantity_received, 25)
+        # The firm summary is rebuilt from the repaired totals
+        self.assertEqual(FirmSummary.objects.get(firm='PEGLER').pending_at_factory_quantity, 75)
+
+    def test_pending_release_filters_in_sql(self):
+        Release.objects.create(quotation_item=self.line, quantity_released=100, release_date=datetime.date.today())
+        self.assertFalse(QuotationItem.objects.pending_release().exists())
+
+        Release.objects.filter(quotation_item=self.line).delete()
+        line = QuotationItem.objects.pending_release().get()
+        self.assertEqual(line.open_to_release, 100)
+
+
+class ItemUploadImportTests(TestCase):
+    def test_clean_and_upsert_collects_row_errors(self):
+        ItemMaster.objects.create(item_code='A1', item_description='Old', item_firm='PEGLER', item_price=12)
+        df = pd.DataFrame({
+            'Item Code': ['A1', ' B2 ', None, 'C3', 'B2'],
+            'Item Description': ['New', 'Ball Valve', 'x', 'Elbow', 'Ball Valve 2'],
+            'Firm': ['PEGLER', 'PEGLER', 'PEGLER', 'VERA', 'PEGLER'],
+            'Stock': [5, None, 1, 'lots', 7],
+            'UOM': ['Nos', 'Nos', 'Nos', 'Nos', 'Box'],
+        })
+
+        records, errors = clean_item_upload(df)
+        self.assertEqual(errors, ["Row 4: missing Item Code", "Row 5: invalid Stock value 'lots'"])
+        self.assertEqual(upsert_items(records, update_fields=['item_description', 'item_firm', 'item_stock', 'uom']), 2)
+
+        a1 = ItemMaster.objects.get(item_code='A1')
+        self.assertEqual((a1.item_description, a1.item_stock, a1.item_price), ('New', 5, 12))
+        b2 = ItemMaster.objects.get(item_code='B2')
+        self.assertEqual((b2.item_description, b2.item_stock, b2.uom), ('Ball Valve 2', 7, 'Box'))
+
+
+class BackgroundJobTests(TestCase):
+    def test_worker_runs_local_purchase_upload(self):
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            path = f.name
+        with pd.ExcelWriter(path) as writer:
+            pd.DataFrame({'CODE': ['H1', 'H2'], 'STOCK\nREQUIREMENT': [3, ' - ']}).to_excel(writer, sheet_name='HEPWORTH', index=False)
+            pd.DataFrame({'CODE': ['X1']}).to_excel(writer, sheet_name='Notes', index=False)
+
+        job = jobs.enqueue('LOCAL_PURCHASE_UPLOAD', file_path=path)
+        self.assertEqual(job.status, 'QUEUED')
+
+        call_command('run_jobs', '--once', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), ('SUCCEEDED', 100))
+        self.assertEqual(job.message, "Successfully imported 2 items from 2 sheets.")
+        self.assertEqual(
+            list(LocalPurchaseItem.objects.order_by('item_code').values_list('brand', 'item_code', 'stock_requirement')),
+            [('HEPWORTH', 'H1', 3), ('HEPWORTH', 'H2', 0)],
+        )
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_handler_marks_job_failed(self):
+        job = jobs.enqueue('LOCAL_PURCHASE_UPLOAD', file_path='/nonexistent/upload.xlsx')
+        jobs.run_job(jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_interrupted_handler_marks_job_failed_and_reraises(self):
+        def interrupted(job, progress):
+            raise KeyboardInterrupt
+
+        job = jobs.enqueue('STOCK_IMPORT')
+        with mock.patch.dict(jobs.HANDLERS, {'STOCK_IMPORT': interrupted}), self.assertRaises(KeyboardInterrupt):
+            jobs.run_job(jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message), ('FAILED', 'KeyboardInterrupt'))
+
+    def test_jobs_of_dead_workers_are_failed(self):
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        dead = BackgroundJob.objects.create(kind='STOCK_IMPORT', status='RUNNING', started_at=long_ago, heartbeat_at=long_ago)
+        legacy = BackgroundJob.objects.create(kind='STOCK_IMPORT', status='RUNNING', started_at=long_ago)
+        alive = BackgroundJob.objects.create(kind='STOCK_IMPORT', status='RUNNING', started_at=long_ago,
+                                             heartbeat_at=timezone.now())
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+        # The dashboard's poll fails the job it is waiting for, so it stops polling
+        response = self.client.get(f'/jobs/{dead.pk}/status/')
+        self.assertEqual((response.json()['status'], response.json()['finished']), ('FAILED', True))
+
+        self.assertIsNone(jobs.claim_next_job())  # the worker loop sweeps the rest
+        statuses = dict(BackgroundJob.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[job.pk] for job in (dead, legacy, alive)], ['FAILED', 'FAILED', 'RUNNING'])
+
+
+@override_settings(BACKGROUND_JOB_HEARTBEAT_SECONDS=0.02)
+class JobHeartbeatTests(TransactionTestCase):
+    """The heartbeat thread has its own connection, so the job row must be committed."""
+
+    def test_running_job_keeps_beating(self):
+        def slow(job, progress):
+            time.sleep(0.3)
+            return 'done'
+
+        job = jobs.enqueue('STOCK_IMPORT')
+        with mock.patch.dict(jobs.HANDLERS, {'STOCK_IMPORT': slow}):
+            jobs.run_job(jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+
+class StockFeedServer:
+    """
+    Local stand-in for the stock API. Serves `payload` as JSON with an ETag,
+    answers 304 to a matching If-None-Match and gzips the body when the client
+    accepts it. `requests` records the headers of every request received.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.send_header('ETag', server.etag)
+                    self.end_headers()
+                    return
+
+                body = server.body
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('ETag', server.etag)
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = server.gzipped
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                for start in range(0, len(body), 64 * 1024):
+                    self.wfile.write(body[start:start + 64 * 1024])
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/api/stock"
+
+    @property
+    def payload(self):
+        return json.loads(self.body)
+
+    @payload.setter
+    def payload(self, records):
+        # Encoded up front so serving a large feed allocates nothing per request
+        self.body = json.dumps(records).encode()
+        self.gzipped = gzip.compress(self.body)
+        self.etag = '"%s"' % hashlib.md5(self.body).hexdigest()
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def stock_record(code, firm='PEGLER', stock=10, cost='12.50'):
+    return {
+        'item_code': code, 'description': f'Item {code}', 'upc_code': f'UPC{code}', 'cost_price': cost,
+        'manufacturer': firm, 'minimum_selling_price': 20, 'stock_quantity': stock, 'uom': 'Nos',
+    }
+
+
+class StockImportTests(TestCase):
+    def run_import(self, url):
+        out = StringIO()
+        call_command('import_stock_api', '--url', url, stdout=out)
+        return out.getvalue()
+
+    def test_only_changed_rows_are_written_and_their_firms_invalidated(self):
+        IgnoreList.objects.create(item_code='IGN')
+        feed = [stock_record(f'A{i}') for i in range(5)] + [stock_record('IGN'), stock_record('V1', firm='VERA')]
+        with StockFeedServer(feed) as server:
+            self.assertIn("Inserted 6, updated 0, unchanged 0", self.run_import(server.url))
+
+            cache.set(firm_catalog_key('PEGLER'), 'cached')
+            cache.set(firm_catalog_key('VERA'), 'cached')
+            server.payload = [stock_record(f'A{i}') for i in range(5)] + [stock_record('V1', firm='VERA', stock=3)]
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertIn("Inserted 0, updated 1, unchanged 5", self.run_import(server.url))
+
+        self.assertEqual(ItemMaster.objects.get(item_code='V1').item_stock, 3)
+        self.assertFalse(ItemMaster.objects.filter(item_code='IGN').exists())
+        self.assertEqual(cache.get(firm_catalog_key('PEGLER')), 'cached')
+        self.assertIsNone(cache.get(firm_catalog_key('VERA')))
+
+    def test_half_cent_prices_round_like_the_database_and_stay_unchanged(self):
+        self.assertEqual(importers.item_fingerprint(['Tee', '', 1.005, 'PEGLER', None, 1, 'Nos']),
+                         importers.item_fingerprint(['Tee', '', Decimal('1.01'), 'PEGLER', None, 1, 'Nos']))
+        with StockFeedServer([stock_record('A1', cost='1.005'), stock_record('A2', cost='-2.675')]) as server:
+            self.assertIn("Inserted 2", self.run_import(server.url))
+            out = StringIO()
+            call_command('import_stock_api', '--url', server.url, '--force', stdout=out)
+            self.assertIn("updated 0, unchanged 2", out.getvalue())
+        self.assertEqual(list(ItemMaster.objects.order_by('item_code').values_list('item_cost', flat=True)),
+                         [Decimal('1.01'), Decimal('-2.68')])
+
+    def test_unchanged_feed_is_skipped_with_304(self):
+        with StockFeedServer([stock_record('A1'), stock_record('A2')]) as server:
+            output = self.run_import(server.url)
+            self.assertIn("Inserted 2", output)
+            self.assertEqual(server.requests[0].get('Accept-Encoding'), 'gzip, deflate')
+            self.assertNotIn('If-None-Match', server.requests[0])
+
+            ItemMaster.objects.filter(item_code='A1').update(item_stock=999)
+            self.assertIn("not modified", self.run_import(server.url))
+            self.assertEqual(server.requests[1]['If-None-Match'], server.etag)
+            self.assertEqual(ItemMaster.objects.get(item_code='A1').item_stock, 999)
+
+            # A changed feed gets a new ETag and is synced again (gzipped)
+            server.payload = [stock_record('A1', stock=4), stock_record('A2')]
+            self.assertIn("Inserted 0, updated 1, unchanged 1", self.run_import(server.url))
+            self.assertEqual(FeedSyncState.objects.get(url=server.url).etag, server.etag)
+
+            out = StringIO()
+            call_command('import_stock_api', '--url', server.url, '--force', stdout=out)
+            self.assertIn("unchanged 2", out.getvalue())
+            self.assertNotIn('If-None-Match', server.requests[-1])
+
+    def test_large_feed_is_streamed_in_bounded_batches(self):
+        def peak_memory(count):
+            with StockFeedServer([stock_record(f'S{i:06d}', firm=f'F{i % 7}') for i in range(count)]) as server:
+                tracemalloc.start()
+                try:
+                    out = StringIO()
+                    call_command('import_stock_api', '--url', server.url, '--batch-size', '500', stdout=out)
+                    return tracemalloc.get_traced_memory()[1], out.getvalue()
+                finally:
+                    tracemalloc.stop()
+
+        peak_memory(100)  # warm-up: first-run imports/caches would otherwise dominate
+        small_peak, _ = peak_memory(2000)
+        large_peak, output = peak_memory(20000)
+
+        self.assertIn("Inserted 18000, updated 0, unchanged 2000", output)
+        self.assertEqual(ItemMaster.objects.count(), 20000)
+        # 10x the feed must not mean 10x the memory: only one batch is held at a time
+        self.assertLess(large_peak, small_peak * 2)
+
+    def test_iter_json_array_handles_arbitrary_chunk_boundaries(self):
+        records = [stock_record(f'Ü{i}') for i in range(20)] + [12345]
+        raw = json.dumps(records, ensure_ascii=False).encode()
+        for size in (1, 3, 50):
+            chunks = (raw[i:i + size] for i in range(0, len(raw), size))
+            self.assertEqual(list(iter_json_array(chunks)), records)
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[{"item_code": "A"},']))
+
+
+class SearchBackendTests(TestCase):
+    def test_local_purchase_search_uses_index_after_import_sync(self):
+        LocalPurchaseItem.objects.bulk_create([
+            LocalPurchaseItem(brand='PEGLER', item_code='PG-1001', upc_code='501234', description='Gate Valve 15mm'),
+            LocalPurchaseItem(brand='PEGLER', item_code='PG-2002', description='Ball valve lever'),
+            LocalPurchaseItem(brand='PEGLER', item_code='PG-3003', description='Elbow'),
+        ])
+        backend = get_search_backend()
+        backend.sync_local_purchase()
+        items = LocalPurchaseItem.objects.filter(brand='PEGLER')
+
+        def codes(query):
+            return sorted(backend.filter_local_purchase(items, query).values_list('item_code', flat=True))
+
+        self.assertEqual(codes('VALVE'), ['PG-1001', 'PG-2002'])
+        self.assertEqual(codes('1234'), ['PG-1001'])
+        self.assertEqual(codes('20'), ['PG-2002'])  # below trigram length
+        self.assertEqual(codes('"x'), [])
+
+    def test_local_purchase_index_follows_writes_without_a_rebuild(self):
+        backend = get_search_backend()
+        items = LocalPurchaseItem.objects.all()
+
+        def codes(query):
+            return sorted(backend.filter_local_purchase(items, query).values_list('item_code', flat=True))
+
+        item = LocalPurchaseItem.objects.create(brand='PEGLER', item_code='PG-1001', description='Gate Valve')
+        batch = LocalPurchaseBatch.objects.create(brand='PEGLER')
+        LocalPurchaseItem.objects.bulk_create([
+            LocalPurchaseItem(brand='PEGLER', item_code='PG-2002', description='Check Valve', batch=batch)])
+        self.assertEqual(codes('Valve'), ['PG-1001', 'PG-2002'])
+
+        item.description = 'Elbow'
+        item.save()
+        self.assertEqual(codes('Valve'), ['PG-2002'])
+        self.assertEqual(codes('Elbow'), ['PG-1001'])
+
+        LocalPurchaseBatch.objects.discard([batch])  # raw DELETE
+        item.delete()
+        self.assertEqual(codes('Valve') + codes('Elbow'), [])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:  # raises if the index disagrees with its content table
+                cursor.execute("INSERT INTO tracking_localpurchaseitem_fts(tracking_localpurchaseitem_fts, rank) "
+                               "VALUES ('integrity-check', 1)")
+
+    def test_quotation_search_matches_line_item_codes(self):
+        item = ItemMaster.objects.create(item_code='VR-778', item_description='Pump', item_firm='VERA')
+        match = Quotation.objects.create(reference_number='Q-100', supplier_name='VERA')
+        Quotation.objects.create(reference_number='Q-200', supplier_name='PEGLER')
+        QuotationItem.objects.create(quotation=match, item=item, quantity_ordered=1)
+
+        found = get_search_backend().filter_quotations(Quotation.objects.all(), 'vr-77')
+        self.assertEqual(list(found), [match])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Repeated sort values and NULL UPCs exercise the id tie-breaker
+        LocalPurchaseItem.objects.bulk_create([
+            LocalPurchaseItem(brand='HEPWORTH', item_code=f'HW-{i:03}', upc_code=None if i % 3 else f'{i % 4}',
+                              value=i % 5, stock_requirement=i % 2)
+            for i in range(23)
+        ])
+        self.items = LocalPurchaseItem.objects.filter(brand='HEPWORTH')
+
+    def walk(self, sort_field, descending):
+        paginator = KeysetPaginator(self.items, sort_field, descending=descending, per_page=5)
+        pages = [paginator.page()]
+        while pages[-1].has_next:
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_pages_cover_every_row_once_for_each_sort(self):
+        for sort_field in ('item_code', 'upc_code', 'value'):
+            for descending in (False, True):
+                paginator, pages = self.walk(sort_field, descending)
+                seen = [item.pk for page in pages for item in page]
+                self.assertEqual(sorted(seen), sorted(self.items.values_list('pk', flat=True)))
+                self.assertEqual(len(seen), len(set(seen)))
+                self.assertEqual([page.start_index() for page in pages], [1, 6, 11, 16, 21])
+
+                # Walking back with the previous cursors returns the same pages
+                back = pages[-1]
+                for expected in reversed(pages[:-1]):
+                    back = paginator.page(back.previous_cursor)
+                    self.assertEqual([item.pk for item in back], [item.pk for item in expected])
+                    self.assertEqual(back.number, expected.number)
+                self.assertFalse(back.has_previous)
+
+    def test_list_view_pages_by_cursor_and_caches_the_count(self):
+        user = User.objects.create_superuser('admin', password='x')
+        self.client.force_login(user)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        params = {'brand': 'HEPWORTH', 'filter': 'required', 'sort': 'value', 'direction': 'desc'}
+
+        first = self.client.get('/local-purchase/list/', params, **ajax).json()
+        self.assertEqual(first['total_count'], 11)
+
+        # A tampered cursor falls back to the first page; the count comes from the cache
+        with self.assertNumQueries(3):  # session, user, rows
+            again = self.client.get('/local-purchase/list/', {**params, 'cursor': 'tampered'}, **ajax).json()
+        self.assertEqual(again, first)
+
+
+class ItemTypeaheadTests(TestCase):
+    def test_ranked_prefix_matches_follow_item_writes(self):
+        upsert_items(pd.DataFrame([
+            {'item_code': 'PG-1001', 'item_description': 'Gate valve 15mm', 'item_upvc': '5012345', 'item_firm': 'PEGLER'},
+            {'item_code': 'PG-1001A', 'item_description': 'Gate valve 22mm', 'item_upvc': '', 'item_firm': 'PEGLER'},
+            {'item_code': 'VL-77', 'item_description': 'Lever valve PG', 'item_upvc': '', 'item_firm': 'PEGLER'},
+            {'item_code': 'PG-9', 'item_description': 'Gate valve', 'item_upvc': '', 'item_firm': 'VERA'},
+        ]), ['item_description', 'item_upvc', 'item_firm'])
+
+        def codes(query, limit=20):
+            return [item.item_code for item in search_items('PEGLER', query, limit)]
+
+        # Whole-code prefixes first (shortest first), then code parts / words
+        self.assertEqual(codes('pg-10'), ['PG-1001', 'PG-1001A'])
+        self.assertEqual(codes('pg'), ['PG-1001', 'PG-1001A', 'VL-77'])
+        self.assertEqual(codes('501'), ['PG-1001'])
+        self.assertEqual(codes('gate 22'), ['PG-1001A'])
+        self.assertEqual(codes('valve', limit=1), ['PG-1001'])
+        self.assertEqual(codes(''), ['PG-1001', 'PG-1001A', 'VL-77'])
+
+        # Single saves re-index through the signal
+        item = ItemMaster.objects.get(item_code='VL-77')
+        item.item_description = 'Check valve'
+        item.save()
+        self.assertEqual(codes('lever'), [])
+        self.assertEqual(codes('check'), ['VL-77'])
+
+        self.client.force_login(User.objects.create_user('sales', password='x'))
+        response = self.client.get('/api/items/search/', {'firm': 'PEGLER', 'q': 'pg-1001a'})
+        self.assertEqual([row['item_code'] for row in response.json()['items']], ['PG-1001A'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ItemMaster.objects.create(item_code='PG-1', item_description='Valve', item_firm='PEGLER')
+        ItemMaster.objects.create(item_code='VR-1', item_description='Pump', item_firm='VERA')
+        self.client.force_login(User.objects.create_user('sales', password='x'))
+
+    def test_unchanged_firm_catalog_revalidates_with_304(self):
+        first = self.client.get('/api/items-by-firm/', {'firm': 'PEGLER'})
+        self.assertEqual([row['item_code'] for row in first.json()['items']], ['PG-1'])
+        etag = first['ETag']
+
+        with self.assertNumQueries(2):  # session and user only
+            again = self.client.get('/api/items-by-firm/', {'firm': 'PEGLER'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+
+        # An upload touching VERA leaves PEGLER's version alone; one touching PEGLER bumps it
+        records, _ = clean_item_upload(pd.DataFrame([
+            {'Item Code': 'VR-2', 'Item Description': 'Pump 2', 'Firm': 'VERA', 'Stock': 1, 'UOM': 'Nos'},
+        ]))
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_items(records, ['item_description', 'item_firm', 'item_stock', 'uom'])
+        self.assertEqual(self.client.get('/api/items-by-firm/', {'firm': 'PEGLER'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemMaster.objects.create(item_code='PG-2', item_description='Elbow', item_firm='PEGLER')
+        changed = self.client.get('/api/items-by-firm/', {'firm': 'PEGLER'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([row['item_code'] for row in changed.json()['items']], ['PG-1', 'PG-2'])
+
+    def test_typeahead_revalidates_until_the_firm_changes(self):
+        params = {'firm': 'PEGLER', 'q': 'pg'}
+        first = self.client.get('/api/items/search/', params)
+        self.assertEqual([row['item_code'] for row in first.json()['items']], ['PG-1'])
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with self.assertNumQueries(2):  # session and user only
+            again = self.client.get('/api/items/search/', params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemMaster.objects.create(item_code='PG-2', item_description='Elbow', item_firm='PEGLER')
+        changed = self.client.get('/api/items/search/', params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual([row['item_code'] for row in changed.json()['items']], ['PG-1', 'PG-2'])
+
+    def test_moving_or_deleting_an_item_invalidates_its_firms(self):
+        etags = {firm: self.client.get('/api/items-by-firm/', {'firm': firm})['ETag'] for firm in ['PEGLER', 'VERA']}
+
+        def revalidate(firm):
+            return self.client.get('/api/items-by-firm/', {'firm': firm}, HTTP_IF_NONE_MATCH=etags[firm])
+
+        item = ItemMaster.objects.get(item_code='PG-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            item.item_firm = 'VERA'
+            item.save()
+        for firm, codes in [('PEGLER', []), ('VERA', ['PG-1', 'VR-1'])]:
+            response = revalidate(firm)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([row['item_code'] for row in response.json()['items']], codes)
+            etags[firm] = response['ETag']
+        self.assertEqual(list(search_items('PEGLER', 'PG-1')), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        response = revalidate('VERA')
+        self.assertEqual([row['item_code'] for row in response.json()['items']], ['VR-1'])
+        self.assertFalse(ItemSearchTerm.objects.filter(term='PG1').exists())
+
+    def test_quotation_form_firms_are_cached_per_catalog_version(self):
+        self.assertEqual(firm_names(), ['PEGLER', 'VERA'])
+        with self.assertNumQueries(0):
+            QuotationForm()
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemMaster.objects.create(item_code='AL-1', item_description='Tap', item_firm='ALBION')
+        self.assertEqual(firm_names(), ['ALBION', 'PEGLER', 'VERA'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='x')
+        self.admin.profile.role = 'ADMIN'
+        self.admin.profile.save()
+        self.sales = User.objects.create_user('sales', password='x')
+        ItemMaster.objects.create(item_code='PG-1', item_description='Valve', item_firm='PEGLER')
+        LocalPurchaseItem.objects.bulk_create([
+            LocalPurchaseItem(brand='PEGLER', item_code=f'PG-{n}', stock_requirement=n) for n in range(3)])
+        self.quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER')
+
+    async def test_async_views_check_roles_and_serve_json(self):
+        ajax = {'X-Requested-With': 'XMLHttpRequest'}
+        rows = {'brand': 'PEGLER', 'filter': 'required'}
+
+        await self.async_client.aforce_login(self.sales)
+        response = await self.async_client.get('/local-purchase/list/', rows, headers=ajax)
+        self.assertEqual(response.status_code, 302)
+        first = await self.async_client.get('/api/items-by-firm/', {'firm': 'PEGLER'})
+        self.assertEqual([row['item_code'] for row in first.json()['items']], ['PG-1'])
+        again = await self.async_client.get('/api/items-by-firm/', {'firm': 'PEGLER'},
+                                            headers={'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get('/local-purchase/list/', rows, headers=ajax)
+        self.assertEqual(response.json()['total_count'], 2)
+        response = await self.async_client.post(f'/quotation/{self.quotation.pk}/update-status/',
+                                                {'status': 'CONFIRMED'}, content_type='application/json')
+        self.assertEqual(response.json(), {'success': True})
+        self.assertEqual((await Quotation.objects.aget(pk=self.quotation.pk)).status, 'CONFIRMED')
+
+    async def test_exports_stream_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.admin)
+        params = {'brand': 'PEGLER', 'format': 'csv'}
+        response = await self.async_client.get('/local-purchase/export/', params)
+        self.assertTrue(response.is_async)  # a sync iterator would be read whole before sending
+        body = b''.join([chunk async for chunk in response.streaming_content])
+
+        await self.client.aforce_login(self.admin)
+        sync_response = await sync_to_async(self.client.get)('/local-purchase/export/', params)
+        self.assertFalse(sync_response.is_async)
+        self.assertEqual(body, await sync_to_async(b''.join)(sync_response.streaming_content))
+        self.assertEqual(body.decode('utf-8-sig').count('PG-'), 3)
+
+
+# Runs in a separate interpreter: the same settings, pointed at the test's cache directory
+CACHE_WORKER = """
+import sys, django
+django.setup()
+from django.core.cache import cache
+from tracking.caching import catalog_version, firm_catalog_key, invalidate_firms
+if sys.argv[1] == 'read':
+    print(cache.get(firm_catalog_key('PEGLER')))
+else:
+    invalidate_firms(['PEGLER'])
+    print(catalog_version('PEGLER'))
+"""
+
+
+class SharedCacheTests(TestCase):
+    """Several worker processes sharing one file-based cache, as gunicorn workers share CACHE_URL."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        settings = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir,
+        }})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        ItemMaster.objects.create(item_code='PG-1', item_description='Valve', item_firm='PEGLER')
+
+    def start_workers(self, action, count):
+        env = {**os.environ, 'CACHE_URL': f'filecache://{self.cache_dir}'}
+        return [
+            subprocess.Popen([sys.executable, '-c', CACHE_WORKER, action], env=env, cwd=os.getcwd(),
+                             stdout=subprocess.PIPE, text=True)
+            for _ in range(count)
+        ]
+
+    def outputs(self, workers):
+        return [worker.communicate(timeout=60)[0].strip() for worker in workers]
+
+    def test_one_version_bump_is_seen_by_every_worker(self):
+        body = firm_items_json('PEGLER')
+        before = catalog_version('PEGLER')
+
+        # Other processes read what this one cached
+        self.assertEqual(self.outputs(self.start_workers('read', 2)), [body, body])
+
+        # Concurrent bumps from several processes: each one is a single write of a fresh token
+        bumped = self.outputs(self.start_workers('bump', 4))
+        after = catalog_version('PEGLER')
+        self.assertNotEqual(after, before)
+        self.assertIn(after, bumped)
+
+        # Every worker now misses the old entry
+        self.assertEqual(self.outputs(self.start_workers('read', 2)), ['None', 'None'])
+        self.assertIsNone(cache.get(firm_catalog_key('PEGLER')))
+
+
+class ConfiguredCacheTests(TestCase):
+    """The CACHES setting as deployed (a database table unless CACHE_URL says otherwise)."""
+
+    def test_search_counts_do_not_cull_catalog_versions(self):
+        version = catalog_version('PEGLER')
+        cache.set_many({f'lp:count:{n}': n for n in range(1000)}, 600)
+        self.assertEqual(catalog_version('PEGLER'), version)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FirmSummaryTests(TestCase):
+    def setUp(self):
+        self.item = ItemMaster.objects.create(item_code='P-100', item_description='Gate Valve', item_firm='PEGLER')
+        self.quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER')
+        self.line = QuotationItem.objects.create(quotation=self.quotation, item=self.item, quantity_ordered=100)
+
+    def summary(self):
+        return FirmSummary.objects.filter(firm='PEGLER').values_list(
+            'open_lines', 'in_transit_quantity', 'pending_at_factory_quantity', 'next_arrival').first()
+
+    def test_summary_follows_status_releases_and_shipments(self):
+        self.assertIsNone(self.summary())  # drafts are not open orders
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quotation.status = 'CONFIRMED'
+            self.quotation.save()
+        self.assertEqual(self.summary(), (1, 0, 100, None))
+
+        arrival = datetime.date(2026, 3, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            release = Release.objects.create(quotation_item=self.line, quantity_released=40,
+                                             release_date=datetime.date.today(), expected_arrival_date=arrival)
+        self.assertEqual(self.summary(), (1, 40, 60, arrival))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release.is_received = True
+            release.save()
+            Shipment.objects.create(quotation_item=self.line, quantity_received=100, received_date=datetime.date.today())
+        self.assertIsNone(self.summary())
+
+        # The full rebuild agrees with the incremental updates
+        with self.captureOnCommitCallbacks(execute=True):
+            Shipment.objects.all().delete()
+        FirmSummary.objects.all().delete()
+        call_command('rebuild_firm_summary', stdout=StringIO())
+        self.assertEqual(self.summary(), (1, 0, 100, None))
+
+    def test_one_refresh_per_transaction_and_none_for_drafts(self):
+        items = [ItemMaster(item_code=f'P-{n}', item_description='Tee', item_firm='PEGLER') for n in range(20)]
+        items = ItemMaster.objects.bulk_create(items)
+        refresh = mock.patch.object(FirmSummary.objects, 'refresh', wraps=FirmSummary.objects.refresh)
+
+        with refresh as calls, self.captureOnCommitCallbacks(execute=True):
+            for item in items:
+                QuotationItem.objects.create(quotation=self.quotation, item=item, quantity_ordered=5)
+        self.assertEqual(calls.call_count, 0)  # the quotation is a draft
+
+        with refresh as calls, self.captureOnCommitCallbacks(execute=True):
+            self.quotation.status = 'CONFIRMED'
+            self.quotation.save()
+            for line in self.quotation.items.select_related('quotation', 'item'):
+                line.quantity_ordered += 1
+                line.save()
+        calls.assert_called_once_with({'PEGLER'})
+        self.assertEqual(self.summary()[0], 21)
+
+        with refresh as calls, self.captureOnCommitCallbacks(execute=True):
+            self.quotation.delete()
+        calls.assert_called_once_with({'PEGLER'})
+        self.assertIsNone(self.summary())
+
+    def test_refresh_survives_a_rolled_back_savepoint(self):
+        self.quotation.status = 'CONFIRMED'
+        self.quotation.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.line.quantity_ordered = 50
+                    self.line.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            Release.objects.create(quotation_item=self.line, quantity_released=40, release_date=datetime.date.today())
+        self.assertEqual(self.summary(), (1, 40, 60, None))
+
+    def test_cascading_an_item_delete_costs_no_query_per_line(self):
+        self.quotation.status = 'CONFIRMED'
+        self.quotation.save()
+
+        def delete_item_with_lines(count):
+            item = ItemMaster.objects.create(item_code=f'P-{count}', item_description='Tee', item_firm='PEGLER')
+            QuotationItem.objects.bulk_create(
+                QuotationItem(quotation=self.quotation, item=item, quantity_ordered=1) for _ in range(count))
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                item.delete()
+            return len(queries)
+
+        self.assertEqual(delete_item_with_lines(2), delete_item_with_lines(20))
+        self.assertEqual(self.summary()[0], 1)
+
+    def test_sales_landing_is_one_summary_read(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.quotation.status = 'CONFIRMED'
+            self.quotation.save()
+        self.client.force_login(User.objects.create_user('sales', password='x'))  # profile defaults to SALESMAN
+
+        with self.assertNumQueries(4):  # session, user, profile (sales_required), firm summary
+            response = self.client.get('/sales/')
+        self.assertContains(response, 'PEGLER')
+        self.assertEqual([firm.open_lines for firm in response.context['firms']], [1])
+
+
+class DashboardCountersTests(TestCase):
+    def counters(self):
+        return DashboardCounters.objects.values_list(
+            'total_items', 'draft_quotations', 'in_transit_releases', 'value_in_transit', 'overdue_releases').get()
+
+    def test_counters_follow_writes_and_match_reconcile(self):
+        metrics.reconcile()
+        item = ItemMaster.objects.create(item_code='P-100', item_description='Gate Valve', item_firm='PEGLER')
+        records, _ = clean_item_upload(pd.DataFrame([
+            {'Item Code': 'P-100', 'Item Description': 'Gate Valve', 'Firm': 'PEGLER', 'Stock': 1, 'UOM': 'Nos'},
+            {'Item Code': 'P-200', 'Item Description': 'Check Valve', 'Firm': 'PEGLER', 'Stock': 1, 'UOM': 'Nos'},
+        ]))
+        upsert_items(records, ['item_description', 'item_firm', 'item_stock', 'uom'])
+        quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER')
+        line = QuotationItem.objects.create(quotation=quotation, item=item, quantity_ordered=100, rate=2.5)
+        release = Release.objects.create(quotation_item=line, quantity_released=40, release_date=datetime.date.today(),
+                                         expected_arrival_date=datetime.date.today() - datetime.timedelta(days=1))
+        self.assertEqual(self.counters(), (2, 1, 1, 100, 1))
+
+        quotation.status = 'CONFIRMED'
+        quotation.save()
+        release.is_received = True
+        release.save()
+        self.assertEqual(self.counters(), (2, 0, 0, 0, 0))
+
+        ItemMaster.objects.filter(item_code='P-200').get().delete()
+        expected = self.counters()
+        metrics.reconcile()
+        self.assertEqual(self.counters(), expected)
+
+    def test_release_writes_apply_deltas_that_match_reconcile(self):
+        metrics.reconcile()
+        item = ItemMaster.objects.create(item_code='P-100', item_description='Gate Valve', item_firm='PEGLER')
+        quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER', status='CONFIRMED')
+        line = QuotationItem.objects.create(quotation=quotation, item=item, quantity_ordered=100, rate=2.5)
+        other = QuotationItem.objects.create(quotation=quotation, item=item, quantity_ordered=100, rate=4)
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+
+        def assert_matches_reconcile(expected):
+            self.assertEqual(self.counters()[2:], expected)
+            metrics.reconcile()
+            self.assertEqual(self.counters()[2:], expected)
+
+        with mock.patch.object(metrics, 'release_counters', wraps=metrics.release_counters) as recounts:
+            release = Release.objects.create(quotation_item=line, quantity_released=40,
+                                             release_date=datetime.date.today(), expected_arrival_date=yesterday)
+            release.quantity_released = 30
+            release.save()
+            self.assertEqual(recounts.call_count, 0)
+        assert_matches_reconcile((1, 75, 1))
+
+        line = QuotationItem.objects.get(pk=line.pk)
+        line.rate = Decimal('3.00')  # a rate edit revalues what is in transit
+        line.save()
+        assert_matches_reconcile((1, 90, 1))
+
+        release = Release.objects.get(pk=release.pk)
+        release.quotation_item = other
+        release.expected_arrival_date = None
+        release.save()
+        create_releases({line.pk: 10}, datetime.date.today(), yesterday, container_info='C-1')
+        assert_matches_reconcile((2, 150, 1))
+
+        reschedule_container('C-1', datetime.date.today() + datetime.timedelta(days=7))
+        assert_matches_reconcile((2, 150, 0))
+        receive_container('C-1', datetime.date.today())
+        assert_matches_reconcile((1, 120, 0))
+        Release.objects.get(pk=release.pk).delete()
+        assert_matches_reconcile((0, 0, 0))
+
+    def test_dashboard_reads_one_counters_row(self):
+        metrics.reconcile()
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+        # session, user, profile (admin_required), jobs, recent quotations, counters
+        with self.assertNumQueries(6):
+            response = self.client.get('/')
+        self.assertEqual(response.context['counters'].total_items, 0)
+
+
+class ContainerTests(TestCase):
+    def setUp(self):
+        self.quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER', status='CONFIRMED')
+        self.lines = [
+            QuotationItem.objects.create(
+                quotation=self.quotation, quantity_ordered=100, rate=2,
+                item=ItemMaster.objects.create(item_code=f'P-{n}', item_description='Valve', item_firm='PEGLER'))
+            for n in range(4)
+        ]
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+    def release_all(self, container):
+        data = {'release_date': '2026-01-05', 'expected_arrival_date': '2026-02-01', 'container_info': container}
+        data.update({f'line_{line.pk}': 30 for line in self.lines})
+        return self.client.post(f'/quotation/{self.quotation.pk}/release/', data)
+
+    def test_release_receive_and_reschedule_a_container(self):
+        self.assertEqual(self.release_all('CONT-1').status_code, 302)
+        self.assertEqual([line.quantity_in_transit for line in QuotationItem.objects.order_by('pk')], [30] * 4)
+        self.assertEqual(FirmSummary.objects.get(firm='PEGLER').in_transit_quantity, 120)
+        self.assertEqual(DashboardCounters.objects.get().in_transit_releases, 4)
+
+        response = self.client.get('/containers/', {'container': 'CONT-1'})
+        self.assertEqual([c['releases'] for c in response.context['containers']], [4])
+        self.assertEqual(len(response.context['releases']), 4)
+
+        self.client.post('/containers/reschedule/', {'container': 'CONT-1', 'expected_arrival_date': '2026-03-01'})
+        self.assertEqual(FirmSummary.objects.get(firm='PEGLER').next_arrival, datetime.date(2026, 3, 1))
+
+        keep = Release.objects.filter(quotation_item=self.lines[0]).get()
+        selected = Release.objects.exclude(pk=keep.pk).values_list('pk', flat=True)
+        self.client.post('/containers/receive/', {'container': 'CONT-1', 'received_date': '2026-03-02',
+                                                 'release': list(selected)})
+        self.assertEqual(
+            list(QuotationItem.objects.order_by('pk').values_list('quantity_in_transit', 'quantity_received')),
+            [(30, 0), (0, 30), (0, 30), (0, 30)],
+        )
+        self.assertEqual(Shipment.objects.count(), 3)
+        self.assertEqual(DashboardCounters.objects.get().in_transit_releases, 1)
+
+        # Bulk writes leave the same totals the per-row signals would have
+        call_command('rebuild_quotation_totals', '--check', stdout=StringIO())
+
+    def test_receipt_cost_does_not_grow_with_the_container(self):
+        self.release_all('CONT-1')
+        self.release_all('CONT-2')
+        Release.objects.filter(container_info='CONT-2', quotation_item__in=self.lines[1:]).delete()
+
+        counts = []
+        for container in ('CONT-1', 'CONT-2'):
+            releases = list(Release.objects.filter(container_info=container).values_list('pk', flat=True))
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post('/containers/receive/', {
+                    'container': container, 'received_date': '2026-03-02', 'release': releases,
+                })
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_receipt_rejects_releases_outside_the_container(self):
+        self.release_all('CONT-1')
+        other = Release.objects.create(quotation_item=self.lines[0], quantity_released=1,
+                                       release_date=datetime.date(2026, 1, 5), container_info='CONT-2')
+        for selected in (['abc'], [other.pk]):
+            response = self.client.post('/containers/receive/', {
+                'container': 'CONT-1', 'received_date': '2026-03-02', 'release': selected}, follow=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'no longer open in this container')
+        self.assertFalse(Release.objects.filter(is_received=True).exists())
+
+    def test_bulk_release_rechecks_balances_under_lock(self):
+        # Another release of the line commits after the form validated against 100
+        def release_concurrently(*args, **kwargs):
+            Release.objects.create(quotation_item=self.lines[0], quantity_released=90,
+                                   release_date=datetime.date(2026, 1, 5))
+            return original(*args, **kwargs)
+
+        original = containers.create_releases
+        with mock.patch.object(containers, 'create_releases', release_concurrently):
+            response = self.release_all('CONT-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Only 10 of P-0 is left to release.')
+        self.assertFalse(Release.objects.filter(container_info='CONT-1').exists())
+        with self.assertRaisesMessage(ValueError, 'Only 10 of P-0'):
+            create_releases({self.lines[0].pk: 11}, datetime.date(2026, 1, 5))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+    def test_off_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_QUERY_BUDGETS={'dashboard': 2})
+    def test_timings_header_log_line_and_budget_warning(self):
+        with self.assertLogs('tracking.profiling') as logs:
+            response = self.client.get('/')
+
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, \d+ duplicate", tpl;dur=[\d.]+$')
+        self.assertRegex(logs.output[0], r'view=dashboard method=GET status=200 .* queries=\d+')
+        self.assertIn('query budget exceeded view=dashboard', logs.output[1])
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_profiled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_data_is_consistent_with_the_derived_tables(self):
+        call_command('generate_synthetic_data', firms=3, items=60, quotations=10, lines=4, releases=30,
+                     shipments=10, local_purchase=50, stdout=StringIO())
+        self.assertEqual(ItemMaster.objects.count(), 60)
+        self.assertEqual(Release.objects.filter(is_received=True).count(), Shipment.objects.count())
+        self.assertEqual(Shipment.objects.count(), 10)
+        call_command('rebuild_quotation_totals', '--check', stdout=StringIO())
+
+        counters = DashboardCounters.objects.get()
+        self.assertEqual(counters.total_items, 60)
+        self.assertEqual(counters.in_transit_releases, Release.objects.filter(is_received=False).count())
+
+        # --clear replaces the previous run instead of adding to it
+        call_command('generate_synthetic_data', firms=3, items=60, quotations=10, local_purchase=50,
+                     clear=True, stdout=StringIO())
+        self.assertEqual((ItemMaster.objects.count(), Quotation.objects.count(), LocalPurchaseItem.objects.count()),
+                         (60, 10, 50))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryCountScalingTests(TestCase):
+    """
+    Every GET in tracking/urls.py runs as many queries with 5 rows per
+    collection as with 500: a count that grows with the data is an N+1.
+    """
+    SMALL, LARGE = 5, 500
+    # State-changing on GET, or POST-only
+    SKIP = {'logout', 'run_stock_import', 'receive_container', 'reschedule_container'}
+
+    def seed(self, tag, size):
+        """`size` of everything (items, lines per quotation, quotations, releases, ...), bulk inserted."""
+        manufacturers = Manufacturer.objects.bulk_create([Manufacturer(name=f'{tag} Group {n}') for n in range(size)])
+        items = ItemMaster.objects.bulk_create([
+            ItemMaster(item_code=f'{tag}-{n}', item_description=f'Gate Valve {n}', item_firm='PEGLER')
+            for n in range(size)
+        ])
+        confirmed = Quotation.objects.create(reference_number=f'{tag}-CONFIRMED', supplier_name='PEGLER',
+                                             status='CONFIRMED', manufacturer=manufacturers[0])
+        draft = Quotation.objects.create(reference_number=f'{tag}-DRAFT', supplier_name='PEGLER',
+                                         manufacturer=manufacturers[0])
+        Quotation.objects.bulk_create([
+            Quotation(reference_number=f'{tag}-Q{n}', supplier_name='PEGLER', manufacturer=manufacturer)
+            for n, manufacturer in enumerate(manufacturers)
+        ])
+        lines = QuotationItem.objects.bulk_create(
+            [QuotationItem(quotation=quotation, item=item, quantity_ordered=100, rate=5)
+             for quotation in (confirmed, draft) for item in items])
+        confirmed_lines = [line for line in lines if line.quotation_id == confirmed.pk]
+        today = datetime.date.today()
+        releases = Release.objects.bulk_create(
+            [Release(quotation_item=line, quantity_released=10, release_date=today, container_info=f'{tag}-C',
+                     expected_arrival_date=today) for line in confirmed_lines]
+            + [Release(quotation_item=line, quantity_released=20, release_date=today, is_received=True)
+               for line in confirmed_lines])
+        Shipment.objects.bulk_create([Shipment(quotation_item=line, quantity_received=20, received_date=today)
+                                      for line in confirmed_lines])
+        LocalPurchaseItem.objects.bulk_create([
+            LocalPurchaseItem(brand='PEGLER', item_code=f'{tag}-{n}', description=f'Gate Valve {n}')
+            for n in range(size)
+        ])
+        BackgroundJob.objects.bulk_create([BackgroundJob(kind='STOCK_IMPORT') for _ in range(size)])
+
+        QuotationItem.objects.filter(quotation__in=[confirmed, draft]).recalculate_totals()
+        index_items([item.item_code for item in items])
+        FirmSummary.objects.refresh(['PEGLER'])
+        metrics.reconcile()
+        get_search_backend().sync_local_purchase()
+        LocalPurchaseBrandSummary.objects.rebuild()
+
+        quotation_kwargs = {'pk': confirmed.pk}
+        self.path_kwargs = {
+            'quotation_detail': quotation_kwargs, 'update_quotation_status': quotation_kwargs,
+            'release_quotation': quotation_kwargs,
+            'edit_quotation': {'pk': draft.pk}, 'delete_quotation': {'pk': draft.pk},
+            'release_item': {'pk': confirmed_lines[0].pk}, 'receive_item': {'pk': confirmed_lines[0].pk},
+            'receive_release': {'pk': releases[0].pk},
+            'manufacturer_edit': {'pk': manufacturers[0].pk}, 'manufacturer_delete': {'pk': manufacturers[0].pk},
+            'job_status': {'pk': BackgroundJob.objects.values_list('pk', flat=True).first()},
+        }
+        self.query_strings = {
+            'quotation_list': [{}, {'search': tag}],
+            'sales_firm_track': [{'firm': 'PEGLER'}],
+            'sales_firm_export': [{'firm': 'PEGLER'}],
+            'get_items_by_firm': [{'firm': 'PEGLER'}],
+            'item_typeahead': [{'firm': 'PEGLER', 'q': 'valve'}],
+            'container_list': [{}, {'container': f'{tag}-C'}],
+            'local_purchase_list': [{'brand': 'PEGLER'}, {'brand': 'PEGLER', 'search': 'valve'}],
+            'local_purchase_export': [{'brand': 'PEGLER', 'format': 'xlsx'},
+                                      {'brand': 'PEGLER', 'format': 'csv', 'search': 'valve'}],
+        }
+
+    def query_counts(self):
+        counts = {}
+        for pattern in tracking_urlpatterns:
+            if pattern.name in self.SKIP:
+                continue
+            kwargs = self.path_kwargs.get(pattern.name)
+            if pattern.pattern.converters and kwargs is None:
+                self.fail(f"No sample row for '{pattern.name}': add it to QueryCountScalingTests.seed")
+            path = reverse(pattern.name, kwargs=kwargs)
+            for params in self.query_strings.get(pattern.name, [{}]):
+                self.client.get(path, params)  # fill the caches first
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(path, params)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertEqual(response.status_code, 200, f"{path} {params}")
+                counts[f"{pattern.name}?{'&'.join(sorted(params))}"] = len(queries)
+        return counts
+
+    def test_query_counts_do_not_grow_with_the_data(self):
+        cache.clear()
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+        self.seed('S', self.SMALL)
+        small = self.query_counts()
+        self.seed('L', self.LARGE)
+        large = self.query_counts()
+
+        grown = {view: f"{small[view]} -> {large[view]}" for view in small if large[view] != small[view]}
+        self.assertEqual(grown, {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LocalPurchaseColumnTests(TestCase):
+    def test_coercion_per_column_kind(self):
+        df = pd.DataFrame({
+            'code': [123.0, None, ' AB-1 ', 7.5],
+            'int': [-2.7, 2.7, float('inf'), ' - '],
+            'float': [0.96, float('nan'), float('-inf'), '1.25'],
+            'text': ['Gate valve', None, 5, float('nan')],
+        })
+        self.assertEqual(coerce_column(df, 'code', 'code'), ['123', '', 'AB-1', '7.5'])
+        # Fractions are truncated toward zero; NaN, inf and filler text become 0
+        self.assertEqual(coerce_column(df, 'int', 'int'), [-2, 2, 0, 0])
+        self.assertEqual(coerce_column(df, 'float', 'float'), [0.96, 0.0, 0.0, 1.25])
+        self.assertEqual(coerce_column(df, 'float', 'float', places=1), [1.0, 0.0, 0.0, 1.2])
+        self.assertEqual(coerce_column(df, 'text', 'text'), ['Gate valve', '', '5', ''])
+
+        for kind, default in [('int', 0), ('float', 0.0), ('code', ''), ('text', '')]:
+            self.assertEqual(coerce_column(df, 'missing', kind), [default] * 4)
+
+    def test_sheet_columns_round_to_the_model_places(self):
+        columns = local_purchase_columns(pd.DataFrame({
+            'CODE': [1001, 1002],
+            'STOCK Sufficiency Month': [0.96, 2.04],
+            'VALUE': [10.006, -3.333],
+        }))
+        self.assertEqual(set(columns), {field for _, field, _ in LOCAL_PURCHASE_COLUMNS})
+        self.assertEqual(columns['item_code'], ['1001', '1002'])
+        self.assertEqual(columns['stock_sufficiency_months'], [1.0, 2.0])
+        self.assertEqual(columns['value'], [10.01, -3.33])
+        self.assertEqual(columns['stock_requirement'], [0, 0])
+        self.assertEqual(columns['description'], ['', ''])
+
+
+class LocalPurchaseSummaryTests(TestCase):
+    def import_sheet(self):
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            path = f.name
+        self.addCleanup(os.remove, path)
+        pd.DataFrame({
+            'CODE': ['H1', 'H2', 'H3', 'H4'],
+            # 0.96 is rounded to 1.0 (one decimal place) on import: not critical
+            'STOCK Sufficiency Month': [0.5, 0.96, 0.94, ' - '],
+            'STOCK\nREQUIREMENT': [3, 0, -2, 10],
+            'VALUE': [6000, 5000.004, 100.25, None],
+            'COST': [1.5, 2.25, 0, 0],
+        }).to_excel(path, sheet_name='HEPWORTH', index=False)
+        import_local_purchase_workbook(path)
+
+    def summary(self):
+        return LocalPurchaseBrandSummary.objects.values_list(
+            'row_count', 'critical_count', 'required_count', 'high_value_count',
+            'total_value', 'total_cost', 'total_stock_requirement').get(brand='HEPWORTH')
+
+    def test_import_time_summary_matches_the_stored_rows(self):
+        self.import_sheet()
+        expected = (4, 3, 2, 1, Decimal('11100.25'), Decimal('3.75'), 11)
+        self.assertEqual(self.summary(), expected)
+
+        LocalPurchaseBrandSummary.objects.rebuild(['HEPWORTH'])
+        self.assertEqual(self.summary(), expected)
+
+    def test_dashboard_and_filter_counts_read_the_summary(self):
+        self.import_sheet()
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+        self.assertContains(self.client.get('/local-purchase/'), 'HEPWORTH')
+        for quick_filter, count in [('all', 4), ('critical', 3), ('required', 2), ('high-value', 1)]:
+            response = self.client.get('/local-purchase/list/', {'brand': 'HEPWORTH', 'filter': quick_filter})
+            self.assertEqual(response.context['total_count'], count)
+            self.assertEqual(len(response.context['items']), count)
+
+
+class LocalPurchaseBatchTests(TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            self.path = f.name
+        self.addCleanup(os.remove, self.path)
+
+    def import_workbook(self, sheets):
+        with pd.ExcelWriter(self.path) as writer:
+            for brand, codes in sheets.items():
+                pd.DataFrame({'CODE': codes, 'VALUE': [100] * len(codes)}).to_excel(
+                    writer, sheet_name=brand, index=False)
+        import_local_purchase_workbook(self.path)
+
+    def live_codes(self, brand):
+        return sorted(LocalPurchaseItem.objects.live().filter(brand=brand).values_list('item_code', flat=True))
+
+    def test_reupload_switches_batches_and_purges_the_old_rows(self):
+        LocalPurchaseItem.objects.create(brand='HEPWORTH', item_code='LOOSE')
+        self.import_workbook({'HEPWORTH': ['H1', 'H2'], 'PEGLER': ['P1']})
+        self.assertEqual(self.live_codes('HEPWORTH'), ['H1', 'H2'])
+
+        seen = []
+        activate = LocalPurchaseBatch.objects.activate
+
+        def check_readers_then_activate(batch):
+            seen.append(self.live_codes(batch.brand))
+            activate(batch)
+
+        with mock.patch.object(LocalPurchaseBatch.objects, 'activate', side_effect=check_readers_then_activate):
+            self.import_workbook({'HEPWORTH': ['H3']})
+
+        # While the new batch was staged, readers still saw the old one
+        self.assertEqual(seen, [['H1', 'H2']])
+        self.assertEqual(self.live_codes('HEPWORTH'), ['H3'])
+        self.assertEqual(self.live_codes('PEGLER'), ['P1'])
+        self.assertEqual(LocalPurchaseItem.objects.count(), 2)
+        self.assertEqual(sorted(LocalPurchaseBatch.objects.values_list('brand', 'status')),
+                         [('HEPWORTH', 'ACTIVE'), ('PEGLER', 'ACTIVE')])
+        self.assertEqual(LocalPurchaseBrandSummary.objects.get(brand='HEPWORTH').row_count, 1)
+
+    def test_sheets_parsed_in_worker_processes_match_in_process_parsing(self):
+        with pd.ExcelWriter(self.path) as writer:
+            for seed, brand in enumerate(['HEPWORTH', 'PEGLER', 'OTHERS']):
+                pd.DataFrame({
+                    'CODE': [f'{brand}-{n}' for n in range(50)],
+                    'VALUE': [seed * 1000 + n / 3 for n in range(50)],
+                    'STOCK\nREQUIREMENT': [' - ' if n % 7 else n for n in range(50)],
+                }).to_excel(writer, sheet_name=brand, index=False)
+            pd.DataFrame({'NOTES': ['no code column']}).to_excel(writer, sheet_name='VERA-PUMP', index=False)
+        names = ['HEPWORTH', 'VERA-PUMP', 'PEGLER', 'OTHERS']
+
+        in_process = list(parse_local_purchase_sheets(self.path, names, workers=1))
+        self.assertEqual(list(parse_local_purchase_sheets(self.path, names, workers=3)), in_process)
+        self.assertEqual([name for name, _ in in_process], names)
+        self.assertIsNone(in_process[1][1])
+
+    def test_failed_upload_leaves_every_brand_as_it_was(self):
+        self.import_workbook({'HEPWORTH': ['H1', 'H2'], 'PEGLER': ['P1']})
+        build = importers.build_local_purchase_items
+
+        def fail_on_pegler(brand, columns, batch=None):
+            if brand == 'PEGLER':
+                raise ValueError("bad sheet")
+            return build(brand, columns, batch)
+
+        with mock.patch.object(importers, 'build_local_purchase_items', side_effect=fail_on_pegler):
+            with self.assertRaises(ValueError):
+                self.import_workbook({'HEPWORTH': ['H3'], 'PEGLER': ['P2']})
+
+        self.assertEqual(self.live_codes('HEPWORTH'), ['H1', 'H2'])
+        self.assertEqual(self.live_codes('PEGLER'), ['P1'])
+        self.assertEqual(LocalPurchaseItem.objects.count(), 3)
+        self.assertFalse(LocalPurchaseBatch.objects.exclude(status='ACTIVE').exists())
+        self.assertEqual(LocalPurchaseBrandSummary.objects.get(brand='HEPWORTH').row_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LocalPurchaseExportTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user('admin', password='x')
+        admin.profile.role = 'ADMIN'
+        admin.profile.save()
+        self.client.force_login(admin)
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            self.path = f.name
+        self.addCleanup(os.remove, self.path)
+
+    def stored_rows(self):
+        return list(LocalPurchaseItem.objects.filter(brand='HEPWORTH').order_by('item_code').values_list(
+            *[field for _, field, _ in LOCAL_PURCHASE_COLUMNS]))
+
+    def test_csv_follows_the_list_view_filter_and_sort(self):
+        LocalPurchaseItem.objects.bulk_create([
+            LocalPurchaseItem(brand='HEPWORTH', item_code=f'H{n}', description=f'Valve, "{n}"',
+                              stock_requirement=n % 3, value=Decimal(n) * 10)
+            for n in range(1, 7)
+        ])
+        params = {'brand': 'HEPWORTH', 'filter': 'required', 'sort': 'value', 'direction': 'desc'}
+        listed = [item.item_code for item in self.client.get('/local-purchase/list/', params).context['items']]
+
+        response = self.client.get('/local-purchase/export/', {**params, 'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = list(csv.reader(StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(lines[0], [header for header, _, _ in LOCAL_PURCHASE_COLUMNS])
+        self.assertEqual([line[0] for line in lines[1:]], listed)
+        self.assertEqual(listed, ['H5', 'H4', 'H2', 'H1'])
+        self.assertEqual(lines[1][2], 'Valve, "5"')
+
+    def test_xlsx_export_uploads_back_unchanged(self):
+        pd.DataFrame({
+            'CODE': ['H1', 'H2', 'H3'],
+            'UPC CODE': ['501', None, '503'],
+            'DESCRIPTION': ['Gate <valve> & co', 'Tee', 'Cap'],
+            'STOCK Sufficiency Month': [0.5, 1.2, ' - '],
+            'STOCK\nREQUIREMENT': [3, 0, 10],
+            'VALUE': [6000, 4000.5, None],
+        }).to_excel(self.path, sheet_name='HEPWORTH', index=False)
+        import_local_purchase_workbook(self.path)
+        before = self.stored_rows()
+
+        response = self.client.get('/local-purchase/export/', {'brand': 'HEPWORTH', 'format': 'xlsx'})
+        with open(self.path, 'wb') as f:
+            for chunk in response.streaming_content:
+                f.write(chunk)
+        import_local_purchase_workbook(self.path)
+        self.assertEqual(self.stored_rows(), before)
+
+    def test_xlsx_writes_non_finite_numbers_as_empty_cells(self):
+        rows = [['nan', float('nan'), Decimal('NaN')], ['inf', float('inf'), float('-inf')], ['one', 1.5, Decimal('2')]]
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(iter_xlsx([('Data', ['Name', 'A', 'B'], rows)]))))
+        self.assertEqual([list(row) for row in workbook['Data'].iter_rows(min_row=2, values_only=True)],
+                         [['nan', None, None], ['inf', None, None], ['one', 1.5, 2]])
+
+
+class SalesFirmExportTests(TestCase):
+    def test_sales_export_has_one_sheet_per_section(self):
+        item = ItemMaster.objects.create(item_code='P-1', item_description='Gate <Valve>', item_firm='PEGLER')
+        quotation = Quotation.objects.create(reference_number='Q-1', supplier_name='PEGLER', status='CONFIRMED')
+        line = QuotationItem.objects.create(quotation=quotation, item=item, quantity_ordered=100, rate=2)
+        day = datetime.date(2026, 3, 1)
+        Release.objects.create(quotation_item=line, quantity_released=30, release_date=day, container_info='C-1',
+                               expected_arrival_date=day + datetime.timedelta(days=30))
+        Release.objects.create(quotation_item=line, quantity_released=20, release_date=day, is_received=True)
+        Shipment.objects.create(quotation_item=line, quantity_received=20, received_date=day)
+        self.client.force_login(User.objects.create_user('sales', password='x'))
+
+        response = self.client.get('/sales/track/export/', {'firm': 'PEGLER'})
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        sheets = {sheet.title: [row for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+
+        self.assertEqual(list(sheets), ['In Transit', 'Pending At Factory', 'Received'])
+        self.assertEqual(sheets['In Transit'][1][:3], ('C-1', None, 'P-1'))
+        self.assertEqual(sheets['In Transit'][1][-1], datetime.datetime(2026, 3, 31))
+        # Balance at the factory: 100 ordered - 30 in transit - 20 received
+        self.assertEqual(sheets['Pending At Factory'][1][4:8], (100, 30, 20, 50))
+        self.assertEqual(sheets['Received'][1], (datetime.datetime(2026, 3, 1), 'P-1', 'Gate <Valve>', None, 'Q-1', 20))
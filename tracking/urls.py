@@ -13,9 +13,15 @@ urlpatterns = [
     path('release-item/<int:pk>/', views.release_item, name='release_item'),
     path('receive-release/<int:pk>/', views.receive_release, name='receive_release'),
     path('receive-item/<int:pk>/', views.receive_item, name='receive_item'),
+    path('quotation/<int:pk>/release/', views.release_quotation, name='release_quotation'),
+    path('containers/', views.container_list, name='container_list'),
+    path('containers/receive/', views.receive_container, name='receive_container'),
+    path('containers/reschedule/', views.reschedule_container, name='reschedule_container'),
     path('sales/', views.sales_dashboard, name='sales_dashboard'),
     path('sales/track/', views.sales_firm_track, name='sales_firm_track'),
+    path('sales/track/export/', views.sales_firm_export, name='sales_firm_export'),
     path('api/items-by-firm/', views.get_items_by_firm, name='get_items_by_firm'),
+    path('api/items/search/', views.item_typeahead, name='item_typeahead'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     
@@ -26,9 +32,11 @@ urlpatterns = [
     path('manufacturers/<int:pk>/delete/', views.manufacturer_delete, name='manufacturer_delete'),
     path('manufacturers/upload/', views.manufacturer_upload, name='manufacturer_upload'),
     path('run-stock-import/', views.run_stock_import, name='run_stock_import'),
+    path('jobs/<int:pk>/status/', views.job_status, name='job_status'),
     
     # Local Purchase Module
     path('local-purchase/', views.local_purchase_dashboard, name='local_purchase_dashboard'),
     path('local-purchase/list/', views.local_purchase_list, name='local_purchase_list'),
+    path('local-purchase/export/', views.local_purchase_export, name='local_purchase_export'),
     path('local-purchase/upload/', views.local_purchase_upload, name='local_purchase_upload'),
 ]
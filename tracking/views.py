@@ -1,21 +1,32 @@
+import logging
+
 import pandas as pd
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction, models
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
-from .models import ItemMaster, Quotation, QuotationItem, Release, Shipment, Manufacturer, LocalPurchaseItem
+from .models import Quotation, QuotationItem, Release, Shipment, Manufacturer, LocalPurchaseItem, LocalPurchaseBrandSummary, BackgroundJob, FirmSummary
 from .forms import UploadItemForm, QuotationForm, QuotationItemFormSet, ShipmentForm, ReleaseForm, ManufacturerForm, UploadManufacturerForm
-from django.http import JsonResponse
+from .forms import BulkReleaseForm, ContainerReceiveForm, ContainerRescheduleForm
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, quote_etag, urlencode
 import json
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import never_cache, cache_control
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from .decorators import admin_required, sales_required
-from django.core.management import call_command
-from io import StringIO
+from . import containers, exports, jobs, metrics
+from .search import get_search_backend, search_items
+from .pagination import KeysetPaginator
+from .caching import (acached_local_purchase_count, acatalog_version, afirm_items_json, cached_local_purchase_count,
+                      catalog_version)
+from .importers import ITEM_UPLOAD_COLUMNS, LOCAL_PURCHASE_COLUMNS, clean_item_upload, upsert_items
+
+logger = logging.getLogger(__name__)
 
 @login_required
 @admin_required
@@ -27,25 +38,24 @@ def dashboard(request):
     # Fetch recent quotations
     recent_quotations = Quotation.objects.all().order_by('-created_at')[:5]
     
-    # Calculate stats
-    total_items = ItemMaster.objects.count()
-    pending_quotations = Quotation.objects.filter(status='DRAFT').count()
-    
-    # Incoming shipments (In Transit) - Release objects not received
-    incoming_shipments = Release.objects.filter(is_received=False).count()
+    # Counters (items, drafts, releases in transit) come from one maintained row
+    counters = metrics.get_counters()
 
     context = {
+        'jobs': jobs.recent_jobs(),
         'recent_quotations': recent_quotations,
-        'total_items': total_items,
-        'pending_quotations': pending_quotations,
-        'incoming_shipments': incoming_shipments,
+        'counters': counters,
+        'total_items': counters.total_items,
+        'pending_quotations': counters.draft_quotations,
+        'incoming_shipments': counters.in_transit_releases,
     }
     return render(request, 'tracking/dashboard.html', context)
 
 @login_required
 @admin_required
-def update_quotation_status(request, pk):
-    quotation = get_object_or_404(Quotation, pk=pk)
+async def update_quotation_status(request, pk):
+    """Async: the inline status selects post JSON here on every change."""
+    quotation = await aget_object_or_404(Quotation, pk=pk)
     
     if request.method == 'POST':
         # Check if it's a form submission or JSON
@@ -55,7 +65,7 @@ def update_quotation_status(request, pk):
                 new_status = data.get('status')
                 if new_status in dict(Quotation.STATUS_CHOICES):
                     quotation.status = new_status
-                    quotation.save()
+                    await quotation.asave()
                     return JsonResponse({'success': True})
                 return JsonResponse({'success': False, 'error': 'Invalid status'})
             except json.JSONDecodeError:
@@ -65,7 +75,7 @@ def update_quotation_status(request, pk):
             new_status = request.POST.get('status')
             if new_status in dict(Quotation.STATUS_CHOICES):
                 quotation.status = new_status
-                quotation.save()
+                await quotation.asave()
                 messages.success(request, f"Status for {quotation.reference_number} updated to {quotation.get_status_display()}.")
             else:
                 messages.error(request, "Invalid status selected.")
@@ -81,7 +91,7 @@ def quotation_list(request):
     status_filter = request.GET.get('status', 'all')
     search_query = request.GET.get('search', '')
     
-    quotes = Quotation.objects.all().order_by('-created_at')
+    quotes = Quotation.objects.select_related('manufacturer').order_by('-created_at')
     
     # helper for filter
     if status_filter != 'all':
@@ -90,10 +100,7 @@ def quotation_list(request):
 
     # Search Logic
     if search_query:
-        quotes = quotes.filter(
-            models.Q(reference_number__icontains=search_query) |
-            models.Q(supplier_name__icontains=search_query)
-        )
+        quotes = get_search_backend().filter_quotations(quotes, search_query)
 
     # Pagination
     paginator = Paginator(quotes, 100) # 10 quotes per page
@@ -114,7 +121,7 @@ def quotation_list(request):
 @login_required
 @admin_required
 def release_item(request, pk):
-    item = get_object_or_404(QuotationItem, pk=pk)
+    item = get_object_or_404(QuotationItem.objects.select_related('item', 'quotation'), pk=pk)
     
     if request.method == 'POST':
         form = ReleaseForm(request.POST)
@@ -122,9 +129,8 @@ def release_item(request, pk):
             with transaction.atomic():
                 release = form.save(commit=False)
                 release.quotation_item = item
-                release.save()
+                release.save()  # signal refreshes the line's stored totals in this transaction
                 
-                # Update item? (quantity calculations are dynamic properties)
                 messages.success(request, f"Release created for {item.item.item_code}!")
                 return redirect('quotation_detail', pk=item.quotation.pk)
     else:
@@ -140,7 +146,7 @@ def release_item(request, pk):
 @admin_required
 def receive_release(request, pk):
     # This view confirms that a Release (truck) has arrived
-    release = get_object_or_404(Release, pk=pk)
+    release = get_object_or_404(Release.objects.select_related('quotation_item__item', 'quotation_item__quotation'), pk=pk)
     
     if request.method == 'POST':
         with transaction.atomic():
@@ -162,47 +168,99 @@ def receive_release(request, pk):
 
     return render(request, 'tracking/receive_release_confirm.html', {'release': release})
 
+@login_required
+@admin_required
+def release_quotation(request, pk):
+    """Release several lines of a quotation in one shipment (one bulk insert)."""
+    quotation = get_object_or_404(Quotation, pk=pk)
+    lines = [line for line in quotation.items.select_related('item').order_by('pk') if line.balance_to_release > 0]
+
+    if request.method == 'POST':
+        form = BulkReleaseForm(request.POST, lines=lines)
+        if form.is_valid():
+            try:
+                releases = containers.create_releases(
+                    form.quantities(), form.cleaned_data['release_date'],
+                    form.cleaned_data['expected_arrival_date'], form.cleaned_data['container_info'])
+            except ValueError as e:  # another release got to a line first
+                form.add_error(None, str(e))
+            else:
+                messages.success(request, f"Released {len(releases)} lines of {quotation.reference_number}.")
+                return redirect('quotation_detail', pk=quotation.pk)
+    else:
+        form = BulkReleaseForm(lines=lines, initial={'release_date': pd.Timestamp.now().date()})
+
+    return render(request, 'tracking/release_quotation.html', {'quotation': quotation, 'form': form})
+
+@login_required
+@admin_required
+def container_list(request):
+    """Containers in transit; `?container=` lists one container's releases for receipt or rescheduling."""
+    container_info = request.GET.get('container', '')
+    releases = list(containers.container_releases(container_info)) if container_info else []
+    return render(request, 'tracking/containers.html', {
+        'containers': containers.open_containers(),
+        'container_info': container_info,
+        'releases': releases,
+        'receive_form': ContainerReceiveForm(initial={'received_date': pd.Timestamp.now().date()}),
+        'reschedule_form': ContainerRescheduleForm(initial={'expected_arrival_date': releases[0].expected_arrival_date if releases else None}),
+    })
+
+@login_required
+@admin_required
+def receive_container(request):
+    if request.method != 'POST':
+        return redirect('container_list')
+    container_info = request.POST.get('container', '')
+    form = ContainerReceiveForm(request.POST, container_info=container_info)
+    if form.is_valid():
+        received = containers.receive_container(
+            container_info, form.cleaned_data['received_date'], form.cleaned_data['release'])
+        messages.success(request, f"Received {received} releases from {container_info}.")
+    elif 'release' in form.errors:
+        messages.error(request, "Some of the selected releases are no longer open in this container.")
+    else:
+        messages.error(request, "Enter a valid received date.")
+    return redirect(f"{reverse('container_list')}?{urlencode({'container': container_info})}")
+
+@login_required
+@admin_required
+def reschedule_container(request):
+    if request.method != 'POST':
+        return redirect('container_list')
+    container_info = request.POST.get('container', '')
+    form = ContainerRescheduleForm(request.POST)
+    if form.is_valid():
+        moved = containers.reschedule_container(container_info, form.cleaned_data['expected_arrival_date'])
+        messages.success(request, f"Rescheduled {moved} releases of {container_info}.")
+    else:
+        messages.error(request, "Enter a valid arrival date.")
+    return redirect(f"{reverse('container_list')}?{urlencode({'container': container_info})}")
+
 @login_required
 @admin_required
 def create_quotation(request):
     if request.method == 'POST':
-        print("DEBUG: POST keys received:", list(request.POST.keys()))
-        print("DEBUG: POST items-0-item:", request.POST.get('items-0-item'))
-        print("DEBUG: POST items-0-quantity_ordered:", request.POST.get('items-0-quantity_ordered'))
-        
         form = QuotationForm(request.POST)
         formset = QuotationItemFormSet(request.POST)
         
         if form.is_valid() and formset.is_valid():
-            print("DEBUG: Forms are valid")
-            print(f"DEBUG: Total Forms: {formset.total_form_count()}")
-            for i, f in enumerate(formset):
-                print(f"DEBUG: Form {i} cleaned_data: {f.cleaned_data}")
-                print(f"DEBUG: Form {i} has_changed: {f.has_changed()}")
-
             try:
                 with transaction.atomic():
                     quotation = form.save()
                     quotation.created_by = request.user
                     quotation.save()
-                    print(f"DEBUG: Quotation saved: {quotation.pk}")
                     
                     formset.instance = quotation
-                    items = formset.save()
-                    print(f"DEBUG: Items saved: {len(items)}")
+                    formset.save()
                     
                     messages.success(request, f"Quotation {quotation.reference_number} created successfully!")
                     return redirect('dashboard')
             except Exception as e:
-                print(f"Transaction Error: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("create quotation failed user=%s", request.user)
                 messages.error(request, f"Error creating quotation: {str(e)}")
         else:
-             print("DEBUG: Validation FAILED")
-             print("Form Errors:", form.errors)
-             print("Formset Errors:", formset.errors)
-             print("POST Data (partial):", {k: v for k, v in request.POST.items() if 'item' in k})
+             logger.info("create quotation invalid form_errors=%s formset_errors=%s", form.errors.as_json(), formset.errors)
              
              if formset.errors:
                  messages.error(request, f"Item Errors: {formset.errors}")
@@ -231,9 +289,14 @@ def quotation_detail(request, pk):
     except:
         pass
     
+    # Totals are stored on each line, so one joined query covers every row
+    items = list(quotation.items.select_related('item').order_by('pk'))
+    
     return render(request, 'tracking/quotation_detail.html', {
         'quotation': quotation,
+        'items': items,
         'supplier_logo': supplier_logo,
+        'can_release': any(item.balance_to_release > 0 for item in items),
     })
 
 @login_required
@@ -264,7 +327,7 @@ def edit_quotation(request, pk):
             messages.error(request, "Please correct the errors below.")
     else:
         form = QuotationForm(instance=quotation)
-        formset = QuotationItemFormSet(instance=quotation)
+        formset = QuotationItemFormSet(instance=quotation, queryset=quotation.items.select_related('item'))
     
     return render(request, 'tracking/edit_quotation.html', {
         'form': form,
@@ -296,7 +359,7 @@ def delete_quotation(request, pk):
 @login_required
 @admin_required
 def receive_item(request, pk):
-    item = get_object_or_404(QuotationItem, pk=pk)
+    item = get_object_or_404(QuotationItem.objects.select_related('item', 'quotation'), pk=pk)
     
     # Get pending releases (In Transit) for this item to offer "Quick Receive"
     pending_releases = item.releases.filter(is_received=False)
@@ -304,9 +367,10 @@ def receive_item(request, pk):
     if request.method == 'POST':
         form = ShipmentForm(request.POST)
         if form.is_valid():
-            shipment = form.save(commit=False)
-            shipment.quotation_item = item
-            shipment.save()
+            with transaction.atomic():
+                shipment = form.save(commit=False)
+                shipment.quotation_item = item
+                shipment.save()
             messages.success(request, f"Received {shipment.quantity_received} of {item.item.item_code}")
             
             # Check if fully received and update status if needed?
@@ -332,34 +396,14 @@ def upload_items(request):
                 df = pd.read_excel(excel_file)
                 
                 # Basic validation: check required columns
-                required_columns = ['Item Code', 'Item Description', 'Firm', 'Stock', 'UOM']
+                required_columns = ITEM_UPLOAD_COLUMNS
                 if not all(col in df.columns for col in required_columns):
                     messages.error(request, f"Missing required columns. Expected: {', '.join(required_columns)}")
                     return render(request, 'tracking/upload_items.html', {'form': form})
                 
-                success_count = 0
-                errors = []
-
-                for index, row in df.iterrows():
-                    try:
-                        code = str(row['Item Code']).strip()
-                        desc = str(row['Item Description']).strip()
-                        firm = str(row['Firm']).strip()
-                        stock = row['Stock'] if pd.notna(row['Stock']) else 0
-                        uom = str(row['UOM']).strip()
-                        
-                        ItemMaster.objects.update_or_create(
-                            item_code=code,
-                            defaults={
-                                'item_description': desc,
-                                'item_firm': firm,
-                                'item_stock': stock,
-                                'uom': uom
-                            }
-                        )
-                        success_count += 1
-                    except Exception as e:
-                        errors.append(f"Row {index+2}: {str(e)}")
+                # Vectorized cleaning; invalid rows are reported, not raised
+                records, errors = clean_item_upload(df)
+                success_count = upsert_items(records, update_fields=['item_description', 'item_firm', 'item_stock', 'uom'])
                 
                 messages.success(request, f"Successfully processed {success_count} items.")
                 if errors:
@@ -381,35 +425,15 @@ def sales_dashboard(request):
     """
     Landing page for Sales. Select Firm.
     """
-    # Get firms that have active QuotationItems (either pending release or in transit)
-    # We want distinct firm names.
-    firm_names = QuotationItem.objects.annotate(
-        total_received=Coalesce(Sum('shipments__quantity_received'), 0)
-    ).filter(
-        models.Q(quotation__status='CONFIRMED') &
-        models.Q(quantity_ordered__gt=models.F('total_received'))
-    ).values_list('item__item_firm', flat=True).distinct()
-    
-    # Get supplier logos for these firms
-    from .models import Supplier
-    suppliers = {s.name: s for s in Supplier.objects.filter(name__in=firm_names)}
-    
-    # Build list of firms with their logos
-    firms_with_logos = [
-        {'name': firm, 'logo': suppliers.get(firm).logo if suppliers.get(firm) and suppliers.get(firm).logo else None}
-        for firm in firm_names
-    ]
-    
-    return render(request, 'tracking/sales_landing.html', {'firms': firms_with_logos})
+    # Firms with open confirmed lines, with their counts and logo, from the maintained summary table
+    firms = FirmSummary.objects.filter(open_lines__gt=0)
+    return render(request, 'tracking/sales_landing.html', {'firms': firms})
 
-@never_cache
-@login_required
-@sales_required
-def sales_firm_track(request):
-    firm_name = request.GET.get('firm')
-    if not firm_name:
-        return redirect('sales_dashboard')
-        
+def _firm_tracking(firm_name):
+    """
+    A firm's (in-transit releases, received releases, lines pending at the factory)
+    querysets, shared by the tracking page and its export.
+    """
     # 1. Incoming (On The Way)
     # Changed from grouping to flat list for Table view
     in_transit_releases = Release.objects.filter(
@@ -419,29 +443,39 @@ def sales_firm_track(request):
         'quotation_item__item', 
         'quotation_item__quotation',
         'quotation_item__quotation__manufacturer'
-    ).order_by('container_info', 'expected_arrival_date')
+    ).order_by('container_info', 'expected_arrival_date', 'pk')
 
-    # 2. Received (History) with Pagination
-    received_queryset = Release.objects.filter(
+    # 2. Received (History)
+    received_releases = Release.objects.filter(
         quotation_item__item__item_firm=firm_name,
         is_received=True
     ).select_related(
         'quotation_item__item', 
         'quotation_item__quotation'
-    ).order_by('-release_date')
-    
+    ).order_by('-release_date', '-pk')
+
+    # 3. Pending (At Factory) - balance filtered in SQL
+    pending_items = QuotationItem.objects.pending_release().filter(
+        item__item_firm=firm_name
+    ).select_related('item', 'quotation', 'quotation__manufacturer').order_by('expected_delivery_date', 'pk')
+    return in_transit_releases, received_releases, pending_items
+
+@never_cache
+@login_required
+@sales_required
+def sales_firm_track(request):
+    firm_name = request.GET.get('firm')
+    if not firm_name:
+        return redirect('sales_dashboard')
+        
+    in_transit_releases, received_queryset, pending_queryset = _firm_tracking(firm_name)
+
     paginator = Paginator(received_queryset, 30) # Show 15 records per page
     page_number = request.GET.get('page')
     received_releases = paginator.get_page(page_number)
     
-    # 3. Pending (At Factory)
-    all_firm_items = QuotationItem.objects.filter(
-        item__item_firm=firm_name,
-        quotation__status='CONFIRMED'
-    ).select_related('item', 'quotation', 'quotation__manufacturer').order_by('expected_delivery_date')
-    
-    # Filter for items with balance > 0
-    pending_items = [item for item in all_firm_items if item.balance_to_release > 0]
+    pending_paginator = Paginator(pending_queryset, 100)
+    pending_items = pending_paginator.get_page(request.GET.get('pending_page'))
     
     # Get supplier logo
     supplier_logo = None
@@ -461,21 +495,102 @@ def sales_firm_track(request):
         'supplier_logo': supplier_logo,
     })
 
-@never_cache
 @login_required
-def get_items_by_firm(request):
+@sales_required
+def sales_firm_export(request):
+    """
+    A firm's tracking page as a streamed workbook: in-transit releases, lines
+    pending at the factory and the full received history, one sheet each. Rows
+    are read as joined value tuples in chunks, balances come from SQL.
+    """
+    firm_name = request.GET.get('firm')
+    if not firm_name:
+        return redirect('sales_dashboard')
+    in_transit, received, pending = _firm_tracking(firm_name)
+    chunk_size = exports.EXPORT_CHUNK_SIZE
+
+    sheets = [
+        ('In Transit',
+         ['Container', 'Manufacturer', 'Item Code', 'Description', 'Reference', 'Quantity', 'Release Date',
+          'Expected Arrival'],
+         in_transit.values_list(
+             'container_info', 'quotation_item__quotation__manufacturer__name', 'quotation_item__item__item_code',
+             'quotation_item__item__item_description', 'quotation_item__quotation__reference_number',
+             'quantity_released', 'release_date', 'expected_arrival_date',
+         ).iterator(chunk_size=chunk_size)),
+        ('Pending At Factory',
+         ['Item Code', 'Description', 'Manufacturer', 'PO Reference', 'Ordered', 'In Transit', 'Received',
+          'Balance Qty', 'Expected'],
+         pending.values_list(
+             'item__item_code', 'item__item_description', 'quotation__manufacturer__name',
+             'quotation__reference_number', 'quantity_ordered', 'quantity_in_transit', 'quantity_received',
+             'open_to_release', 'expected_delivery_date',
+         ).iterator(chunk_size=chunk_size)),
+        ('Received',
+         ['Date Received', 'Item Code', 'Description', 'Container', 'Reference', 'Quantity'],
+         received.values_list(
+             'release_date', 'quotation_item__item__item_code', 'quotation_item__item__item_description',
+             'container_info', 'quotation_item__quotation__reference_number', 'quantity_released',
+         ).iterator(chunk_size=chunk_size)),
+    ]
+    response = StreamingHttpResponse(
+        exports.for_request(request, exports.iter_xlsx(sheets)),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    response['Content-Disposition'] = content_disposition_header(True, f'{firm_name} shipments.xlsx')
+    return response
+
+@login_required
+@cache_control(private=True, no_cache=True)
+async def get_items_by_firm(request):
+    """
+    A firm's item list, for external clients (the item pickers use item_typeahead).
+    Revalidated with If-None-Match: unchanged catalogs get a 304 without touching the DB.
+    Async, so the ETag check is done here (condition() calls its etag_func synchronously).
+    """
     firm = request.GET.get('firm')
     if not firm:
         return JsonResponse({'items': []})
-    
-    items = ItemMaster.objects.filter(item_firm=firm).values('id', 'item_code', 'item_description', 'item_upvc').order_by('item_code')
-    return JsonResponse({'items': list(items)})
+
+    etag = quote_etag(str(await acatalog_version(firm)))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(await afirm_items_json(firm), content_type='application/json')
+    response.headers.setdefault('ETag', etag)
+    return response
+
+@login_required
+def item_typeahead(request):
+    """
+    Ranked item matches for the quotation item pickers: ?firm=&q=&limit= (limit capped at 50).
+    The ETag is the firm's catalog version: the browser keeps each answer and a repeated
+    query revalidates to a 304 without searching until the firm's items change.
+    """
+    firm = request.GET.get('firm')
+    if not firm:
+        return JsonResponse({'items': []})
+    try:
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        limit = 20
+
+    etag = quote_etag(str(catalog_version(firm)))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        items = search_items(firm, request.GET.get('q', ''), limit)
+        response = JsonResponse({'items': [
+            {'id': item.pk, 'item_code': item.item_code, 'item_description': item.item_description, 'item_upvc': item.item_upvc}
+            for item in items
+        ]})
+    response.headers.setdefault('ETag', etag)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 # Manufacturer Management
 @login_required
 @admin_required
 def manufacturer_list(request):
-    manufacturers = Manufacturer.objects.all()
+    manufacturers = Manufacturer.objects.annotate(quotation_count=models.Count('quotations'))
     return render(request, 'tracking/manufacturer_list.html', {
         'manufacturers': manufacturers
     })
@@ -565,60 +680,66 @@ def manufacturer_upload(request):
 @login_required
 @admin_required
 def run_stock_import(request):
-    out = StringIO()
-    try:
-        call_command('import_stock_api', stdout=out)
-        output = out.getvalue()
-        messages.success(request, output)
-    except Exception as e:
-        messages.error(request, f"Error importing stock data: {str(e)}")
-    finally:
-        out.close()
+    job = jobs.enqueue('STOCK_IMPORT', user=request.user)
+    if job.status == 'FAILED':
+        messages.error(request, f"Error importing stock data: {job.message}")
+    else:
+        messages.success(request, "Stock sync queued. Progress is shown below.")
     return redirect('dashboard')
 
+@login_required
+@admin_required
+def job_status(request, pk):
+    """JSON progress of a background job, polled by the dashboards."""
+    job = get_object_or_404(BackgroundJob, pk=pk)
+    if jobs.is_stale(job):
+        # No worker is left to finish it: fail it so the dashboard stops polling
+        jobs.fail_stale_jobs()
+        job.refresh_from_db()
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'kind_display': job.get_kind_display(),
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'finished': job.is_finished,
+    })
+
 @login_required
 @admin_required
 def local_purchase_dashboard(request):
     """Dashboard to select a brand/sheet."""
-    brands = LocalPurchaseItem.objects.values_list('brand', flat=True).distinct().order_by('brand')
-    return render(request, 'tracking/local_purchase_dashboard.html', {'brands': brands})
+    # Totals are written by the importer: one read of the summary table
+    brands = LocalPurchaseBrandSummary.objects.all()
+    return render(request, 'tracking/local_purchase_dashboard.html', {
+        'brands': brands,
+        'jobs': jobs.recent_jobs(kinds=['LOCAL_PURCHASE_UPLOAD']),
+    })
 
 from django.core.paginator import Paginator
-from django.db.models import Q
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
 from django.http import JsonResponse
 
-@login_required
-@admin_required
-def local_purchase_list(request):
-    """Table view for a selected brand with AJAX search, sort, and pagination."""
-    brand = request.GET.get('brand')
-    if not brand:
-        return redirect('local_purchase_dashboard')
-        
+def _local_purchase_rows(request, brand):
+    """
+    The brand's rows with the list view's search, quick filter and sort applied.
+    Returns (KeysetPaginator, search query, quick filter name); shared with the export.
+    """
     # Start with base queryset
-    items = LocalPurchaseItem.objects.filter(brand=brand)
+    items = LocalPurchaseItem.objects.live().filter(brand=brand)
 
     # 1. Search Filter
     search_query = request.GET.get('search', '').strip()
     if search_query:
-        items = items.filter(
-            Q(item_code__icontains=search_query) |
-            Q(upc_code__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        items = get_search_backend().filter_local_purchase(items, search_query)
 
     # 2. Quick Filter (migrated from JS to Backend)
     quick_filter = request.GET.get('filter', 'all')
-    if quick_filter == 'critical':
-        items = items.filter(stock_sufficiency_months__lt=1)
-    elif quick_filter == 'required':
-        # Assuming 'Stock Requirement' > 0 implies requirement exists
-        items = items.filter(stock_requirement__gt=0) 
-        # Note: Adjust field lookup based on your exact model type (int/str)
-    elif quick_filter == 'high-value':
-        items = items.filter(value__gt=5000)
+    filter_q = LocalPurchaseItem.quick_filter(quick_filter)
+    if filter_q is not None:
+        items = items.filter(filter_q)
 
     # 3. Sorting
     sort_by = request.GET.get('sort', 'item_code') # default sort
@@ -649,130 +770,108 @@ def local_purchase_list(request):
     }
     
     sort_field = allowed_sort_fields.get(sort_by, 'item_code')
-    if direction == 'desc':
-        sort_field = f'-{sort_field}'
-    
-    items = items.order_by(sort_field)
+    paginator = KeysetPaginator(items, sort_field, descending=direction == 'desc', per_page=1000)
+    return paginator, search_query, quick_filter
 
-    # 4. Pagination (1000 items per page)
-    paginator = Paginator(items, 1000)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+@login_required
+@admin_required
+async def local_purchase_list(request):
+    """
+    Table view for a selected brand with AJAX search, sort, and pagination.
+    Async: every keystroke, sort and page change of the table is an AJAX request,
+    served from the async ORM and cache; the full page is rendered synchronously.
+    """
+    brand = request.GET.get('brand')
+    if not brand:
+        return redirect('local_purchase_dashboard')
+    if request.headers.get('x-requested-with') != 'XMLHttpRequest':
+        return await sync_to_async(_local_purchase_page)(request, brand)
+
+    # AJAX Handling: Return only the rows and pagination info. Rows are counted
+    # once per filter and cached until the brand is re-imported.
+    paginator, search_query, quick_filter = _local_purchase_rows(request, brand)
+    page_obj = await paginator.apage(request.GET.get('cursor'))
+    total_count = await acached_local_purchase_count(paginator.queryset, brand, search_query, quick_filter)
+
+    context = _local_purchase_context(request, brand, page_obj, total_count)
+    html = render_to_string('tracking/includes/local_purchase_rows.html', context, request=request)
+    pagination_html = render_to_string('tracking/includes/pagination_controls.html', context, request=request)
+    return JsonResponse({
+        'html': html, 
+        'pagination': pagination_html,
+        'total_count': total_count
+    })
 
-    context = {
+def _local_purchase_page(request, brand):
+    paginator, search_query, quick_filter = _local_purchase_rows(request, brand)
+
+    # 4. Keyset pagination (1000 items per page): the opaque cursor marks the last
+    # row seen, so deep pages cost the same as the first one (no OFFSET scan)
+    page_obj = paginator.page(request.GET.get('cursor'))
+    # The page shows the import-time brand summary's counts beside the quick
+    # filters and, without a search, takes the total from it
+    summary = LocalPurchaseBrandSummary.objects.filter(brand=brand).first()
+    if summary and not search_query:
+        total_count = summary.count_for(quick_filter)
+    else:
+        total_count = cached_local_purchase_count(paginator.queryset, brand, search_query, quick_filter)
+
+    context = _local_purchase_context(request, brand, page_obj, total_count)
+    context['summary'] = summary
+    return render(request, 'tracking/local_purchase_list.html', context)
+
+def _local_purchase_context(request, brand, page_obj, total_count):
+    return {
         'items': page_obj,
         'brand': brand,
-        'total_count': paginator.count,
-        'current_sort': sort_by,
-        'current_direction': direction,
+        'total_count': total_count,
+        'num_pages': max(1, -(-total_count // page_obj.per_page)),
+        'current_sort': request.GET.get('sort', 'item_code'),
+        'current_direction': request.GET.get('direction', 'asc'),
     }
 
-    # AJAX Handling: Return only the rows and pagination info
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        html = render_to_string('tracking/includes/local_purchase_rows.html', context, request=request)
-        pagination_html = render_to_string('tracking/includes/pagination_controls.html', context, request=request)
-        return JsonResponse({
-            'html': html, 
-            'pagination': pagination_html,
-            'total_count': paginator.count
-        })
-
-    return render(request, 'tracking/local_purchase_list.html', context)
+@login_required
+@admin_required
+def local_purchase_export(request):
+    """
+    The list view's rows (same search, filter and sort parameters, every page) as a
+    streamed CSV or XLSX download. Headers match the upload format, so an exported
+    sheet can be edited and uploaded again.
+    """
+    brand = request.GET.get('brand')
+    if not brand:
+        return redirect('local_purchase_dashboard')
+    export_format = 'csv' if request.GET.get('format') == 'csv' else 'xlsx'
+    paginator, _, _ = _local_purchase_rows(request, brand)
+
+    headers = [header for header, _, _ in LOCAL_PURCHASE_COLUMNS]
+    fields = [field for _, field, _ in LOCAL_PURCHASE_COLUMNS]
+    rows = paginator.ordered().values_list(*fields).iterator(chunk_size=exports.EXPORT_CHUNK_SIZE)
+    if export_format == 'csv':
+        response = StreamingHttpResponse(exports.for_request(request, exports.iter_csv(headers, rows)),
+                                         content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(
+            exports.for_request(request, exports.iter_xlsx([(brand, headers, rows)])),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    response['Content-Disposition'] = content_disposition_header(True, f'{brand} local purchase.{export_format}')
+    return response
 
 @login_required
 @admin_required
 def local_purchase_upload(request):
-    """View to upload multi-sheet Excel file."""
+    """View to upload multi-sheet Excel file. The import itself runs as a background job."""
     if request.method == 'POST' and request.FILES.get('excel_file'):
-        import os
         from django.core.files.storage import FileSystemStorage
         
         excel_file = request.FILES['excel_file']
         fs = FileSystemStorage()
         filename = fs.save(excel_file.name, excel_file)
-        file_path = fs.path(filename)
         
-        try:
-            with pd.ExcelFile(file_path) as xls:
-                sheet_names = xls.sheet_names
-                
-                # ALLOWED SHEETS WhiteList
-                ALLOWED_SHEETS = ['HEPWORTH', 'RAKTherm', 'VERA-PUMP', 'PEGLER', 'OTHERS']
-                
-                total_imported = 0
-                
-                for sheet_name in sheet_names:
-                    # Filter strictly by allowed names (case-insensitive check)
-                    # We check if the sheet name (upper) exists in our allowed list (upper)
-                    if sheet_name not in ALLOWED_SHEETS and sheet_name.upper() not in [s.upper() for s in ALLOWED_SHEETS]:
-                        continue
-                    
-                    df = pd.read_excel(xls, sheet_name=sheet_name)
-                    
-                    # Normalize headers: replace newlines and multiple spaces with single space
-                    import re
-                    df.columns = [re.sub(r'\s+', ' ', str(col)).strip() for col in df.columns]
-                    
-                    # Check column existence
-                    if 'CODE' not in df.columns:
-                        continue 
-                        
-                    # Delete existing for this brand (using the sheet name as brand)
-                    LocalPurchaseItem.objects.filter(brand=sheet_name).delete()
-                    
-                    items_to_create = []
-                    for _, row in df.iterrows():
-                        def get_val(col, default=0, type_func=int):
-                            val = row.get(col)
-                            if pd.isna(val) or val == '':
-                                return default
-                            try:
-                                # Handle string inputs like " - " or "N/A"
-                                if isinstance(val, str) and not val.replace('.', '', 1).isdigit():
-                                    return default
-                                return type_func(val)
-                            except:
-                                return default
-                        
-                        item = LocalPurchaseItem(
-                            brand=sheet_name,
-                            item_code=str(row.get('CODE', '')).strip(),
-                            upc_code=str(row.get('UPC CODE', '')) if not pd.isna(row.get('UPC CODE')) else '',
-                            description=str(row.get('DESCRIPTION', '')) if not pd.isna(row.get('DESCRIPTION')) else '',
-                            
-                            current_stock_ras=get_val('Current Stock RAS'),
-                            current_stock_dip=get_val('Current Stock DIP'),
-                            sold_qty_2024=get_val('Sold Qty 2024'),
-                            
-                            contg=get_val('CONTG.'),
-                            trdg=get_val('TRDG.'),
-                            stores=get_val('STORES'),
-                            
-                            total_sold_qty_2025=get_val('TOTAL Sold Qty 2025'),
-                            avg_15day_sales=get_val('Avg 15Day Sales HO 2025', 0.0, float),
-                            stock_sufficiency_months=get_val('STOCK Sufficiency Month', 0.0, float),
-                            lpo_given=get_val('LPO Given'),
-                            open_so_qty=get_val('OPEN SO QTY'),
-                            stock_reqt_calcn=get_val('STOCK Reqt Calcn'),
-                            stock_requirement=get_val('STOCK REQUIREMENT'),
-                            value=get_val('VALUE', 0.0, float),
-                            cost=get_val('COST', 0.0, float),
-                            ho_per_lpo_qty=get_val('HO PER LPO QTY', 0.0, float),
-                            stock_reqt_ras_stores=get_val('Stock Reqt RAS/ Stores', 0.0, float),
-                        )
-                        items_to_create.append(item)
-                        
-                    LocalPurchaseItem.objects.bulk_create(items_to_create)
-                    total_imported += len(items_to_create)
-            
-            messages.success(request, f"Successfully imported {total_imported} items from {len(sheet_names)} sheets.")
-            
-        except Exception as e:
-            messages.error(request, f"Error processing file: {str(e)}")
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                
+        # The worker deletes the file once the import finishes
+        jobs.enqueue('LOCAL_PURCHASE_UPLOAD', user=request.user, file_path=fs.path(filename))
+        messages.success(request, f"{excel_file.name} uploaded. The import is running in the background.")
         return redirect('local_purchase_dashboard')
         
     return render(request, 'tracking/local_purchase_upload.html')